@@ -1,5 +1,5 @@
 from crewai import Agent, Task, Crew, LLM, Process
-from llama_index.llms.ollama import Ollama
+from rag.llm_gateway import GatewayLLM
 from .retrieval_tool import ContextualRetrievalTool
 
 class RetrievalAgent:
@@ -17,19 +17,7 @@ class RetrievalAgent:
         # )
 
         # LLM config
-        self.agent_llm = Ollama(
-            # model="llama3.1:8b",
-            model="llama3.2:1b",
-            base_url="http://localhost:11434",
-            # base_url="http://13.212.147.243:11434",
-            request_timeout=120.0,
-            # LlamaIndex passes these to Ollama under "options"
-            additional_kwargs={"options": {
-                "num_ctx": 1024,       # try 2048–4096
-                "num_batch": 4,       # optional: reduce if still tight
-                # "num_gpu": 0,        # if CPU-only, make explicit
-            }}
-        )
+        self.agent_llm = GatewayLLM()  # OLLAMA_* settings, shared gateway
 
         # Agent definition
         self.agent = Agent(
@@ -1,20 +1,47 @@
-from crewai import Agent, Task, Crew, LLM, Process
+from crewai import Agent, Task, Crew, Process
+from crewai.llms.base_llm import BaseLLM
 from tools.retrieval_tool import ContextualRetrievalTool
+from rag.concurrency import run_sync
+from rag.llm_gateway import default_options, get_gateway
+from rag.settings import OLLAMA_KEEP_ALIVE, OLLAMA_MODEL, OLLAMA_NUM_CTX
+
+class GatewayCrewLLM(BaseLLM):
+    """CrewAI LLM that sends chat calls through the shared Ollama gateway (ReAct-style tool use)."""
+
+    def __init__(self, model: str = OLLAMA_MODEL, temperature: float = 0.2, stop=None):
+        super().__init__(model=model, temperature=temperature)
+        self.stop = stop or []
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs) -> str:
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        options = default_options(temperature=self.temperature)
+        if self.stop:
+            options["stop"] = list(self.stop)
+        raw = get_gateway().post("/api/chat", {
+            "model": self.model,
+            "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": options,
+        })
+        return raw.get("message", {}).get("content", "")
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return True
+
+    def get_context_window_size(self) -> int:
+        return OLLAMA_NUM_CTX
 
 class RetrievalAgent:
-    def __init__(self, query_engine):
+    def __init__(self, query_engine, engine_factory=None):
         # Initialize retrieval tool
         self.retrieval_tool = ContextualRetrievalTool()
-        self.retrieval_tool.set_query_engine(query_engine, return_sources_cap=3)
-
-        self.agent_llm = LLM(
-            model="ollama/llama3.2:1b",
-            base_url="http://localhost:11434",
-            api_base="http://localhost:11434",
-            api_key="NA",
-            temperature=0.2,
-            timeout=120,
-        )
+        self.retrieval_tool.set_query_engine(query_engine, return_sources_cap=3, engine_factory=engine_factory)
+
+        self.agent_llm = GatewayCrewLLM(temperature=0.2)
 
         # Agent definition
         self.agent = Agent(
@@ -77,3 +104,7 @@ class RetrievalAgent:
         # 3) Last resort
         return str(out)
 
+    async def aexecute(self, question: str, top_k: int = 3, return_sources: int = 2) -> str:
+        """Async wrapper: CrewAI is sync, so the crew runs on the bounded worker pool."""
+        return await run_sync(self.execute, question, top_k=top_k, return_sources=return_sources)
+
@@ -0,0 +1,144 @@
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Deterministic filler: the answer text doesn't matter, only its length and pace
+WORDS = (
+    "the procurement policy requires approval from the relevant authority before any "
+    "purchase order is issued and all suppliers must be registered in the system"
+).split()
+
+
+class FakeOllama:
+    """Stand-in for the Ollama HTTP API (/api/tags, /api/generate, /api/chat).
+
+    Prefill costs `prompt_tokens / prefill_rate` seconds (prompt tokens ≈ chars / 4), then
+    `tokens` tokens come out at `token_rate` per second. Like OLLAMA_NUM_PARALLEL, only
+    `parallel` requests generate at once; the rest wait for a slot.
+    """
+
+    def __init__(self, model="llama3.2", token_rate=30.0, tokens=128, prefill_rate=500.0, parallel=4):
+        self.model = model
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.prefill_rate = prefill_rate
+        self.slots = threading.Semaphore(parallel)
+        self.requests = 0
+        self._server = None
+
+    def prompt_tokens(self, payload: dict) -> int:
+        text = payload.get("prompt") or "".join(m.get("content", "") for m in payload.get("messages", []))
+        return max(len(text) // 4, 1)
+
+    def token_text(self, i: int) -> str:
+        return ("" if i == 0 else " ") + WORDS[i % len(WORDS)]
+
+    def chunk(self, path: str, text: str, done: bool, **extra) -> dict:
+        body = {"model": self.model, "created_at": datetime.now(timezone.utc).isoformat(), "done": done, **extra}
+        if path == "/api/chat":
+            body["message"] = {"role": "assistant", "content": text}
+        else:
+            body["response"] = text
+        return body
+
+    def generate(self, path: str, payload: dict):
+        """Yield response chunks at the configured pace (the last one has done=True)."""
+        self.requests += 1
+        if not payload.get("prompt") and not payload.get("messages"):
+            yield self.chunk(path, "", True, done_reason="load")  # warmup / keep_alive ping
+            return
+        prompt_tokens = self.prompt_tokens(payload)
+        with self.slots:
+            started = time.perf_counter()
+            time.sleep(prompt_tokens / self.prefill_rate)
+            for i in range(self.tokens):
+                time.sleep(1 / self.token_rate)
+                yield self.chunk(path, self.token_text(i), False)
+            elapsed_ns = int((time.perf_counter() - started) * 1e9)
+        yield self.chunk(
+            path, "", True, done_reason="stop", total_duration=elapsed_ns,
+            prompt_eval_count=prompt_tokens, eval_count=self.tokens,
+        )
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, body: dict, status: int = 200):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self.send_json({"models": [{"name": fake.model, "model": fake.model}]})
+                else:
+                    self.send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self.path not in ("/api/generate", "/api/chat"):
+                    self.send_json({"error": "not found"}, 404)
+                    return
+                chunks = fake.generate(self.path, payload)
+                if not payload.get("stream", True):
+                    text = ""
+                    for chunk in chunks:
+                        text += chunk.get("response", chunk.get("message", {}).get("content", ""))
+                    self.send_json({**chunk, **fake.chunk(self.path, text, True)})
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    line = json.dumps(chunk).encode("utf-8") + b"\n"
+                    self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve on a background thread; returns the base URL (port 0 picks a free one)."""
+        self._server = ThreadingHTTPServer((host, port), self.handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama server with a configurable token rate")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--token-rate", type=float, default=30.0, help="generated tokens per second")
+    parser.add_argument("--tokens", type=int, default=128, help="tokens per answer")
+    parser.add_argument("--prefill-rate", type=float, default=500.0, help="prompt tokens per second")
+    parser.add_argument("--parallel", type=int, default=4, help="requests generating at once")
+    args = parser.parse_args()
+
+    fake = FakeOllama(args.model, args.token_rate, args.tokens, args.prefill_rate, args.parallel)
+    url = fake.start(args.host, args.port)
+    print(f"🦙 Fake Ollama on {url} ({args.token_rate} tok/s, {args.tokens} tokens, {args.parallel} parallel)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
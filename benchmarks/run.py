@@ -0,0 +1,299 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+# Compared against --baseline: a level regresses if any of these gets worse by more than --tolerance
+WATCHED = (("latency_ms", "p95"), ("ttft_ms", "p95"), ("requests_per_s", None))
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0..100); None for no values."""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return round(values[lo] + (values[hi] - values[lo]) * (pos - lo), 2)
+
+
+def summarize(values) -> dict:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": round(sum(values) / len(values), 2) if values else None,
+        "count": len(values),
+    }
+
+
+def git_version() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_questions(pattern: str) -> list:
+    from ragas_local.runner import load_eval_items
+
+    return [item["question"] for item in load_eval_items(pattern)]
+
+
+def seed(docs_dir: str):
+    """Rebuild the benchmark table from `docs_dir` with the hash embedder (no manifest)."""
+    from rag import ann_index
+    from rag.db import connection
+    from rag.hybrid import ensure_text_search
+    from rag.ingestion import IngestionEngine
+    from rag.settings import VECTOR_TABLE
+
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS data_{VECTOR_TABLE}")
+    files = [os.path.join(docs_dir, f) for f in sorted(os.listdir(docs_dir)) if os.path.isfile(os.path.join(docs_dir, f))]
+    report = IngestionEngine().ingest_files(files)
+    ann_index.ensure_index()
+    ensure_text_search()
+    return report
+
+
+def start_server(args, env: dict) -> subprocess.Popen:
+    if args.workers > 1:
+        cmd = [sys.executable, "-m", "scripts.serve", "--workers", str(args.workers),
+               "--host", "127.0.0.1", "--port", str(args.port)]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port)]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env)
+
+
+async def wait_ready(base_url: str, server: subprocess.Popen, timeout: float) -> dict:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with code {server.returncode}")
+            try:
+                resp = await client.get("/health/ready")
+                body = resp.json()
+                if resp.status_code == 200:
+                    return body
+                if body.get("error"):
+                    raise RuntimeError(f"server failed to start:\n{body['error']}")
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"server not ready within {timeout}s")
+
+
+async def one_request(client: httpx.AsyncClient, question: str, model: str, stream: bool) -> dict:
+    """Client-side latency and TTFT plus the server's per-stage timings for one completion."""
+    body = {"model": model, "stream": stream, "messages": [{"role": "user", "content": question}]}
+    started = time.perf_counter()
+    result = {"status": None, "ttft_ms": None, "timings": {}}
+    if stream:
+        async with client.stream("POST", "/v1/chat/completions", json=body) as resp:
+            result["status"] = resp.status_code
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: ") or line == "data: [DONE]":
+                    continue
+                chunk = json.loads(line[6:])
+                if result["ttft_ms"] is None and chunk["choices"][0]["delta"].get("content"):
+                    result["ttft_ms"] = (time.perf_counter() - started) * 1000
+                result["timings"] = chunk.get("timings", result["timings"])
+    else:
+        resp = await client.post("/v1/chat/completions", json=body)
+        result["status"] = resp.status_code
+        if resp.status_code == 200:
+            result["timings"] = resp.json().get("timings", {})
+    result["latency_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+async def run_level(base_url: str, questions: list, concurrency: int, total: int, model: str, stream: bool,
+                    timeout: float) -> dict:
+    """`total` requests from `concurrency` concurrent clients, cycling through `questions`."""
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(questions[i % len(questions)])
+    results = []
+
+    async def client_loop(client):
+        while not queue.empty():
+            question = queue.get_nowait()
+            try:
+                results.append(await one_request(client, question, model, stream))
+            except httpx.HTTPError as e:
+                results.append({"status": None, "error": repr(e)})
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r["status"] == 200]
+    stages = {}
+    for r in ok:
+        for stage, ms in r["timings"].items():
+            stages.setdefault(stage, []).append(ms)
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(ok),
+        "rejected": sum(r["status"] == 503 for r in results),
+        "errors": sum(r["status"] not in (200, 503) for r in results),
+        "elapsed_s": round(elapsed, 2),
+        "requests_per_s": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize([r["latency_ms"] for r in ok]),
+        "ttft_ms": summarize([r["ttft_ms"] for r in ok if r["ttft_ms"] is not None]),
+        "stages_ms": {
+            stage: {**summarize(values), "per_s": round(len(values) / elapsed, 2) if elapsed else 0.0}
+            for stage, values in sorted(stages.items())
+        },
+    }
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list:
+    """Regressions of `current` against `baseline`, matched by concurrency level."""
+    before = {level["concurrency"]: level for level in baseline["levels"]}
+    regressions = []
+    for level in current["levels"]:
+        old = before.get(level["concurrency"])
+        if old is None:
+            continue
+        for metric, stat in WATCHED:
+            was = old[metric][stat] if stat else old[metric]
+            now = level[metric][stat] if stat else level[metric]
+            if not was or now is None:
+                continue
+            change = (now - was) / was
+            # Throughput regresses when it drops, latencies when they grow
+            if (-change if metric == "requests_per_s" else change) > tolerance:
+                regressions.append(
+                    f"c={level['concurrency']} {metric}{'.' + stat if stat else ''}: {was} → {now} ({change:+.0%})"
+                )
+    return regressions
+
+
+async def main(args) -> int:
+    fake = FakeOllama(args.llm_model, args.token_rate, args.tokens, args.prefill_rate, args.ollama_parallel)
+    ollama_url = fake.start()
+    cache_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    # Set before anything imports rag.settings (load_dotenv doesn't override these)
+    os.environ.update({
+        "OLLAMA_BASE_URL": ollama_url,
+        "OLLAMA_BASE_URLS": ollama_url,
+        "OLLAMA_MODEL": args.llm_model,
+        "OLLAMA_NUM_PARALLEL": str(args.ollama_parallel),
+        "EMBED_BACKEND": "hash",
+        "VECTOR_TABLE": args.table,
+        "CACHE_DIR": cache_dir,
+        "ANSWER_CACHE_ENABLED": str(args.answer_cache).lower(),
+        "RERANKER": args.reranker,
+        "CHUNK_CONTEXT_MODE": "template",
+        "TRACING_BACKEND": "none",
+    })
+    print(f"🦙 Fake Ollama on {ollama_url}, caches in {cache_dir}")
+
+    seed_report = None
+    if args.seed:
+        print(f"🌱 Seeding {args.table} from {args.docs}")
+        seed_report = seed(args.docs)
+    questions = load_questions(args.questions)
+    if not questions:
+        raise SystemExit(f"No eval questions match {args.questions}")
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = start_server(args, dict(os.environ))
+    try:
+        startup = await wait_ready(base_url, server, args.startup_timeout)
+        print(f"✅ Server ready: {json.dumps(startup['steps_ms'])}")
+        levels = []
+        for concurrency in args.concurrency:
+            total = args.requests or max(len(questions), concurrency * 4)
+            level = await run_level(base_url, questions, concurrency, total, args.model, not args.no_stream,
+                                    args.request_timeout)
+            levels.append(level)
+            print(
+                f"📊 c={concurrency}: {level['requests_per_s']} req/s, "
+                f"p50 {level['latency_ms']['p50']} ms, p95 {level['latency_ms']['p95']} ms, "
+                f"ttft p95 {level['ttft_ms']['p95']} ms, {level['rejected']} rejected, {level['errors']} errors"
+            )
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            llm_stats = (await client.get("/api/llm/stats")).json()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        fake.stop()
+
+    result = {
+        "version": git_version(),
+        "label": args.label,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "output")},
+        "startup_ms": startup["steps_ms"],
+        "seed": seed_report,
+        "llm": llm_stats,
+        "levels": levels,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{args.label or result['version']}.json"
+    path = os.path.join(args.output, name)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"💾 Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), result, args.tolerance)
+        for line in regressions:
+            print(f"⚠️ Regression {line}")
+        if regressions:
+            return 1
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test /v1/chat/completions against local stand-ins")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 4, 16],
+                        help="comma-separated concurrency levels, run in order")
+    parser.add_argument("--requests", type=int, default=0, help="requests per level (default: max(questions, 4×c))")
+    parser.add_argument("--model", default="contextual-rag-direct", help="model id sent to the API")
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument("--questions", default=os.path.join(ROOT, "eval_dataset", "*.json"))
+    parser.add_argument("--docs", default=os.path.join(ROOT, "rag_documents"))
+    parser.add_argument("--table", default="bench_rag_docs", help="VECTOR_TABLE for the benchmark corpus")
+    parser.add_argument("--no-seed", dest="seed", action="store_false", help="reuse the existing benchmark table")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on (off by default)")
+    parser.add_argument("--reranker", default="none", help="RERANKER for the server (none, local, cohere)")
+    parser.add_argument("--workers", type=int, default=1, help=">1 serves through scripts/serve.py")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-model", default="llama3.2")
+    parser.add_argument("--token-rate", type=float, default=30.0, help="fake Ollama tokens per second")
+    parser.add_argument("--tokens", type=int, default=128, help="fake Ollama tokens per answer")
+    parser.add_argument("--prefill-rate", type=float, default=500.0, help="fake Ollama prompt tokens per second")
+    parser.add_argument("--ollama-parallel", type=int, default=4, help="fake Ollama concurrent generations")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--request-timeout", type=float, default=300.0)
+    parser.add_argument("--label", default="", help="name for this run (defaults to git describe)")
+    parser.add_argument("--output", default=RESULTS_DIR)
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    sys.exit(asyncio.run(main(parser.parse_args())))
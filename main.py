@@ -1,24 +1,42 @@
 import os
 import time
 import json
+import uuid
 import asyncio
 import logging
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Response
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 
 from models.body import ChatRequest
 from dotenv import load_dotenv
 
-from scripts.ingest import get_query_engine
-from agents.retrieval_agent import RetrievalAgent
-from ragas_local.eval_local import execute_eval
-
-from openinference.instrumentation.llama_index import LlamaIndexInstrumentor
-from arize.otel import register
-from getpass import getpass
+from scripts.ingest import candidate_depth, get_index, get_node_postprocessors, get_query_engine
+from ragas_local import runner as eval_runner
+from rag.concurrency import QueueFullError, RequestLimiter, run_sync, shutdown_executor
+from rag.pipeline import PIPELINE_MODELS, DirectPipeline, StageTimer, format_sources
+from rag.answer_cache import build_answer_cache
+from rag.batch import checkpoint_path, claim, parse_items, run_batch
+from rag.db import close_pools, ping, pool_stats
+from rag.embed_batcher import batch_stats
+from rag.hybrid import build_retriever
+from rag.llm_gateway import get_gateway
+from rag.sessions import SessionStore, is_follow_up, rewrite_question
+from rag.settings import (
+    ANSWER_CACHE_ENABLED,
+    PIPELINE_MODE,
+    SESSIONS_ENABLED,
+    VECTOR_BACKEND,
+    Settings,
+    init_vector_store,
+)
+from rag import metrics
+from rag.telemetry import init_tracing
+from rag.warmup import Readiness, warm_up
 
 logging.basicConfig(level=logging.DEBUG)
 logging.getLogger("llama_index").setLevel(logging.DEBUG)
@@ -42,89 +60,443 @@ app.add_middleware(
 # with tracer.start_as_current_span("hello-phoenix"):
 #     pass
 
+index = None
 query_engine = None
+direct_pipeline = None
 retrieval_agent = None
+agent_lock = asyncio.Lock()
+readiness = Readiness()
+request_limiter = RequestLimiter()
+answer_cache = build_answer_cache() if ANSWER_CACHE_ENABLED else None
+sessions = SessionStore() if SESSIONS_ENABLED else None
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    # Backpressure: tell the client to retry instead of piling up on the event loop
+    metrics.REJECTED.inc()
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server busy: {exc}"},
+        headers={"Retry-After": "1"},
+    )
 
 @app.on_event("startup")
 async def startup_event():
-    # Setup OTEL via our convenience function
-    tracer_provider = register(
-        space_id=getpass("Enter your Arize Space ID: "),
-        api_key=getpass("Enter your Arize API Key: "),
-        project_name="llamaindex-contextual-rag-tracing",
-    )
+    # Optional span export, configured from the environment (TRACING_BACKEND)
+    init_tracing()
+    # Models load in the background: the server accepts connections immediately and
+    # /health/ready flips once the pipeline is built and warm
+    app.state.startup_task = asyncio.create_task(build_pipeline())
+    print("✅ FastAPI startup complete: loading models in the background.")
+
+async def build_pipeline():
+    global index, query_engine, direct_pipeline
+    cohere_api_key = os.getenv("COHERE_API_KEY")
+    try:
+        with readiness.timer.stage("index"):
+            index = await run_sync(get_index)  # embedder (ONNX) + vector store
+        with readiness.timer.stage("reranker"):
+            node_postprocessors = await run_sync(get_node_postprocessors, cohere_api_key)
+        query_engine = get_query_engine(cohere_api_key=cohere_api_key, index=index)
+        register_metrics(node_postprocessors)
+        await warm_up(readiness, Settings.embed_model, node_postprocessors)
+        direct_pipeline = DirectPipeline(
+            build_retriever(index, similarity_top_k=candidate_depth(node_postprocessors)),
+            node_postprocessors=node_postprocessors,
+            llm=Settings.llm,
+            embed_model=Settings.embed_model,
+            sessions=sessions,
+        )
+        router = getattr(direct_pipeline.retriever, "router", None)
+        if router is not None:
+            metrics.register_gauges("corpus_routes", router.stats)
+        readiness.timer.mark("ready")
+        readiness.ready = True
+        print(f"✅ Pipeline ready: {readiness.timer.as_dict()}")
+    except Exception:
+        readiness.fail()
 
-    # Finish automatic instrumentation
-    LlamaIndexInstrumentor().instrument(
-        tracer_provider=tracer_provider, skip_dep_check=True
+def require_ready():
+    if not readiness.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Startup failed, see /health/ready" if readiness.error else "Warming up",
+            headers={"Retry-After": "2"},
+        )
+
+async def get_retrieval_agent():
+    """CrewAI (and everything it imports) is only loaded once agent mode is actually used."""
+    global retrieval_agent
+    async with agent_lock:
+        if retrieval_agent is None:
+            retrieval_agent = await run_sync(build_retrieval_agent)
+    return retrieval_agent
+
+def build_retrieval_agent():
+    from agents.retrieval_agent import RetrievalAgent
+
+    cohere_api_key = os.getenv("COHERE_API_KEY")
+    return RetrievalAgent(
+        query_engine,
+        engine_factory=lambda top_k: get_query_engine(cohere_api_key=cohere_api_key, index=index, top_k=top_k),
     )
 
-    global query_engine, retrieval_agent
-    query_engine = get_query_engine(cohere_api_key=os.getenv("COHERE_API_KEY"))
-    retrieval_agent = RetrievalAgent(query_engine)
-    print("✅ FastAPI startup complete: query engine ready.")
+def register_metrics(node_postprocessors):
+    metrics.register_queue("pipeline", request_limiter.stats)
+    if answer_cache is not None:
+        metrics.register_cache("answer", answer_cache.stats)
+    if hasattr(Settings.embed_model, "stats"):
+        metrics.register_cache("embedding", Settings.embed_model.stats)
+    metrics.register_gauges("embed_microbatch", lambda: batch_stats(Settings.embed_model))
+    metrics.register_gauges("llm_gateway", get_gateway().stats)
+    if sessions is not None:
+        metrics.register_gauges("sessions", sessions.stats)
+    if VECTOR_BACKEND == "numpy":
+        metrics.register_gauges("vector_store", init_vector_store().stats)
+    for postprocessor in node_postprocessors or []:
+        if postprocessor.class_name() == "LocalCrossEncoderRerank":
+            metrics.register_cache("rerank", lambda p=postprocessor: {
+                "hits": p.stats()["score_cache_hits"], "misses": p.stats()["score_cache_misses"],
+            })
+        elif postprocessor.class_name() == "ContextPacker":
+            metrics.register_gauges("context_packing", postprocessor.stats)
 
 
-@app.post("/v1/chat/completions")
-async def ask_question(chat_req: ChatRequest):
-    if retrieval_agent is None:
-        raise HTTPException(status_code=500, detail="Retrieval agent not initialized.")
+@app.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def health_ready():
+    status = readiness.status()
+    return JSONResponse(status_code=200 if readiness.ready else 503, content=status)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_executor()
+    await close_pools()
 
-    user_message = chat_req.messages[-1].content
 
-    # ✅ Run the agent/crew pipeline
-    assistant_reply = retrieval_agent.execute(
-        question=user_message,
-        top_k=3,
-        return_sources=2
+def resolve_mode(chat_req: ChatRequest) -> str:
+    return chat_req.mode or PIPELINE_MODELS.get(chat_req.model) or PIPELINE_MODE
+
+def resolve_conversation(chat_req: ChatRequest, request: Request):
+    """(question to answer, session or None, whether it is a follow-up). Follow-ups are
+    rewritten to stand on their own from the earlier user turns the client sent along; that
+    needs no session. Retrieval state is only kept for an explicit conversation id, so
+    unrelated users asking the same first question never share one."""
+    question = chat_req.messages[-1].content
+    if sessions is None:
+        return question, None, False
+    history = [m.content for m in chat_req.messages[:-1] if m.role == "user"]
+    follow_up = bool(history) and is_follow_up(question)
+    standalone = rewrite_question(question, history)
+    if standalone != question:
+        sessions.count_rewrite()
+    session_id = (
+        chat_req.conversation_id
+        or request.headers.get("x-conversation-id")
+        or request.headers.get("x-openwebui-chat-id")
     )
-    # keep your existing “simulated streaming”
-    return StreamingResponse(event_stream(assistant_reply, chat_req), media_type="text/event-stream")
+    return standalone, sessions.get(session_id) if session_id else None, follow_up
+
+@app.post("/v1/chat/completions")
+async def ask_question(chat_req: ChatRequest, request: Request):
+    require_ready()
+
+    user_message, session, follow_up = resolve_conversation(chat_req, request)
+    mode = resolve_mode(chat_req)
+    timer = StageTimer()
+
+    with timer.stage("cache_lookup"):
+        cached, query_embedding = await lookup_answer(user_message, mode)
+    if cached is not None:
+        if chat_req.stream:
+            return StreamingResponse(
+                event_stream(
+                    single_token(cached.answer), chat_req, source_nodes=cached.source_nodes, timer=timer,
+                    mode=mode, cache="hit",
+                ),
+                media_type="text/event-stream",
+            )
+        record_request(timer, mode, stream=False, cache="hit")
+        return completion_response(with_sources(cached.answer, cached.source_nodes), chat_req, timer=timer)
+
+    if mode == "agent":
+        # Opt-in CrewAI path: the agent plans a tool call, so several LLM round trips
+        agent = await get_retrieval_agent()
+        async with request_limiter:
+            with timer.stage("agent"):
+                assistant_reply = await agent.aexecute(
+                    question=user_message,
+                    top_k=3,
+                    return_sources=2
+                )
+        await remember_answer(user_message, assistant_reply, None, query_embedding, mode)
+        record_request(timer, mode, stream=chat_req.stream, cache="miss", answer=assistant_reply, generation_stage="agent")
+        if chat_req.stream:
+            return StreamingResponse(
+                event_stream(single_token(assistant_reply), chat_req, timer=timer),
+                media_type="text/event-stream",
+            )
+        return completion_response(assistant_reply, chat_req, timer=timer)
+
+    if chat_req.stream:
+        # Stream tokens straight from Ollama: retrieval + streaming synthesis.
+        # The limiter slot is held until the stream finishes (or the client leaves). A client
+        # that leaves before the first chunk never runs the generator's cleanup, so the
+        # response's background task releases the slot too (whichever comes first).
+        await request_limiter.acquire()
+        release = request_limiter.releaser()
+        try:
+            response = await direct_pipeline.astream(user_message, timer, query_embedding, session, follow_up)
+        except BaseException:
+            release()
+            raise
+        return StreamingResponse(
+            event_stream(
+                iter_tokens(response),
+                chat_req,
+                source_nodes=getattr(response, "source_nodes", None),
+                timer=timer,
+                mode=mode,
+                on_close=release,
+                on_complete=lambda text: remember_answer(
+                    user_message, text, getattr(response, "source_nodes", None), query_embedding, mode
+                ),
+            ),
+            media_type="text/event-stream",
+            background=BackgroundTask(release),
+        )
+
+    async with request_limiter:
+        response = await direct_pipeline.arun(user_message, timer, query_embedding, session, follow_up)
+    source_nodes = getattr(response, "source_nodes", None)
+    await remember_answer(user_message, str(response), source_nodes, query_embedding, mode)
+    record_request(timer, mode, stream=False, cache="miss", answer=str(response), generation_stage="synthesize")
+    return completion_response(with_sources(str(response), source_nodes), chat_req, timer=timer)
+
+@app.post("/v1/batch")
+async def batch_questions(request: Request, run_id: Optional[str] = None, synthesize: bool = True):
+    """Bulk questions as JSONL in, one JSONL result row per question out, as each finishes.
+
+    Every row carries the item's id, the answer (unless `synthesize=false`), its top sources and
+    per-stage timings. With `run_id`, rows are checkpointed server-side: repeating the request
+    replays finished rows and only answers the rest. Searches and LLM calls of all batches share
+    one process-wide budget (BATCH_SEARCH_CONCURRENCY / BATCH_LLM_CONCURRENCY).
+    """
+    require_ready()
+    try:
+        items = parse_items((await request.body()).decode("utf-8").splitlines())
+        checkpoint = checkpoint_path(run_id) if run_id else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    release = None
+    if checkpoint:
+        # Claimed now, before the 200 goes out: a concurrent run gets a 409, not an error mid-stream
+        try:
+            release = claim(checkpoint)
+        except RuntimeError:
+            raise HTTPException(status_code=409, detail=f"Batch run {run_id} is already in progress")
+    rows = run_batch(direct_pipeline, items, Settings.embed_model, checkpoint=checkpoint, synthesize=synthesize,
+                     release=release)
+    # The background task frees the checkpoint even if the stream is never started
+    return StreamingResponse((json.dumps(row) + "\n" async for row in rows), media_type="application/x-ndjson",
+                             background=BackgroundTask(release) if release else None)
+
+async def lookup_answer(question: str, mode: str):
+    """Exact, then semantic cache lookup. Returns (hit or None, query embedding or None)."""
+    if answer_cache is None:
+        return None, None
+    # With several workers the cache is remote: every call is a socket round trip
+    cached = await run_sync(answer_cache.get_exact, question, mode)
+    if cached is not None:
+        return cached, None
+    embedding = await run_sync(Settings.embed_model.get_query_embedding, question)
+    return await run_sync(answer_cache.get_similar, embedding, mode), embedding
+
+async def remember_answer(question: str, answer: str, source_nodes, embedding, mode: str):
+    if answer_cache is not None and answer.strip():
+        await run_sync(answer_cache.put, question, answer, source_nodes, embedding, mode)
+
+def record_request(timer: StageTimer, mode: str, stream: bool, cache: str,
+                   answer: str = None, generation_stage: str = None, tokens: int = None):
+    """Stage histograms + request/token counters. Tokens are counted from the stream when
+    streaming, otherwise estimated with the LlamaIndex tokenizer over the answer text."""
+    timings = timer.as_dict()
+    metrics.observe_timer(timings)
+    metrics.REQUESTS.labels(mode=mode, stream=str(stream).lower(), cache=cache).inc()
+    if tokens is None and answer:
+        tokens = len(Settings.tokenizer(answer))
+    if tokens and generation_stage in timings:
+        metrics.observe_generation(mode, tokens, timings[generation_stage] / 1000)
+
+def with_sources(answer: str, source_nodes) -> str:
+    sources = format_sources(source_nodes, k=2)
+    return f"{answer}\n\n{sources}" if sources else answer
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Gauge callbacks may call the model service (remote embedder / cache stats): off the loop
+    return Response(content=await run_sync(metrics.render), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/db/stats")
+async def db_stats():
+    if VECTOR_BACKEND == "numpy":
+        return {"healthy": True, **init_vector_store().stats()}
+    return {"healthy": await ping(), **pool_stats()}
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    return get_gateway().status()
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return await run_sync(answer_cache.stats) if answer_cache is not None else {"enabled": False}
+
+def eval_retrieve(question: str):
+    """Retrieval + rerank through the direct pipeline, without synthesis."""
+    return direct_pipeline.aretrieve(question, StageTimer())
+
+class EvalJobRequest(BaseModel):
+    run_id: Optional[str] = None
+    fresh: bool = False
+    score: bool = True
+
+@app.post("/api/ragas/jobs", status_code=202)
+async def start_ragas_job(req: EvalJobRequest):
+    require_ready()
+    try:
+        job = eval_runner.start_job(eval_retrieve, run_id=req.run_id, fresh=req.fresh, score=req.score)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.status()
+
+@app.get("/api/ragas/jobs")
+async def ragas_jobs():
+    return eval_runner.list_jobs()
+
+@app.get("/api/ragas/jobs/{run_id}")
+async def ragas_job(run_id: str):
+    job = eval_runner.get_job(run_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown eval job: {run_id}")
+    return job.status()
 
 @app.get("/api/ragas")
 async def get_ragas():
-    result = execute_eval(query_engine)  # get your EvaluationResult
-
-    # Try to get a dict from result
-    if hasattr(result, "dict"):
-        json_ready = result.dict()
-    elif hasattr(result, "__dict__"):
-        json_ready = result.__dict__
-    else:
-        json_ready = result  # fallback, if already a dict
-
-    # Serialize, allowing NaN and Infinity
-    json_str = json.dumps(json_ready, allow_nan=True)
-    return Response(content=json_str, media_type="application/json")
-
-async def event_stream(assistant_reply: str, chat_req: ChatRequest):
-    tokens = assistant_reply.splitlines(keepends=True)
-    for token in tokens:
-        chunk = {
-            "id": "chatcmpl-123",
-            "object": "chat.completion.chunk",
-            "created": int(time.time()),
-            "model": chat_req.model,
-            "choices": [{"delta": {"content": token + " "}, "index": 0, "finish_reason": None}],
-        }
-        yield f"data: {json.dumps(chunk)}\n\n"
-        await asyncio.sleep(0.05)
-
-    final_chunk = {
-        "id": "chatcmpl-123",
+    """Kept for existing callers: status of the latest eval job. Start one with POST /api/ragas/jobs."""
+    job = eval_runner.latest_job()
+    if job is None:
+        raise HTTPException(status_code=404, detail="No eval job yet: start one with POST /api/ragas/jobs")
+    return job.status()
+
+def new_completion_id() -> str:
+    return f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+def completion_chunk(completion_id: str, model: str, delta: dict, finish_reason=None, **extra) -> str:
+    chunk = {
+        "id": completion_id,
         "object": "chat.completion.chunk",
         "created": int(time.time()),
+        "model": model,
+        "choices": [{"delta": delta, "index": 0, "finish_reason": finish_reason}],
+        **extra,
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+def completion_response(content: str, chat_req: ChatRequest, timer: StageTimer = None) -> dict:
+    body = {
+        "id": new_completion_id(),
+        "object": "chat.completion",
+        "created": int(time.time()),
         "model": chat_req.model,
-        "choices": [{"delta": {}, "index": 0, "finish_reason": "stop"}],
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
     }
-    yield f"data: {json.dumps(final_chunk)}\n\n"
-    yield "data: [DONE]\n\n"
+    if timer is not None:
+        body["timings"] = timer.as_dict()
+    return body
+
+async def single_token(text: str):
+    yield text
+
+async def iter_tokens(response):
+    """Yield text deltas from an (async) streaming LlamaIndex response."""
+    if hasattr(response, "async_response_gen"):
+        async for token in response.async_response_gen():
+            yield token
+        return
+
+    gen = getattr(response, "response_gen", None)
+    if gen is None:
+        yield str(response)
+        return
+    # Sync generator: pull each token on the worker pool so the loop stays free
+    done = object()
+    while (token := await run_sync(next, gen, done)) is not done:
+        yield token
+
+async def event_stream(
+    tokens,
+    chat_req: ChatRequest,
+    source_nodes=None,
+    timer: StageTimer = None,
+    mode: str = None,
+    cache: str = "miss",
+    on_close=None,
+    on_complete=None,
+):
+    """OpenAI-style SSE chunks. With `mode` set, the request is recorded in /metrics when the
+    stream completes (one Ollama stream delta ≈ one token)."""
+    completion_id = new_completion_id()
+    parts = []
+    try:
+        yield completion_chunk(completion_id, chat_req.model, {"role": "assistant"})
+        first_token_at = None
+        async for token in tokens:
+            if not token:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                if timer is not None:
+                    timer.mark("ttft")
+            parts.append(token)
+            yield completion_chunk(completion_id, chat_req.model, {"content": token})
+        if first_token_at is not None and timer is not None:
+            timer.timings["generate"] = round((time.perf_counter() - first_token_at) * 1000, 2)
+
+        # Retrieved sources go out as the last content chunk
+        sources = format_sources(source_nodes, k=2)
+        if sources:
+            yield completion_chunk(completion_id, chat_req.model, {"content": "\n\n" + sources})
+
+        extra = {"timings": timer.as_dict()} if timer is not None else {}
+        yield completion_chunk(completion_id, chat_req.model, {}, finish_reason="stop", **extra)
+        yield "data: [DONE]\n\n"
+        if mode is not None and timer is not None:
+            record_request(
+                timer, mode, stream=True, cache=cache,
+                generation_stage="generate" if cache == "miss" else None, tokens=len(parts),
+            )
+        if on_complete is not None:
+            await on_complete("".join(parts))
+    finally:
+        if on_close is not None:
+            on_close()
 
 @app.get("/v1/models")
 async def list_models():
     return {
         "data": [
-            {"id": "my-fastapi-model", "object": "model", "owned_by": "fastapi-backend"}
+            {"id": "my-fastapi-model", "object": "model", "owned_by": "fastapi-backend"},
+            *[
+                {"id": model_id, "object": "model", "owned_by": "fastapi-backend"}
+                for model_id in PIPELINE_MODELS
+            ],
         ]
     }
 
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional
 
 # --------- Data Models ---------
 class Message(BaseModel):
@@ -9,4 +9,8 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     model: str
     messages: List[Message]
-    stream: bool = False
\ No newline at end of file
+    stream: bool = False
+    # Pipeline override; falls back to the model id, then PIPELINE_MODE
+    mode: Optional[Literal["direct", "agent"]] = None
+    # Conversation id for session state (or an X-Conversation-Id header); none without either
+    conversation_id: Optional[str] = None
@@ -0,0 +1,165 @@
+import glob
+import json
+import os
+import re
+import statistics
+import time
+
+from rag.corpora import CORPUS_KEY
+from rag.db import connection
+from rag.settings import (
+    ANN_INDEX,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    HNSW_M,
+    IVFFLAT_LISTS,
+    IVFFLAT_PROBES,
+    VECTOR_TABLE,
+)
+
+TABLE = f"data_{VECTOR_TABLE}"
+EVAL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "eval_dataset")
+
+
+def query_kwargs(kind: str = ANN_INDEX, ef_search: int = None, probes: int = None) -> dict:
+    """Per-query search knobs, passed to PGVectorStore.query via `vector_store_kwargs`."""
+    if kind == "hnsw":
+        return {"hnsw_ef_search": ef_search or HNSW_EF_SEARCH}
+    if kind == "ivfflat":
+        return {"ivfflat_probes": probes or IVFFLAT_PROBES}
+    return {}
+
+
+def list_indexes() -> list:
+    """ANN indexes currently on the embedding table, as (name, method, definition)."""
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT i.relname, am.amname, pg_get_indexdef(i.oid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            JOIN pg_class t ON t.oid = x.indrelid
+            JOIN pg_am am ON am.oid = i.relam
+            WHERE t.relname = %s AND am.amname IN ('hnsw', 'ivfflat')
+            """,
+            (TABLE,),
+        )
+        return cur.fetchall()
+
+
+def ensure_index(kind: str = ANN_INDEX):
+    """Create the configured index if the table has none of that kind (no-op otherwise)."""
+    if kind == "none" or any(method == kind and " WHERE " not in definition
+                             for _, method, definition in list_indexes()):
+        return
+    rebuild_index(kind)
+
+
+def ensure_corpus_indexes(kind: str = ANN_INDEX, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION):
+    """Index the corpus key, plus one partial HNSW index per corpus (idempotent).
+
+    A routed query filters on `metadata_->>'corpus' = '<c>'`, which lets the planner use that
+    corpus's partial index: the graph walk only visits the corpus's own rows, so k results come
+    back without the post-filter shortfall of a global index. IVFFlat has no per-corpus variant;
+    it keeps the global index plus the filter.
+    """
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (TABLE,))
+        if cur.fetchone()[0] is None:
+            return
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_{CORPUS_KEY}_idx ON {TABLE} ((metadata_->>'{CORPUS_KEY}'))")
+        if kind != "hnsw":
+            return
+        cur.execute(f"SELECT DISTINCT metadata_->>'{CORPUS_KEY}' FROM {TABLE} WHERE metadata_->>'{CORPUS_KEY}' IS NOT NULL")
+        for (corpus,) in cur.fetchall():
+            name = f"{TABLE}_embedding_hnsw_{re.sub(r'[^a-z0-9_]', '_', corpus.lower())}"
+            literal = corpus.replace("'", "''")
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON {TABLE} "
+                f"USING hnsw (embedding vector_cosine_ops) WITH (m = %s, ef_construction = %s) "
+                f"WHERE metadata_->>'{CORPUS_KEY}' = '{literal}'",
+                (m, ef_construction),
+            )
+        cur.execute(f"ANALYZE {TABLE}")
+
+
+def rebuild_index(kind: str = ANN_INDEX, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION,
+                  lists: int = IVFFLAT_LISTS):
+    """Drop every ANN index on the embedding column and build `kind` with the given parameters."""
+    if kind not in ("hnsw", "ivfflat", "none"):
+        raise ValueError(f"Unknown ANN index type: {kind}")
+    start = time.perf_counter()
+    with connection() as conn, conn.cursor() as cur:
+        for name, _, _ in list_indexes():
+            cur.execute(f'DROP INDEX IF EXISTS "{name}"')
+        if kind == "hnsw":
+            cur.execute(
+                f"CREATE INDEX {TABLE}_embedding_hnsw ON {TABLE} "
+                f"USING hnsw (embedding vector_cosine_ops) WITH (m = %s, ef_construction = %s)",
+                (m, ef_construction),
+            )
+        elif kind == "ivfflat":
+            if not lists:
+                # pgvector guidance: rows / 1000 for up to ~1M rows
+                cur.execute(f"SELECT count(*) FROM {TABLE}")
+                lists = max(10, cur.fetchone()[0] // 1000)
+            cur.execute(
+                f"CREATE INDEX {TABLE}_embedding_ivfflat ON {TABLE} "
+                f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = %s)",
+                (lists,),
+            )
+        cur.execute(f"ANALYZE {TABLE}")
+    ensure_corpus_indexes(kind, m, ef_construction)
+    print(f"✅ Rebuilt ANN index ({kind}) on {TABLE} in {time.perf_counter() - start:.1f}s")
+
+
+def _search(cur, embedding, k: int) -> list:
+    cur.execute(
+        f"SELECT node_id FROM {TABLE} ORDER BY embedding <=> %s::vector LIMIT %s",
+        ("[" + ",".join(map(str, embedding)) + "]", k),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def load_eval_questions(pattern: str = os.path.join(EVAL_DIR, "*.json")) -> list:
+    questions = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8") as f:
+            questions.extend(item["question"] for item in json.load(f))
+    return questions
+
+
+def recall_report(embed_model, k: int = 10, kind: str = ANN_INDEX, sweep=None, questions=None) -> dict:
+    """Recall@k and latency of the ANN index against exact search, for each ef_search/probes value.
+
+    Exact results come from the same query with index scans disabled.
+    """
+    questions = questions or load_eval_questions()
+    sweep = sweep or ([10, 20, 40, 80, 160] if kind == "hnsw" else [1, 5, 10, 20, 50])
+    setting = "hnsw.ef_search" if kind == "hnsw" else "ivfflat.probes"
+    embeddings = [embed_model.get_query_embedding(q) for q in questions]
+
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SET LOCAL enable_indexscan = off")
+        exact = [_search(cur, emb, k) for emb in embeddings]
+        conn.rollback()  # end the transaction so the setting is dropped
+
+        rows = []
+        for value in sweep:
+            cur.execute(f"SET LOCAL {setting} = {int(value)}")
+            latencies, recalls = [], []
+            for emb, truth in zip(embeddings, exact):
+                start = time.perf_counter()
+                found = _search(cur, emb, k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(len(set(found) & set(truth)) / max(1, len(truth)))
+            conn.rollback()
+            latencies.sort()
+            rows.append({
+                setting: value,
+                f"recall@{k}": round(statistics.mean(recalls), 4),
+                "p50_ms": round(latencies[len(latencies) // 2], 2),
+                "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+            })
+    return {"index": kind, "indexes": [name for name, _, _ in list_indexes()],
+            "questions": len(questions), "k": k, "results": rows}
@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from rag.settings import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_TTL,
+    CACHE_DIR,
+)
+
+# Touched by ingestion; any cache that sees a newer mtime drops its entries
+INDEX_VERSION_FILE = os.path.join(CACHE_DIR, "index_version")
+
+
+def bump_index_version():
+    """Mark the index as changed so every process's answer cache invalidates itself."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(INDEX_VERSION_FILE, "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+
+
+def read_index_version() -> float:
+    try:
+        return os.path.getmtime(INDEX_VERSION_FILE)
+    except OSError:
+        return 0.0
+
+
+def normalize_question(question: str) -> str:
+    text = re.sub(r"\s+", " ", question.strip().lower())
+    return text.rstrip("?!. ")
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    source_nodes: list = field(default_factory=list)
+    embedding: Optional[np.ndarray] = None
+    created: float = field(default_factory=time.time)
+
+
+class AnswerCache:
+    """Size-bounded LRU of answers with TTL, looked up exactly and then semantically."""
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: float = ANSWER_CACHE_TTL,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[tuple, CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_version = read_index_version()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _check_index_version(self):
+        version = read_index_version()
+        if version != self._index_version:
+            self._entries.clear()
+            self._index_version = version
+
+    def _expired(self, entry: CachedAnswer) -> bool:
+        return self.ttl > 0 and time.time() - entry.created > self.ttl
+
+    def get_exact(self, question: str, namespace: str = "") -> Optional[CachedAnswer]:
+        key = (namespace, normalize_question(question))
+        with self._lock:
+            self._check_index_version()
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+            return entry
+
+    def get_similar(self, embedding, namespace: str = "") -> Optional[CachedAnswer]:
+        """Nearest cached question by cosine similarity; counts a miss if none clears the threshold."""
+        query = _unit(embedding)
+        with self._lock:
+            self._check_index_version()
+            keys, vectors = [], []
+            for key, entry in list(self._entries.items()):
+                if key[0] != namespace or entry.embedding is None:
+                    continue
+                if self._expired(entry):
+                    del self._entries[key]
+                    continue
+                keys.append(key)
+                vectors.append(entry.embedding)
+            if vectors:
+                scores = np.stack(vectors) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    return self._entries[keys[best]]
+            self.misses += 1
+            return None
+
+    def put(self, question: str, answer: str, source_nodes=None, embedding=None, namespace: str = ""):
+        key = (namespace, normalize_question(question))
+        entry = CachedAnswer(
+            answer=answer,
+            source_nodes=list(source_nodes or []),
+            embedding=_unit(embedding) if embedding is not None else None,
+        )
+        with self._lock:
+            self._check_index_version()
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+
+def build_answer_cache():
+    """Process-local cache, or the model service's shared one in multi-worker mode."""
+    from rag.model_service import RemoteAnswerCache, remote_enabled
+
+    return RemoteAnswerCache() if remote_enabled() else AnswerCache()
+
+
+def _unit(embedding) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import re
+import time
+from typing import AsyncIterator, Iterable, List
+
+from rag.concurrency import run_sync
+from rag.embed_batcher import embed_queries
+from rag.pipeline import StageTimer
+from rag.settings import BATCH_EMBED_SIZE, BATCH_LLM_CONCURRENCY, BATCH_OUTPUT_DIR, BATCH_SEARCH_CONCURRENCY
+
+
+# Process-wide: concurrent batches share one search and one LLM budget instead of each
+# bringing its own
+_slots = {}
+_running = set()  # checkpoints being written by a run in this process
+
+
+def _shared_slots(name: str, size: int) -> asyncio.Semaphore:
+    if name not in _slots:
+        _slots[name] = asyncio.Semaphore(size)
+    return _slots[name]
+
+
+def claim(checkpoint: str):
+    """Reserve `checkpoint` for one run (RuntimeError if a run holds it); returns its release,
+    safe to call from several cleanup paths."""
+    path = os.path.realpath(checkpoint)
+    if path in _running:
+        raise RuntimeError(f"Batch run already in progress: {checkpoint}")
+    _running.add(path)
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            _running.discard(path)
+    return release
+
+
+def parse_items(lines: Iterable[str]) -> List[dict]:
+    """JSONL questions: objects with a "question" (an "id" and any other keys are echoed back)
+    or bare JSON strings. Items without an id get their line number, so rerunning the same
+    file resumes cleanly."""
+    items, seen = [], set()
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        row = json.loads(line)
+        if isinstance(row, str):
+            row = {"question": row}
+        if not isinstance(row, dict) or not str(row.get("question") or "").strip():
+            raise ValueError(f'line {n}: expected a question string or an object with a "question"')
+        item = {**row, "id": str(row.get("id", n))}
+        if item["id"] in seen:
+            raise ValueError(f"line {n}: duplicate id {item['id']!r}")
+        seen.add(item["id"])
+        items.append(item)
+    return items
+
+
+def checkpoint_path(run_id: str) -> str:
+    if not re.fullmatch(r"[\w.-]+", run_id):
+        raise ValueError(f"Invalid run id: {run_id!r}")
+    return os.path.join(BATCH_OUTPUT_DIR, f"{run_id}.jsonl")
+
+
+def read_results(path: str) -> dict:
+    """Finished rows of an earlier run by id; rows with an error are retried."""
+    rows = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue  # blank, or cut short by a crash
+                if "error" not in row:
+                    rows[row["id"]] = row
+    return rows
+
+
+def _sources(nodes, k: int = 3) -> list:
+    sources = []
+    for result in nodes[:k]:
+        meta = result.node.metadata or {}
+        sources.append({
+            "doc_name": meta.get("doc_name") or meta.get("file_name"),
+            "page": meta.get("page_label"),
+            "score": round(result.score, 4) if result.score is not None else None,
+        })
+    return sources
+
+
+async def run_batch(pipeline, items: List[dict], embed_model, checkpoint: str = None, replay: bool = True,
+                    synthesize: bool = True, embed_size: int = BATCH_EMBED_SIZE,
+                    search_concurrency: int = BATCH_SEARCH_CONCURRENCY,
+                    llm_concurrency: int = BATCH_LLM_CONCURRENCY, release=None) -> AsyncIterator[dict]:
+    """Answer `items` through a DirectPipeline, yielding one row per item as it finishes.
+
+    Questions are embedded `embed_size` per forward pass. Retrieval (search + rerank) runs
+    `search_concurrency` at a time and synthesis `llm_concurrency` at a time, shared by every
+    batch in the process (the first run's sizes win). At most
+    `search_concurrency + 2 * llm_concurrency` items are in flight, so a long file never holds
+    thousands of retrieved contexts. With a `checkpoint` file, items already answered there
+    are skipped (and yielded first when `replay`), and every new row is appended to it; one run
+    per checkpoint at a time: pass the `release` of an earlier `claim(checkpoint)` to have the
+    checkpoint reserved before the first row is asked for.
+    """
+    if release is None and checkpoint:
+        release = claim(checkpoint)
+    rows = _run(pipeline, items, embed_model, checkpoint, replay, synthesize, embed_size,
+                search_concurrency, llm_concurrency)
+    try:
+        async for row in rows:
+            yield row
+    finally:
+        await rows.aclose()  # cancel outstanding work now, not when the generator is collected
+        if release is not None:
+            release()
+
+
+async def _run(pipeline, items, embed_model, checkpoint, replay, synthesize, embed_size,
+               search_concurrency, llm_concurrency):
+    done = read_results(checkpoint) if checkpoint else {}
+    if replay:
+        for item in items:
+            if item["id"] in done:
+                yield {**done[item["id"]], "resumed": True}
+    todo = [item for item in items if item["id"] not in done]
+    if not todo:
+        return
+
+    search_slots = _shared_slots("search", search_concurrency)
+    llm_slots = _shared_slots("llm", llm_concurrency)
+    window = asyncio.Semaphore(search_concurrency + 2 * llm_concurrency)
+    results: asyncio.Queue = asyncio.Queue()
+    tasks = []
+
+    async def answer(item: dict, embedding, embed_ms: float):
+        timer = StageTimer()
+        if embedding is not None:
+            timer.timings["embed"] = embed_ms  # this question's share of the batch
+        row = dict(item)
+        try:
+            async with search_slots:
+                nodes = await pipeline.aretrieve(item["question"], timer, embedding)
+            if synthesize:
+                async with llm_slots:
+                    with timer.stage("synthesize"):
+                        row["answer"] = str(await pipeline.synthesizer.asynthesize(item["question"], nodes))
+            row["sources"] = _sources(nodes)
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            window.release()
+        row["timings"] = timer.as_dict()
+        await results.put(row)
+
+    async def produce():
+        for start in range(0, len(todo), embed_size):
+            chunk = todo[start:start + embed_size]
+            started = time.perf_counter()
+            try:
+                embeddings = await run_sync(embed_queries, embed_model, [item["question"] for item in chunk])
+                if len(embeddings) != len(chunk):
+                    raise ValueError(f"{len(embeddings)} embeddings for {len(chunk)} questions")
+            except Exception as e:
+                # Fall back to one embedding per question inside the pipeline
+                print(f"⚠️ Batch embedding failed ({e}); embedding questions one by one.")
+                embeddings = [None] * len(chunk)
+            embed_ms = round((time.perf_counter() - started) * 1000 / len(chunk), 2)
+            for item, embedding in zip(chunk, embeddings):
+                await window.acquire()
+                tasks.append(asyncio.create_task(answer(item, embedding, embed_ms)))
+
+    out = None
+    if checkpoint:
+        os.makedirs(os.path.dirname(checkpoint) or ".", exist_ok=True)
+        out = open(checkpoint, "a", encoding="utf-8")
+    producer = asyncio.create_task(produce())
+    try:
+        for _ in todo:
+            getter = asyncio.ensure_future(results.get())
+            if not producer.done():
+                await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done() and producer.exception() is not None:
+                # Items it never scheduled would never report back: stop instead of hanging
+                getter.cancel()
+                raise producer.exception()
+            row = await getter
+            if out is not None:
+                out.write(json.dumps(row) + "\n")
+                out.flush()
+            yield row
+    finally:
+        # Client gone or consumer stopped early: don't keep answering into the void
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+        if out is not None:
+            out.close()
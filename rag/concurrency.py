@@ -0,0 +1,98 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from rag.settings import (
+    MAX_CONCURRENT_REQUESTS,
+    MAX_QUEUED_REQUESTS,
+    QUEUE_TIMEOUT,
+    WORKER_THREADS,
+)
+
+
+class QueueFullError(Exception):
+    """Raised when a request can't get a pipeline slot (queue full or wait timed out)."""
+
+
+class RequestLimiter:
+    """Caps in-flight pipeline runs and bounds how many requests may wait for a slot."""
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+        max_queued: int = MAX_QUEUED_REQUESTS,
+        timeout: float = QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(max_concurrent)
+
+    async def acquire(self):
+        # Shed load early instead of letting the queue grow without bound
+        if self._sem.locked() and self.waiting >= self.max_queued:
+            raise QueueFullError(f"{self.waiting} requests already queued")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise QueueFullError(f"no pipeline slot freed up within {self.timeout}s") from None
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._sem.release()
+
+    def releaser(self):
+        """A release for one acquired slot that is safe to call from several cleanup paths."""
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.release()
+        return release
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+        }
+
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Shared, bounded pool for anything that still blocks (CrewAI, sync clients)."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="rag-worker")
+    return _executor
+
+
+async def run_sync(fn, *args, **kwargs):
+    """Run a blocking callable on the worker pool without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
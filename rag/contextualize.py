@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+
+from rag.llm_gateway import LLMGateway, default_options, get_gateway
+from rag.settings import (
+    CACHE_DIR,
+    CHUNK_CONTEXT_CONCURRENCY,
+    CHUNK_CONTEXT_DOC_CHARS,
+    CHUNK_CONTEXT_NUM_CTX,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_MODEL,
+)
+
+# Bump when the prompt changes: cached contexts from older prompts are then ignored
+PROMPT_VERSION = "v1"
+
+# The document comes first and is byte-identical for every chunk of that document, so
+# Ollama can reuse the evaluated prefix (KV cache) and only process the chunk + question.
+DOCUMENT_PROMPT = "<document>\n{document}\n</document>\n"
+CHUNK_PROMPT = (
+    "Here is the chunk we want to situate within the whole document\n"
+    "<chunk>\n{chunk}\n</chunk>\n"
+    "Please give a short succinct context to situate this chunk within the overall document "
+    "for the purposes of improving search retrieval of the chunk. "
+    "Answer only with the succinct context and nothing else."
+)
+
+
+def sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ContextCache:
+    """Persistent (doc hash, chunk hash, prompt version) -> context store, safe across processes."""
+
+    def __init__(self, path: str = os.path.join(CACHE_DIR, "chunk_contexts.sqlite")):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS contexts ("
+                " doc_hash TEXT, chunk_hash TEXT, prompt_version TEXT, context TEXT,"
+                " PRIMARY KEY (doc_hash, chunk_hash, prompt_version))"
+            )
+
+    def get_many(self, doc_hash: str, chunk_hashes: List[str]) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_hash, context FROM contexts WHERE doc_hash = ? AND prompt_version = ?",
+                (doc_hash, PROMPT_VERSION),
+            ).fetchall()
+        wanted = set(chunk_hashes)
+        return {chunk_hash: context for chunk_hash, context in rows if chunk_hash in wanted}
+
+    def put(self, doc_hash: str, chunk_hash: str, context: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO contexts VALUES (?, ?, ?, ?)",
+                (doc_hash, chunk_hash, PROMPT_VERSION, context),
+            )
+
+
+class ChunkContextualizer:
+    """Asks the local Ollama model for a short chunk-situating context (Anthropic-style).
+
+    Chunks of one document are sent concurrently (up to `concurrency`) through the LLM gateway,
+    which spreads them over the Ollama endpoints; all of them share the document prefix.
+    """
+
+    def __init__(
+        self,
+        gateway: Optional[LLMGateway] = None,
+        model: str = OLLAMA_MODEL,
+        concurrency: int = CHUNK_CONTEXT_CONCURRENCY,
+        doc_chars: int = CHUNK_CONTEXT_DOC_CHARS,
+        num_ctx: int = CHUNK_CONTEXT_NUM_CTX,
+        cache: Optional[ContextCache] = None,
+    ):
+        self.gateway = gateway or get_gateway()
+        self.model = model
+        self.concurrency = concurrency
+        self.doc_chars = doc_chars
+        self.num_ctx = num_ctx
+        self.cache = cache or ContextCache()
+        self.generated = 0
+        self.cached = 0
+
+    async def _generate(self, prompt: str) -> str:
+        raw = await self.gateway.apost("/api/generate", {
+            "model": self.model,
+            "prompt": prompt,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": default_options(num_ctx=self.num_ctx, temperature=0),
+        })
+        return raw.get("response", "").strip()
+
+    async def acontextualize(self, document_text: str, chunks: List[str]) -> List[str]:
+        """One context per chunk, in order; cached contexts are never regenerated."""
+        doc_hash = sha256(document_text)
+        chunk_hashes = [sha256(chunk) for chunk in chunks]
+        known = self.cache.get_many(doc_hash, chunk_hashes)
+        self.cached += sum(h in known for h in chunk_hashes)
+
+        todo = [i for i, h in enumerate(chunk_hashes) if h not in known]
+        if todo:
+            prefix = DOCUMENT_PROMPT.format(document=document_text[: self.doc_chars])
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def run(i: int):
+                async with semaphore:
+                    context = await self._generate(prefix + CHUNK_PROMPT.format(chunk=chunks[i]))
+                self.cache.put(doc_hash, chunk_hashes[i], context)
+                known[chunk_hashes[i]] = context
+
+            await asyncio.gather(*(run(i) for i in todo))
+            self.generated += len(todo)
+
+        return [known[h] for h in chunk_hashes]
+
+    def contextualize(self, document_text: str, chunks: List[str]) -> List[str]:
+        return asyncio.run(self.acontextualize(document_text, chunks))
@@ -0,0 +1,218 @@
+import fnmatch
+import json
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.schema import QueryBundle
+from llama_index.core.vector_stores.types import MetadataFilter, MetadataFilters
+
+from rag.settings import (
+    CORPORA_FILE,
+    ROUTING_MAX_CORPORA,
+    ROUTING_MODE,
+    ROUTING_SIMILARITY_MARGIN,
+    VECTOR_BACKEND,
+    VECTOR_TABLE,
+    init_vector_store,
+)
+
+CORPUS_KEY = "corpus"
+DEFAULT_CORPUS = "general"
+
+# A document belongs to the first corpus with a `patterns` match on its lower-cased file name.
+# `keywords` drive the keyword router (whole words, plural "s" allowed).
+CORPORA: Dict[str, dict] = {
+    "procurement": {
+        "title": "Abu Dhabi Procurement Standards & Manuals",
+        "intent": "Assist a procurement practitioner answering policy/process questions",
+        "patterns": ["*procurement*", "*ariba*", "*purchas*", "*tender*"],
+        "keywords": [
+            "procurement", "purchase", "purchasing", "purchase order", "supplier", "vendor", "tender",
+            "bid", "bidder", "rfq", "rfp", "rfi", "quotation", "sourcing", "ariba", "sap", "invoice",
+            "catalog", "contract", "category management",
+        ],
+    },
+    "hr": {
+        "title": "HR Bylaws",
+        "intent": "Assist an employee or HR officer answering HR policy questions",
+        "patterns": ["hr *", "* hr *", "*bylaw*", "*human resource*"],
+        "keywords": [
+            "hr", "human resources", "employee", "staff", "bylaw", "leave", "annual leave", "sick leave",
+            "salary", "allowance", "probation", "termination", "resignation", "promotion", "grade",
+            "overtime", "end of service", "gratuity", "recruitment", "hiring", "appraisal",
+            "disciplinary", "working hours", "maternity",
+        ],
+    },
+    "infosec": {
+        "title": "Information Security Standards (NESA IA)",
+        "intent": "Assist a security officer answering information assurance and compliance questions",
+        "patterns": ["*security*", "*nesa*", "*ia standard*", "*cyber*"],
+        "keywords": [
+            "information security", "security", "nesa", "information assurance", "cyber", "cybersecurity",
+            "access control", "password", "encryption", "incident", "vulnerability", "malware",
+            "firewall", "isms", "confidentiality", "backup", "threat",
+        ],
+    },
+    DEFAULT_CORPUS: {
+        "title": "General",
+        "intent": "Assist a user answering questions about the organisation's documents",
+        "patterns": [],
+        "keywords": [],
+    },
+}
+
+if CORPORA_FILE:
+    with open(CORPORA_FILE, encoding="utf-8") as f:
+        CORPORA = json.load(f)
+    CORPORA.setdefault(DEFAULT_CORPUS, {"title": "General", "intent": "", "patterns": [], "keywords": []})
+
+
+def corpus_of(doc_name: str) -> str:
+    name = doc_name.lower()
+    for corpus, spec in CORPORA.items():
+        if any(fnmatch.fnmatch(name, pattern) for pattern in spec.get("patterns", [])):
+            return corpus
+    return DEFAULT_CORPUS
+
+
+def corpus_filter(corpus: str) -> MetadataFilters:
+    return MetadataFilters(filters=[MetadataFilter(key=CORPUS_KEY, value=corpus)])
+
+
+def tag_untagged():
+    """Backfill `corpus` on chunks ingested before corpora existed (by their doc_name)."""
+    tagged = 0
+    if VECTOR_BACKEND == "numpy":
+        store = init_vector_store()
+        for doc_name in store.metadata_values("doc_name"):
+            doc = MetadataFilters(filters=[MetadataFilter(key="doc_name", value=doc_name)])
+            tagged += store.tag(CORPUS_KEY, corpus_of(doc_name), doc)
+        if tagged:
+            store.persist()
+            print(f"🏷️ Tagged {tagged} existing chunks with their corpus.")
+        return tagged
+
+    from rag.db import connection
+
+    table = f"data_{VECTOR_TABLE}"
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (table,))
+        if cur.fetchone()[0] is None:
+            return 0
+        cur.execute(
+            "SELECT data_type FROM information_schema.columns WHERE table_name = %s AND column_name = 'metadata_'",
+            (table,),
+        )
+        cast = "" if cur.fetchone()[0] == "jsonb" else "::json"
+        cur.execute(
+            f"SELECT DISTINCT metadata_->>'doc_name' FROM {table} "
+            f"WHERE metadata_->>'{CORPUS_KEY}' IS NULL AND metadata_->>'doc_name' IS NOT NULL"
+        )
+        for (doc_name,) in cur.fetchall():
+            cur.execute(
+                f"UPDATE {table} SET metadata_ = (metadata_::jsonb || jsonb_build_object(%s, %s)){cast} "
+                f"WHERE metadata_->>'doc_name' = %s AND metadata_->>'{CORPUS_KEY}' IS NULL",
+                (CORPUS_KEY, corpus_of(doc_name), doc_name),
+            )
+            tagged += cur.rowcount
+    if tagged:
+        print(f"🏷️ Tagged {tagged} existing chunks with their corpus.")
+    return tagged
+
+
+def corpus_centroids() -> Dict[str, np.ndarray]:
+    """Normalised mean chunk embedding per corpus, from the vector store."""
+    if VECTOR_BACKEND == "numpy":
+        return init_vector_store().centroids(CORPUS_KEY)
+
+    from rag.db import connection
+
+    table = f"data_{VECTOR_TABLE}"
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (table,))
+        if cur.fetchone()[0] is None:
+            return {}
+        cur.execute(
+            f"SELECT metadata_->>'{CORPUS_KEY}', avg(embedding)::text FROM {table} "
+            f"WHERE metadata_->>'{CORPUS_KEY}' IS NOT NULL GROUP BY 1"
+        )
+        rows = cur.fetchall()
+    centroids = {}
+    for corpus, vector in rows:
+        v = np.asarray(json.loads(vector), dtype=np.float32)
+        centroids[corpus] = v / (np.linalg.norm(v) or 1.0)
+    return centroids
+
+
+class CorpusRouter:
+    """Picks the corpora a question should be searched in, without an LLM.
+
+    `route()` returns a sorted tuple of corpus names, or None to search everything (no signal,
+    or more than `max_corpora` equally good candidates).
+    """
+
+    def __init__(self, mode: str = ROUTING_MODE, corpora: Dict[str, dict] = None,
+                 centroids: Dict[str, np.ndarray] = None, max_corpora: int = ROUTING_MAX_CORPORA,
+                 margin: float = ROUTING_SIMILARITY_MARGIN):
+        self.mode = mode
+        self.corpora = corpora or CORPORA
+        self.centroids = centroids or {}
+        self.max_corpora = max_corpora
+        self.margin = margin
+        self._keywords = {
+            name: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in spec["keywords"]) + r")s?\b", re.IGNORECASE)
+            for name, spec in self.corpora.items() if spec.get("keywords")
+        }
+        self._lock = threading.Lock()
+        self._routes: Dict[str, int] = {}
+
+    @classmethod
+    def from_store(cls, mode: str = ROUTING_MODE) -> "CorpusRouter":
+        centroids = {}
+        if mode in ("centroid", "auto"):
+            try:
+                centroids = corpus_centroids()
+            except Exception as e:
+                print(f"⚠️ Could not load corpus centroids ({e}); routing by keywords only.")
+        return cls(mode=mode, centroids=centroids)
+
+    @property
+    def needs_embedding(self) -> bool:
+        return bool(self.centroids)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._routes)
+
+    def _pick(self, scores: Dict[str, float], threshold: float) -> Optional[Tuple[str, ...]]:
+        chosen = [name for name, score in scores.items() if score >= threshold]
+        if not chosen or len(chosen) > self.max_corpora:
+            return None
+        return tuple(sorted(chosen))
+
+    def by_keywords(self, question: str) -> Optional[Tuple[str, ...]]:
+        scores = {name: len(pattern.findall(question)) for name, pattern in self._keywords.items()}
+        best = max(scores.values(), default=0)
+        # Corpora with at least half the best hit count; no hits is no signal
+        return self._pick(scores, best / 2) if best else None
+
+    def by_centroid(self, embedding: List[float]) -> Optional[Tuple[str, ...]]:
+        if not self.centroids or embedding is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = {name: float(centroid @ query) for name, centroid in self.centroids.items()}
+        return self._pick(scores, max(scores.values()) - self.margin)
+
+    def route(self, query_bundle: QueryBundle) -> Optional[Tuple[str, ...]]:
+        corpora = None
+        if self.mode in ("keyword", "auto"):
+            corpora = self.by_keywords(query_bundle.query_str)
+        if corpora is None and self.mode in ("centroid", "auto"):
+            corpora = self.by_centroid(query_bundle.embedding)
+        key = re.sub(r"\W", "_", "_".join(corpora)) if corpora else "all"
+        with self._lock:
+            self._routes[key] = self._routes.get(key, 0) + 1
+        return corpora
@@ -0,0 +1,146 @@
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+from rag.settings import (
+    DB_CONFIG,
+    DB_POOL_MAX,
+    DB_POOL_MIN,
+    DB_POOL_PRE_PING,
+    DB_POOL_TIMEOUT,
+    vector_store_pool_status,
+)
+
+_pool = None
+_async_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool.getconn() raises PoolError when every connection is out instead of
+# waiting: callers queue here for up to DB_POOL_TIMEOUT first
+_checkout_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_stats = {"checkouts": 0, "wait_seconds": 0.0, "timeouts": 0, "reconnects": 0, "errors": 0}
+
+
+def _count(key: str, amount=1):
+    with _pool_lock:
+        _stats[key] += amount
+
+
+def get_pool() -> pg_pool.ThreadedConnectionPool:
+    """Process-wide psycopg2 pool shared by the API, ingestion and the eval harness."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pg_pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_CONFIG)
+    return _pool
+
+
+def _healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if not DB_POOL_PRE_PING:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection; commits on success, rolls back on error, always returns it."""
+    pool = get_pool()
+    start = time.perf_counter()
+    if not _checkout_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        _count("timeouts")
+        raise pg_pool.PoolError(f"no database connection freed up within {DB_POOL_TIMEOUT}s")
+    try:
+        conn = pool.getconn()
+        if not _healthy(conn):
+            # Dead connection (server restart, idle timeout): drop it and open a fresh one
+            pool.putconn(conn, close=True)
+            _count("reconnects")
+            conn = pool.getconn()
+    except BaseException:
+        _checkout_slots.release()
+        raise
+    with _pool_lock:
+        _stats["checkouts"] += 1
+        _stats["wait_seconds"] += time.perf_counter() - start
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        _count("errors")
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+        _checkout_slots.release()
+
+
+async def get_async_pool():
+    global _async_pool
+    if _async_pool is None:
+        import asyncpg
+
+        _async_pool = await asyncpg.create_pool(
+            host=DB_CONFIG["host"],
+            port=DB_CONFIG["port"],
+            database=DB_CONFIG["dbname"],
+            user=DB_CONFIG["user"],
+            password=DB_CONFIG["password"] or None,
+            min_size=DB_POOL_MIN,
+            max_size=DB_POOL_MAX,
+        )
+    return _async_pool
+
+
+@asynccontextmanager
+async def async_connection():
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        yield conn
+
+
+async def ping() -> bool:
+    try:
+        async with async_connection() as conn:
+            return await conn.fetchval("SELECT 1") == 1
+    except Exception:
+        return False
+
+
+async def close_pools():
+    global _pool, _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
+
+def pool_stats() -> dict:
+    with _pool_lock:
+        stats = {"sync": dict(_stats, min=DB_POOL_MIN, max=DB_POOL_MAX)}
+    if _pool is not None:
+        # psycopg2 keeps no public counters; these are its bookkeeping structures
+        stats["sync"]["in_use"] = len(_pool._used)
+        stats["sync"]["idle"] = len(_pool._pool)
+    if _async_pool is not None:
+        stats["async"] = {
+            "size": _async_pool.get_size(),
+            "idle": _async_pool.get_idle_size(),
+            "min": _async_pool.get_min_size(),
+            "max": _async_pool.get_max_size(),
+        }
+    stats["vector_store"] = vector_store_pool_status()
+    return stats
@@ -0,0 +1,142 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+from rag.settings import EMBED_MICROBATCH_MAX, EMBED_MICROBATCH_WAIT_MS
+
+
+def embed_queries(model: BaseEmbedding, queries: List[str]) -> List[List[float]]:
+    """One forward pass for several queries (with the model's query instruction)."""
+    if hasattr(model, "_get_query_embeddings"):
+        return model._get_query_embeddings(queries)
+    if hasattr(model, "_embed"):  # HuggingFaceEmbedding: prompt_name selects the bge query prefix
+        return model._embed(queries, prompt_name="query")
+    return [model.get_query_embedding(q) for q in queries]
+
+
+class MicroBatchedEmbedding(BaseEmbedding):
+    """Coalesces concurrent query embeddings into one batched forward pass.
+
+    A dispatcher thread takes whatever queries are waiting (up to `max_batch`). If it only has
+    one, it waits at most `max_wait_ms` for company. Under load the queue fills while the
+    previous batch runs, so batches grow without any added wait. Text (chunk) embeddings are
+    already batched by their callers and pass straight through.
+    """
+
+    _inner: Any = PrivateAttr()
+    _max_batch: int = PrivateAttr()
+    _max_wait: float = PrivateAttr()
+    _queue: "queue.Queue" = PrivateAttr(default_factory=queue.Queue)
+    _thread: Any = PrivateAttr(default=None)
+    _start_lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _batches: int = PrivateAttr(default=0)
+    _items: int = PrivateAttr(default=0)
+    _largest: int = PrivateAttr(default=0)
+    _wait_ms: float = PrivateAttr(default=0.0)
+
+    def __init__(self, inner: BaseEmbedding, max_batch: int = EMBED_MICROBATCH_MAX,
+                 max_wait_ms: float = EMBED_MICROBATCH_WAIT_MS, **kwargs):
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MicroBatchedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    def stats(self) -> dict:
+        return {
+            "batches": self._batches,
+            "queries": self._items,
+            "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "largest_batch": self._largest,
+            "mean_queue_wait_ms": round(self._wait_ms / self._items, 3) if self._items else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    def _submit(self, query: str) -> Future:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._dispatch, name="embed-microbatch", daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((query, future, time.perf_counter()))
+        return future
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        while len(batch) < self._max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(batch) == 1 and self._max_wait > 0:
+            deadline = time.perf_counter() + self._max_wait
+            while len(batch) < self._max_batch and (remaining := deadline - time.perf_counter()) > 0:
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                embeddings = embed_queries(self._inner, [query for query, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self._batches += 1
+            self._items += len(batch)
+            self._largest = max(self._largest, len(batch))
+            self._wait_ms += sum((started - queued) * 1000 for _, _, queued in batch)
+            for (_, future, _), embedding in zip(batch, embeddings):
+                future.set_result(list(embedding))
+
+    # --- BaseEmbedding interface ----------------------------------------------------
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._submit(query).result()
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await asyncio.wrap_future(self._submit(query))
+
+    def _get_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        # Already a batch (bulk queries): straight to the model, past the dispatcher
+        return embed_queries(self._inner, queries)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._inner.get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._inner.get_text_embedding_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._inner.aget_text_embedding_batch(texts)
+
+
+def batch_stats(embed_model) -> dict:
+    """Micro-batcher stats of an embed model chain (Cached → MicroBatched → model, or remote)."""
+    model = embed_model
+    while model is not None:
+        if isinstance(model, MicroBatchedEmbedding) or hasattr(model, "batch_stats"):
+            return model.stats() if isinstance(model, MicroBatchedEmbedding) else model.batch_stats()
+        if not getattr(model, "built", True):
+            return {}  # lazy model not loaded yet: nothing batched, and stats shouldn't load it
+        model = getattr(model, "inner", None)
+    return {}
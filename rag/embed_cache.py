@@ -0,0 +1,252 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+from rag.embed_batcher import embed_queries
+from rag.settings import CACHE_DIR, EMBED_QUERY_CACHE_SIZE
+
+
+def embedding_key(model_name: str, kind: str, text: str) -> str:
+    # bge embeds queries with an instruction prefix, so "query" and "text" never share a vector
+    return hashlib.sha256(f"{model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Append-only on-disk embedding store: float32 rows in a memory-mapped file plus a hash index.
+
+    Layout under `path`: vectors.f32 (row-major float32), keys.txt (one hash per row, same order)
+    and meta.json (dimension). Appends take an exclusive file lock, so ingestion, the API and the
+    eval harness can share one store.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._keys_path = os.path.join(path, "keys.txt")
+        self._meta_path = os.path.join(path, "meta.json")
+        self._lock_path = os.path.join(path, ".lock")
+        self._index: Dict[str, int] = {}
+        self._row_count = 0
+        self._keys_offset = 0
+        self._matrix = None
+        self.dim = None
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        self._refresh()
+
+    def _refresh(self):
+        """Pick up rows appended since the last read (possibly by another process)."""
+        if not os.path.exists(self._keys_path):
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        # Only consume complete lines; a concurrent writer may be mid-append
+        complete = data[: data.rfind(b"\n") + 1]
+        for line in complete.decode("ascii").splitlines():
+            self._index.setdefault(line, self._row_count)
+            self._row_count += 1
+        self._keys_offset += len(complete)
+        self._matrix = None
+
+    def _rows(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(self._row_count, self.dim)
+            )
+        return self._matrix
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        if any(key not in self._index for key in keys):
+            self._refresh()
+        if not self._index:
+            return [None] * len(keys)
+        matrix = self._rows()
+        return [matrix[self._index[key]].tolist() if key in self._index else None for key in keys]
+
+    def put_many(self, keys: List[str], embeddings: List[List[float]]):
+        if not keys:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with open(self._lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    with open(self._meta_path, "w", encoding="utf-8") as f:
+                        json.dump({"dim": self.dim}, f)
+                fresh = [i for i, key in enumerate(keys) if key not in self._index]
+                fresh = list({keys[i]: i for i in fresh}.values())  # drop in-batch duplicates
+                if not fresh:
+                    return
+                # Vectors first, then keys: a key on disk always has its row behind it
+                with open(self._vectors_path, "ab") as f:
+                    f.write(vectors[fresh].tobytes())
+                with open(self._keys_path, "a", encoding="ascii") as f:
+                    f.write("".join(keys[i] + "\n" for i in fresh))
+                self._refresh()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return len(self._index)
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Wraps an embed model with a content-hash cache.
+
+    Query embeddings go through an in-process LRU; both queries and chunk texts are also kept in
+    an `EmbeddingStore`, so re-ingesting unchanged text or re-running an eval skips the model.
+    `inner` may be a zero-argument factory: the model is then only built on the first cache miss.
+    """
+
+    _inner: Any = PrivateAttr(default=None)
+    _factory: Any = PrivateAttr(default=None)
+    _build_lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _store: Optional[EmbeddingStore] = PrivateAttr(default=None)
+    _query_cache: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _query_cache_size: int = PrivateAttr(default=EMBED_QUERY_CACHE_SIZE)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(self, inner: Union[BaseEmbedding, Callable[[], BaseEmbedding]],
+                 store: Optional[EmbeddingStore] = None, query_cache_size: int = EMBED_QUERY_CACHE_SIZE,
+                 **kwargs):
+        # A factory needs `model_name` (it keys the cache) and `embed_batch_size` passed in
+        if isinstance(inner, BaseEmbedding):
+            kwargs.setdefault("model_name", inner.model_name)
+            kwargs.setdefault("embed_batch_size", inner.embed_batch_size)
+        elif not kwargs.get("model_name"):
+            raise ValueError("CachedEmbedding over a model factory needs the model_name")
+        super().__init__(**kwargs)
+        if isinstance(inner, BaseEmbedding):
+            self._inner = inner
+        else:
+            self._factory = inner
+        self._store = store
+        self._query_cache_size = query_cache_size
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @classmethod
+    def with_disk_store(cls, inner: Union[BaseEmbedding, Callable[[], BaseEmbedding]],
+                        **kwargs) -> "CachedEmbedding":
+        model_name = kwargs["model_name"] if "model_name" in kwargs else inner.model_name
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        return cls(inner, store=EmbeddingStore(os.path.join(CACHE_DIR, "embeddings", safe_name)), **kwargs)
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        if self._inner is None:
+            with self._build_lock:
+                if self._inner is None:
+                    self._inner = self._factory()
+        return self._inner
+
+    @property
+    def built(self) -> bool:
+        return self._inner is not None
+
+    def stats(self) -> dict:
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "query_lru_entries": len(self._query_cache),
+            "disk_entries": len(self._store) if self._store is not None else 0,
+        }
+
+    # --- lookups -----------------------------------------------------------------
+
+    def _lookup(self, kind: str, texts: List[str]):
+        keys = [embedding_key(self.model_name, kind, t) for t in texts]
+        found: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            if kind == "query":
+                for i, key in enumerate(keys):
+                    if key in self._query_cache:
+                        self._query_cache.move_to_end(key)
+                        found[i] = self._query_cache[key]
+            missing = [i for i, v in enumerate(found) if v is None]
+            if self._store is not None and missing:
+                for i, vec in zip(missing, self._store.get_many([keys[i] for i in missing])):
+                    found[i] = vec
+            hits = sum(v is not None for v in found)
+            self._hits += hits
+            self._misses += len(texts) - hits
+        return keys, found
+
+    def _remember(self, kind: str, keys: List[str], embeddings: List[List[float]]):
+        with self._lock:
+            if kind == "query":
+                for key, vec in zip(keys, embeddings):
+                    self._query_cache[key] = vec
+                    self._query_cache.move_to_end(key)
+                while len(self._query_cache) > self._query_cache_size:
+                    self._query_cache.popitem(last=False)
+            if self._store is not None:
+                self._store.put_many(keys, embeddings)
+
+    def _fill(self, kind: str, keys, found, missing, computed):
+        self._remember(kind, [keys[i] for i in missing], computed)
+        for i, vec in zip(missing, computed):
+            found[i] = vec
+        return found
+
+    # --- BaseEmbedding interface ----------------------------------------------------
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        keys, found = self._lookup("query", [query])
+        if found[0] is None:
+            self._fill("query", keys, found, [0], [self.inner.get_query_embedding(query)])
+        return found[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        keys, found = self._lookup("query", [query])
+        if found[0] is None:
+            self._fill("query", keys, found, [0], [await self.inner.aget_query_embedding(query)])
+        return found[0]
+
+    def _get_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        keys, found = self._lookup("query", queries)
+        missing = [i for i, v in enumerate(found) if v is None]
+        if missing:
+            computed = embed_queries(self.inner, [queries[i] for i in missing])
+            self._fill("query", keys, found, missing, computed)
+        return found
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, found = self._lookup("text", texts)
+        missing = [i for i, v in enumerate(found) if v is None]
+        if missing:
+            computed = self.inner.get_text_embedding_batch([texts[i] for i in missing])
+            self._fill("text", keys, found, missing, computed)
+        return found
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, found = self._lookup("text", texts)
+        missing = [i for i, v in enumerate(found) if v is None]
+        if missing:
+            computed = await self.inner.aget_text_embedding_batch([texts[i] for i in missing])
+            self._fill("text", keys, found, missing, computed)
+        return found
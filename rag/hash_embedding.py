@@ -0,0 +1,47 @@
+import hashlib
+import re
+from typing import List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import Field
+
+_TOKEN = re.compile(r"\w+")
+
+
+class HashEmbedding(BaseEmbedding):
+    """Deterministic, model-free embeddings: signed feature hashing of lowercase words and word
+    bigrams, L2-normalised. Texts sharing words land close together, so retrieval still behaves
+    sensibly, but the cost is microseconds and the result is identical on every machine."""
+
+    dim: int = Field(default=384, gt=0)
+
+    def __init__(self, dim: int = 384, **kwargs):
+        kwargs.setdefault("model_name", f"hash-{dim}")
+        super().__init__(dim=dim, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _vector(self, text: str) -> List[float]:
+        words = _TOKEN.findall(text.lower())
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
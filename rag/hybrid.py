@@ -0,0 +1,223 @@
+import asyncio
+import re
+import threading
+from typing import List, Optional, Tuple
+
+from llama_index.core import Settings
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+from rag import ann_index
+from rag.concurrency import run_sync
+from rag.corpora import CORPUS_KEY, CorpusRouter, corpus_filter
+from rag.db import connection
+from rag.settings import (
+    RETRIEVAL_MODE,
+    ROUTING_MODE,
+    RRF_K,
+    SIMILARITY_TOP_K,
+    TEXT_CANDIDATES,
+    TEXT_SEARCH_CONFIG,
+    VECTOR_BACKEND,
+    VECTOR_CANDIDATES,
+    VECTOR_TABLE,
+)
+
+TABLE = f"data_{VECTOR_TABLE}"
+TSV_COLUMN = "text_search_tsv"
+
+
+def ensure_text_search(config: str = TEXT_SEARCH_CONFIG):
+    """Add the generated tsvector column + GIN index to an existing vector table (idempotent)."""
+    if not re.fullmatch(r"\w+", config):
+        raise ValueError(f"Invalid text search config: {config}")
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (TABLE,))
+        if cur.fetchone()[0] is None:
+            return  # created on first ingest; call again afterwards
+        cur.execute(
+            f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS {TSV_COLUMN} tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('{config}', text)) STORED"
+        )
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_{TSV_COLUMN}_idx ON {TABLE} USING gin ({TSV_COLUMN})")
+
+
+def to_websearch_query(question: str) -> str:
+    # OR the terms together: natural questions rarely contain every word of the passage.
+    # Terms keep inner dots/dashes so IDs like "T5.2.1" or "10/2020" survive intact.
+    terms = [t.rstrip(".-/") for t in re.findall(r"\w[\w./-]*", question)]
+    return " OR ".join(t for t in terms if t)
+
+
+class PostgresTextRetriever(BaseRetriever):
+    """Lexical retriever over the vector table's full-text column, ranked by ts_rank_cd."""
+
+    def __init__(self, top_k: int = TEXT_CANDIDATES, config: str = TEXT_SEARCH_CONFIG,
+                 corpora: Tuple[str, ...] = None):
+        super().__init__()
+        self.top_k = top_k
+        self.config = config
+        self.corpora = corpora
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        query = to_websearch_query(query_bundle.query_str)
+        if not query:
+            return []
+        corpus_clause, params = "", [self.config, query]
+        if self.corpora:
+            corpus_clause = f"AND metadata_->>'{CORPUS_KEY}' = ANY(%s)"
+            params.append(list(self.corpora))
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT text, metadata_, ts_rank_cd({TSV_COLUMN}, q) AS rank
+                FROM {TABLE}, websearch_to_tsquery(%s::regconfig, %s) q
+                WHERE {TSV_COLUMN} @@ q {corpus_clause}
+                ORDER BY rank DESC
+                LIMIT %s
+                """,
+                (*params, self.top_k),
+            )
+            rows = cur.fetchall()
+        results = []
+        for text, metadata, rank in rows:
+            node = metadata_dict_to_node(metadata)
+            node.set_content(text)
+            results.append(NodeWithScore(node=node, score=float(rank)))
+        return results
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return await run_sync(self._retrieve, query_bundle)
+
+
+class HybridRetriever(BaseRetriever):
+    """Runs several retrievers concurrently and fuses their rankings with reciprocal rank fusion."""
+
+    def __init__(self, retrievers, top_k: int = SIMILARITY_TOP_K, rrf_k: int = RRF_K):
+        super().__init__()
+        self.retrievers = retrievers
+        self.top_k = top_k
+        self.rrf_k = rrf_k
+
+    def _fuse(self, rankings: List[List[NodeWithScore]]) -> List[NodeWithScore]:
+        scores, nodes = {}, {}
+        for ranking in rankings:
+            for rank, result in enumerate(ranking, 1):
+                node_id = result.node.node_id
+                scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (self.rrf_k + rank)
+                nodes.setdefault(node_id, result.node)
+        fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)[: self.top_k]
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in fused]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._fuse([r.retrieve(query_bundle) for r in self.retrievers])
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        rankings = await asyncio.gather(*(r.aretrieve(query_bundle) for r in self.retrievers))
+        return self._fuse(list(rankings))
+
+
+class MergedRetriever(BaseRetriever):
+    """Runs one retriever per corpus concurrently and merges their results by score.
+
+    Scores are comparable across corpora: every part uses the same ranking function.
+    """
+
+    def __init__(self, retrievers, top_k: int = SIMILARITY_TOP_K):
+        super().__init__()
+        self.retrievers = retrievers
+        self.top_k = top_k
+
+    def _merge(self, rankings: List[List[NodeWithScore]]) -> List[NodeWithScore]:
+        best = {}
+        for ranking in rankings:
+            for result in ranking:
+                seen = best.get(result.node.node_id)
+                if seen is None or (result.score or 0.0) > (seen.score or 0.0):
+                    best[result.node.node_id] = result
+        return sorted(best.values(), key=lambda r: r.score or 0.0, reverse=True)[: self.top_k]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._merge([r.retrieve(query_bundle) for r in self.retrievers])
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        rankings = await asyncio.gather(*(r.aretrieve(query_bundle) for r in self.retrievers))
+        return self._merge(list(rankings))
+
+
+class RoutedRetriever(BaseRetriever):
+    """Asks the corpus router which corpora to search, then runs a retriever restricted to them.
+
+    `build(corpora)` makes the retriever for a sorted tuple of corpora (None = everything);
+    they are built once per combination and reused.
+    """
+
+    def __init__(self, router: CorpusRouter, build):
+        super().__init__()
+        self.router = router
+        self.build = build
+        self._retrievers = {}
+        self._lock = threading.Lock()
+
+    def _for(self, corpora: Optional[Tuple[str, ...]]) -> BaseRetriever:
+        with self._lock:
+            if corpora not in self._retrievers:
+                self._retrievers[corpora] = self.build(corpora)
+            return self._retrievers[corpora]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if self.router.needs_embedding and query_bundle.embedding is None:
+            # Computed once here; the dense retriever reuses it
+            query_bundle.embedding = Settings.embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+        return self._for(self.router.route(query_bundle)).retrieve(query_bundle)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if self.router.needs_embedding and query_bundle.embedding is None:
+            query_bundle.embedding = await Settings.embed_model.aget_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        return await self._for(self.router.route(query_bundle)).aretrieve(query_bundle)
+
+
+def _vector_retriever(index, top_k: int, corpus: str = None):
+    # One filtered ANN search per corpus: `metadata_->>'corpus' = '<c>'` matches that corpus's
+    # partial HNSW index (see ann_index.ensure_corpus_indexes)
+    return index.as_retriever(
+        similarity_top_k=top_k,
+        filters=corpus_filter(corpus) if corpus else None,
+        vector_store_kwargs=ann_index.query_kwargs(),
+    )
+
+
+def _dense(index, top_k: int, corpora: Tuple[str, ...] = None):
+    if not corpora:
+        return _vector_retriever(index, top_k)
+    if len(corpora) == 1:
+        return _vector_retriever(index, top_k, corpora[0])
+    return MergedRetriever([_vector_retriever(index, top_k, c) for c in corpora], top_k=top_k)
+
+
+def build_retriever(index, similarity_top_k: int = SIMILARITY_TOP_K, mode: str = RETRIEVAL_MODE,
+                    vector_candidates: int = VECTOR_CANDIDATES, text_candidates: int = TEXT_CANDIDATES,
+                    routing: str = ROUTING_MODE):
+    """Dense retriever, or dense + lexical fused by RRF when `mode` is "hybrid".
+
+    Unless `routing` is "off", each question is first routed to its corpora and only those are searched.
+    """
+    if mode == "hybrid" and VECTOR_BACKEND != "postgres":
+        print("⚠️ Hybrid retrieval needs Postgres full-text search; using dense retrieval only.")
+        mode = "dense"
+
+    def build(corpora: Tuple[str, ...] = None):
+        if mode != "hybrid":
+            return _dense(index, similarity_top_k, corpora)
+        vector = _dense(index, vector_candidates, corpora)
+        text = PostgresTextRetriever(top_k=text_candidates, corpora=corpora)
+        return HybridRetriever([vector, text], top_k=similarity_top_k)
+
+    if routing == "off":
+        return build()
+    router = CorpusRouter.from_store(routing)
+    print(f"🧭 Corpus routing: {routing} ({len(router.centroids)} centroids).")
+    return RoutedRetriever(router, build)
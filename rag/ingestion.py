@@ -0,0 +1,360 @@
+import csv
+import io
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.readers import SimpleDirectoryReader
+from llama_index.core.schema import Document, MetadataMode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+from rag.answer_cache import bump_index_version
+from rag.contextualize import ChunkContextualizer
+from rag.corpora import CORPORA, CORPUS_KEY, DEFAULT_CORPUS, corpus_of
+from rag.db import connection
+from rag.manifest import file_hash
+from rag.packing import chunk_body
+from rag.settings import (
+    CHUNK_CONTEXT_DOC_CHARS,
+    CHUNK_CONTEXT_MODE,
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    INGEST_EMBED_BATCH,
+    INGEST_SECTION_CHARS,
+    INGEST_STREAM_MIN_BYTES,
+    INGEST_STREAMING,
+    INGEST_WORKERS,
+    INGEST_WRITE_BATCH,
+    INGEST_WRITE_MODE,
+    VECTOR_BACKEND,
+    VECTOR_TABLE,
+    Settings,
+    init_settings,
+    init_vector_store,
+)
+
+
+def make_contextual_text(node, doc_title=None):
+    corpus = CORPORA.get(node.metadata.get(CORPUS_KEY), CORPORA[DEFAULT_CORPUS])
+    doc_title = doc_title or node.metadata.get("doc_name") or corpus["title"]
+    section_path = " > ".join([str(v) for k, v in node.metadata.items() if "header" in k.lower() or "section" in k.lower()])
+    section_path = section_path or node.metadata.get("file_name", "Unknown Section")
+    head = (
+        f"[DOC_TITLE] {doc_title}\n"
+        f"[SECTION_PATH] {section_path}\n"
+        f"[INTENT] {corpus['intent']}\n"
+        f"[CHUNK]\n"
+    )
+    return head + node.text
+
+
+def make_llm_contextual_text(node, doc_title, context):
+    head = (
+        f"[DOC_TITLE] {doc_title}\n"
+        f"[CONTEXT] {context}\n"
+        f"[CHUNK]\n"
+    )
+    return head + chunk_body(node)
+
+
+# SimpleDirectoryReader's defaults: file_path stays in the embedded and LLM text, these don't
+_READER_EXCLUDED_KEYS = [
+    "file_name", "file_type", "file_size", "creation_date", "last_modified_date", "last_accessed_date",
+]
+
+
+def _section(text, metadata):
+    return Document(
+        text=text,
+        metadata=metadata,
+        excluded_embed_metadata_keys=list(_READER_EXCLUDED_KEYS),
+        excluded_llm_metadata_keys=list(_READER_EXCLUDED_KEYS),
+    )
+
+
+def iter_sections(file_path, section_chars=INGEST_SECTION_CHARS, stream=True):
+    """Yield a file as Documents, one PDF page or ~`section_chars` of text at a time.
+
+    With `stream=False` the file is loaded by SimpleDirectoryReader in one go, as before
+    streaming existed; streamed PDFs are read with pypdfium2 instead, whose text extraction
+    differs slightly from the reader's pypdf."""
+    base = {"file_name": os.path.basename(file_path), "file_path": file_path}
+    ext = os.path.splitext(file_path)[1].lower()
+    if not stream:
+        yield from SimpleDirectoryReader(input_files=[file_path]).load_data()
+    elif ext == ".pdf":
+        import pypdfium2 as pdfium
+
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            for i in range(len(pdf)):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                try:
+                    text = textpage.get_text_range()
+                finally:
+                    textpage.close()
+                    page.close()
+                if text.strip():
+                    yield _section(text, {**base, "page_label": str(i + 1)})
+        finally:
+            pdf.close()
+    elif ext in (".txt", ".md"):
+        with open(file_path, encoding="utf-8", errors="replace") as f:
+            lines, size = [], 0
+            for line in f:
+                lines.append(line)
+                size += len(line)
+                # Cut at a paragraph break once the section is full (hard cap at twice the size)
+                if size >= section_chars and (not line.strip() or size >= 2 * section_chars):
+                    yield _section("".join(lines), base)
+                    lines, size = [], 0
+            if lines:
+                yield _section("".join(lines), base)
+    else:
+        # No incremental reader for this format (docx, html, ...): it loads in one go
+        yield from SimpleDirectoryReader(input_files=[file_path]).load_data()
+
+
+def iter_nodes(file_path, with_header=True, stream=True):
+    """Split a file section by section. The contextual header is written into `text` (what is
+    embedded, full-text indexed and reranked); the original chunk is recoverable with
+    `chunk_body`, so it is no longer duplicated into metadata."""
+    doc_name = os.path.basename(file_path)
+    corpus = corpus_of(doc_name)
+    splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    for section in iter_sections(file_path, stream=stream):
+        for node in splitter.get_nodes_from_documents([section]):
+            node.metadata["doc_name"] = doc_name
+            # A filter key only: kept out of the embedded text and the prompt
+            node.metadata[CORPUS_KEY] = corpus
+            node.excluded_embed_metadata_keys = [*node.excluded_embed_metadata_keys, CORPUS_KEY]
+            node.excluded_llm_metadata_keys = [*node.excluded_llm_metadata_keys, CORPUS_KEY]
+            if with_header:
+                node.text = make_contextual_text(node, doc_name)  # Pass doc_name as doc_title
+            yield node
+
+
+def document_head(file_path, chars=CHUNK_CONTEXT_DOC_CHARS, stream=True):
+    """The first `chars` characters of the document: the prefix the LLM contextualizer sees."""
+    parts, size = [], 0
+    for section in iter_sections(file_path, stream=stream):
+        parts.append(section.text)
+        size += len(section.text) + 2
+        if size >= chars:
+            break
+    return "\n\n".join(parts)[:chars]
+
+
+def parse_file(file_path, with_header=True):
+    """Split one file in memory. Runs in a worker process, so no models here.
+
+    Without the template header (LLM context mode) the document head is returned as well."""
+    nodes = list(iter_nodes(file_path, with_header, stream=False))
+    head = "" if with_header else document_head(file_path, stream=False)
+    return file_path, nodes, head
+
+
+def should_stream(file_path, mode=INGEST_STREAMING, min_bytes=INGEST_STREAM_MIN_BYTES):
+    if mode in ("always", "never"):
+        return mode == "always"
+    return os.path.getsize(file_path) >= min_bytes
+
+
+@dataclass
+class IngestStats:
+    docs: int = 0
+    chunks: int = 0
+    embeddings: int = 0  # chunks that actually went through the model (cache misses)
+    parse_seconds: float = 0.0
+    embed_seconds: float = 0.0
+    write_seconds: float = 0.0
+    context_seconds: float = 0.0
+    started: float = field(default_factory=time.perf_counter)
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "docs": self.docs,
+            "chunks": self.chunks,
+            "embeddings": self.embeddings,
+            "elapsed_s": round(elapsed, 2),
+            "docs_per_s": round(self.docs / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_s": round(self.chunks / elapsed, 2) if elapsed else 0.0,
+            "embeddings_per_s": round(self.embeddings / self.embed_seconds, 2) if self.embed_seconds else 0.0,
+            "embed_s": round(self.embed_seconds, 2),
+            "write_s": round(self.write_seconds, 2),
+            "context_s": round(self.context_seconds, 2),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+
+
+class IngestionEngine:
+    """Loads models once, parses files in a process pool, embeds in large batches and bulk-writes.
+
+    Parsing of the next files overlaps with embedding/writing of the ones already parsed.
+    Large files are streamed instead: read a section at a time, each embed batch written before
+    the next is read, so memory is bounded by the batch size rather than the document size.
+    """
+
+    def __init__(
+        self,
+        workers: int = INGEST_WORKERS,
+        embed_batch: int = INGEST_EMBED_BATCH,
+        write_batch: int = INGEST_WRITE_BATCH,
+        write_mode: str = INGEST_WRITE_MODE,
+        context_mode: str = CHUNK_CONTEXT_MODE,
+        streaming: str = INGEST_STREAMING,
+    ):
+        init_settings()
+        self.embed_model = Settings.embed_model
+        self.vector_store = init_vector_store()
+        self.workers = workers
+        self.embed_batch = embed_batch
+        self.write_batch = write_batch
+        self.write_mode = write_mode
+        self.contextualizer = ChunkContextualizer() if context_mode == "llm" else None
+        self.streaming = streaming
+        self.stats = IngestStats()
+        self._manifest = None
+        self._hashes = {}
+        self._pending = []
+
+    def ingest_files(self, files, manifest=None, hashes=None):
+        """Ingest `files`; with a `manifest`, each document's previous chunks are replaced."""
+        self._manifest = manifest
+        self._hashes = hashes or {}
+        if not files:
+            return self.stats.report()
+        with_header = self.contextualizer is None
+        streamed = [f for f in files if should_stream(f, self.streaming)]
+        in_memory = [f for f in files if f not in streamed]
+        done = 0
+        if self.workers > 1 and len(in_memory) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(parse_file, f, with_header) for f in in_memory]
+                for future in as_completed(futures):
+                    done += 1
+                    self._ingest_parsed(*future.result(), position=f"{done}/{len(files)}")
+        else:
+            for file_path in in_memory:
+                done += 1
+                start = time.perf_counter()
+                parsed = parse_file(file_path, with_header)
+                self.stats.parse_seconds += time.perf_counter() - start
+                self._ingest_parsed(*parsed, position=f"{done}/{len(files)}")
+        # One at a time in this process: the point is to never hold a whole document
+        for file_path in streamed:
+            done += 1
+            self._ingest_stream(file_path, position=f"{done}/{len(files)}")
+
+        if VECTOR_BACKEND == "numpy":
+            self.vector_store.persist()  # one snapshot per run, with the manifest
+        bump_index_version()  # cached answers may now be stale
+        report = self.stats.report()
+        print(f"📊 Ingest throughput: {json.dumps(report)}")
+        return report
+
+    def _ingest_parsed(self, file_path, nodes, head, position=""):
+        if not nodes:
+            print(f"⚠️ No documents found in {file_path}")
+            return
+        doc_name = os.path.basename(file_path)
+        for start in range(0, len(nodes), self.embed_batch):
+            self._process(nodes[start:start + self.embed_batch], doc_name, head)
+        self._finish(file_path, [node.node_id for node in nodes], position)
+
+    def _ingest_stream(self, file_path, position=""):
+        doc_name = os.path.basename(file_path)
+        head = "" if self.contextualizer is None else document_head(file_path)
+        node_ids, batch = [], []
+        start = time.perf_counter()
+        for node in iter_nodes(file_path, with_header=self.contextualizer is None):
+            batch.append(node)
+            if len(batch) >= self.embed_batch:
+                self.stats.parse_seconds += time.perf_counter() - start
+                node_ids += [n.node_id for n in batch]
+                self._process(batch, doc_name, head)
+                batch = []
+                start = time.perf_counter()
+        self.stats.parse_seconds += time.perf_counter() - start
+        if batch:
+            node_ids += [n.node_id for n in batch]
+            self._process(batch, doc_name, head)
+        if not node_ids:
+            print(f"⚠️ No documents found in {file_path}")
+            return
+        self._finish(file_path, node_ids, position)
+
+    def _process(self, nodes, doc_name, head):
+        """Contextualize and embed one batch, then queue it for writing."""
+        if self.contextualizer is not None:
+            start = time.perf_counter()
+            contexts = self.contextualizer.contextualize(head, [chunk_body(node) for node in nodes])
+            for node, context in zip(nodes, contexts):
+                node.text = make_llm_contextual_text(node, doc_name, context)
+            self.stats.context_seconds += time.perf_counter() - start
+        self._embed(nodes)
+        self._pending += nodes
+        while len(self._pending) >= self.write_batch:
+            self._write(self._pending[:self.write_batch])
+            self._pending = self._pending[self.write_batch:]
+
+    def _finish(self, file_path, node_ids, position):
+        if self._pending:
+            self._write(self._pending)
+            self._pending = []
+        # Only after every new row is written: stale chunks are dropped last
+        if self._manifest is not None:
+            digest = self._hashes.get(file_path) or file_hash(file_path)
+            self._manifest.replace_document(file_path, digest, node_ids)
+        self.stats.docs += 1
+        self.stats.chunks += len(node_ids)
+        print(f"✅ [{position}] Ingested {len(node_ids)} nodes from '{os.path.basename(file_path)}' and stored in DB.")
+
+    def _embed(self, nodes):
+        misses_before = self._cache_misses()
+        start = time.perf_counter()
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        embeddings = self.embed_model.get_text_embedding_batch(texts)
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+        self.stats.embed_seconds += time.perf_counter() - start
+        misses = self._cache_misses()
+        self.stats.embeddings += (misses - misses_before) if misses is not None else len(nodes)
+
+    def _cache_misses(self):
+        stats = getattr(self.embed_model, "stats", None)
+        return stats()["misses"] if stats else None
+
+    def _write(self, nodes):
+        start = time.perf_counter()
+        if self.write_mode == "copy" and VECTOR_BACKEND == "postgres":
+            self._copy_rows(nodes)
+        else:
+            # SQLAlchemy 2 batches these into multi-row INSERT ... VALUES statements
+            self.vector_store.add(nodes)
+        self.stats.write_seconds += time.perf_counter() - start
+
+    def _copy_rows(self, nodes):
+        """COPY rows straight into the PGVectorStore table (same columns it writes itself)."""
+        self.vector_store.add([])  # creates the table/extension on first use
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for node in nodes:
+            writer.writerow([
+                node.node_id,
+                node.get_content(metadata_mode=MetadataMode.NONE),
+                json.dumps(node_to_metadata_dict(node, remove_text=True, flat_metadata=False)),
+                "[" + ",".join(repr(float(x)) for x in node.embedding) + "]",
+            ])
+        buf.seek(0)
+        with connection() as conn, conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY data_{VECTOR_TABLE} (node_id, text, metadata_, embedding) FROM STDIN WITH (FORMAT csv)",
+                buf,
+            )
@@ -0,0 +1,474 @@
+import asyncio
+import hashlib
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Iterator, List, Optional, Sequence
+
+import httpx
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+
+from rag.concurrency import QueueFullError
+from rag.settings import (
+    LLM_COALESCE,
+    LLM_HEALTH_INTERVAL,
+    LLM_MAX_QUEUED,
+    LLM_QUEUE_TIMEOUT,
+    LLM_REQUEST_TIMEOUT,
+    OLLAMA_BASE_URLS,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_MODEL,
+    OLLAMA_NUM_BATCH,
+    OLLAMA_NUM_CTX,
+    OLLAMA_NUM_PARALLEL,
+)
+
+_END = object()
+
+
+class LLMUnavailableError(QueueFullError):
+    """No Ollama endpoint slot within LLM_QUEUE_TIMEOUT (or the wait queue is full)."""
+
+
+class Endpoint:
+    def __init__(self, url: str, parallel: int):
+        self.url = url.rstrip("/")
+        self.parallel = parallel
+        self.in_flight = 0
+        self.healthy = True
+        self.requests = 0
+        self.failures = 0
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "parallel": self.parallel,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class _SharedStream:
+    """One upstream stream fanned out to every request that asked for the same prompt."""
+
+    def __init__(self):
+        self.chunks: List[dict] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+def _key(path: str, payload: dict) -> str:
+    return hashlib.sha256((path + json.dumps(payload, sort_keys=True)).encode("utf-8")).hexdigest()
+
+
+class LLMGateway:
+    """Every Ollama call in the app goes through here.
+
+    The gateway owns one event loop in a background thread, and with it one keep-alive
+    httpx pool. Any thread or event loop can call in: async callers await a future, sync
+    callers (CrewAI, sync LlamaIndex paths) block on one. Requests go to the healthy
+    endpoint with the fewest in-flight calls, capped at `parallel` per endpoint. Past that
+    they queue for up to `queue_timeout`. Identical in-flight prompts share one upstream
+    request; for streams, late joiners replay the chunks already received.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str] = OLLAMA_BASE_URLS,
+        parallel: int = OLLAMA_NUM_PARALLEL,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        max_queued: int = LLM_MAX_QUEUED,
+        request_timeout: float = LLM_REQUEST_TIMEOUT,
+        health_interval: float = LLM_HEALTH_INTERVAL,
+        coalesce: bool = LLM_COALESCE,
+    ):
+        self.endpoints = [Endpoint(url, parallel) for url in urls]
+        self.queue_timeout = queue_timeout
+        self.max_queued = max_queued
+        self.request_timeout = request_timeout
+        self.health_interval = health_interval
+        self.coalesce = coalesce
+        self.waiting = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._streams = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._start_lock = threading.Lock()
+
+    # --- gateway loop -------------------------------------------------------------------
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True).start()
+                    asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                    self._loop = loop
+        return self._loop
+
+    async def _setup(self):
+        total = sum(e.parallel for e in self.endpoints)
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.request_timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=total, max_keepalive_connections=total, keepalive_expiry=300),
+        )
+        self._changed = asyncio.Condition()
+        if self.health_interval > 0:
+            asyncio.get_running_loop().create_task(self._health_loop())
+
+    def _submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(self._check(e) for e in self.endpoints))
+
+    async def _check(self, endpoint: Endpoint):
+        try:
+            resp = await self._client.get(f"{endpoint.url}/api/tags", timeout=5.0)
+            healthy = resp.status_code == 200
+        except httpx.HTTPError:
+            healthy = False
+        if healthy != endpoint.healthy:
+            endpoint.healthy = healthy
+            print(f"{'✅' if healthy else '⚠️'} Ollama endpoint {endpoint.url} is {'up' if healthy else 'down'}.")
+            await self._notify()
+
+    async def _acquire(self, exclude=()) -> Endpoint:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        while True:
+            free = [e for e in self.endpoints if e.healthy and e.in_flight < e.parallel and e not in exclude]
+            if free:
+                endpoint = min(free, key=lambda e: e.in_flight / e.parallel)
+                endpoint.in_flight += 1
+                endpoint.requests += 1
+                return endpoint
+            if self.waiting >= self.max_queued:
+                raise LLMUnavailableError(f"{self.waiting} LLM requests already queued")
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise LLMUnavailableError(f"no Ollama slot freed up within {self.queue_timeout}s")
+            self.waiting += 1
+            try:
+                async with self._changed:
+                    await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.waiting -= 1
+
+    async def _release(self, endpoint: Endpoint):
+        endpoint.in_flight -= 1
+        await self._notify()
+
+    async def _failed(self, endpoint: Endpoint):
+        # Connection-level failure: take it out of rotation until the health check sees it again
+        endpoint.failures += 1
+        if self.health_interval > 0:
+            endpoint.healthy = False
+            await self._notify()
+
+    async def _post(self, path: str, payload: dict) -> dict:
+        tried = []
+        while True:
+            endpoint = await self._acquire(exclude=tried)
+            try:
+                resp = await self._client.post(f"{endpoint.url}{path}", json={**payload, "stream": False})
+                resp.raise_for_status()
+                return resp.json()
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                await self._failed(endpoint)
+                tried.append(endpoint)
+                if len(tried) >= len(self.endpoints):
+                    raise
+            finally:
+                await self._release(endpoint)
+
+    async def _request(self, path: str, payload: dict) -> dict:
+        if not self.coalesce:
+            return await self._post(path, payload)
+        key = _key(path, payload)
+        shared = self._inflight.get(key)
+        if shared is not None:
+            self.coalesced += 1
+            return await asyncio.shield(shared)
+        shared = self._inflight[key] = asyncio.get_running_loop().create_task(self._post(path, payload))
+        try:
+            return await asyncio.shield(shared)
+        finally:
+            if shared.done():
+                self._inflight.pop(key, None)
+            else:
+                shared.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+    async def _upstream(self, shared: _SharedStream, path: str, payload: dict):
+        tried = []
+        try:
+            while True:
+                endpoint = await self._acquire(exclude=tried)
+                try:
+                    async with self._client.stream("POST", f"{endpoint.url}{path}", json={**payload, "stream": True}) as resp:
+                        resp.raise_for_status()
+                        async for line in resp.aiter_lines():
+                            if line.strip():
+                                async with shared.changed:
+                                    shared.chunks.append(json.loads(line))
+                                    shared.changed.notify_all()
+                    return
+                except (httpx.ConnectError, httpx.ConnectTimeout):
+                    await self._failed(endpoint)
+                    tried.append(endpoint)
+                    if shared.chunks or len(tried) >= len(self.endpoints):
+                        raise
+                finally:
+                    await self._release(endpoint)
+        except BaseException as e:
+            shared.error = e
+            raise
+        finally:
+            async with shared.changed:
+                shared.done = True
+                shared.changed.notify_all()
+
+    async def _stream_into(self, path: str, payload: dict, sink):
+        key = _key(path, payload) if self.coalesce else None
+        shared = self._streams.get(key) if key else None
+        if shared is None:
+            shared = _SharedStream()
+            if key:
+                self._streams[key] = shared
+            shared.task = asyncio.get_running_loop().create_task(self._upstream(shared, path, payload))
+            if key:
+                shared.task.add_done_callback(lambda _: self._streams.pop(key, None))
+        else:
+            self.coalesced += 1
+        shared.subscribers += 1
+        sent = 0
+        try:
+            while True:
+                async with shared.changed:
+                    await shared.changed.wait_for(lambda: len(shared.chunks) > sent or shared.done)
+                    new, done, error = shared.chunks[sent:], shared.done, shared.error
+                for chunk in new:
+                    sink(chunk)
+                sent += len(new)
+                if done:
+                    sink(error if error is not None else _END)
+                    return
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.done:
+                shared.task.cancel()  # nobody is listening any more
+
+    # --- public API (any thread, any loop) ----------------------------------------------------
+
+    def post(self, path: str, payload: dict) -> dict:
+        return self._submit(self._request(path, payload)).result()
+
+    async def apost(self, path: str, payload: dict) -> dict:
+        return await asyncio.wrap_future(self._submit(self._request(path, payload)))
+
+    def stream(self, path: str, payload: dict) -> Iterator[dict]:
+        chunks: "queue.Queue" = queue.Queue()
+        future = self._submit(self._stream_into(path, payload, chunks.put))
+        try:
+            while (chunk := chunks.get()) is not _END:
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+        finally:
+            future.cancel()
+
+    async def astream(self, path: str, payload: dict) -> AsyncIterator[dict]:
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        future = self._submit(self._stream_into(path, payload, lambda c: loop.call_soon_threadsafe(chunks.put_nowait, c)))
+        try:
+            while (chunk := await chunks.get()) is not _END:
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+        finally:
+            future.cancel()
+
+    async def awarm(self, model: str = OLLAMA_MODEL):
+        """Load `model` on every endpoint (a generate call without a prompt only loads it)."""
+        async def warm(endpoint: Endpoint):
+            resp = await self._client.post(
+                f"{endpoint.url}/api/generate", json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE}, timeout=300.0
+            )
+            resp.raise_for_status()
+
+        async def warm_all():
+            await asyncio.gather(*(warm(e) for e in self.endpoints))
+
+        await asyncio.wrap_future(self._submit(warm_all()))
+
+    def status(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "coalesced": self.coalesced,
+            "endpoints": [e.status() for e in self.endpoints],
+        }
+
+    def stats(self) -> dict:
+        """Flat numbers for /metrics."""
+        return {
+            "waiting": self.waiting,
+            "coalesced": self.coalesced,
+            "in_flight": sum(e.in_flight for e in self.endpoints),
+            "healthy_endpoints": sum(e.healthy for e in self.endpoints),
+            "endpoints": len(self.endpoints),
+            "failures": sum(e.failures for e in self.endpoints),
+        }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
+
+
+def default_options(**overrides) -> dict:
+    return {"num_ctx": OLLAMA_NUM_CTX, "num_batch": OLLAMA_NUM_BATCH, **overrides}
+
+
+def _messages(messages: Sequence[ChatMessage]) -> List[dict]:
+    return [{"role": m.role.value, "content": m.content or ""} for m in messages]
+
+
+class GatewayLLM(CustomLLM):
+    """LlamaIndex LLM for Ollama, routed through the shared LLMGateway."""
+
+    model: str = Field(default=OLLAMA_MODEL)
+    options: dict = Field(default_factory=default_options)
+    keep_alive: str = Field(default=OLLAMA_KEEP_ALIVE)
+    num_output: int = Field(default=512)
+    _gateway: Any = PrivateAttr()
+
+    def __init__(self, gateway: Optional[LLMGateway] = None, **kwargs):
+        super().__init__(**kwargs)
+        self._gateway = gateway or get_gateway()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "GatewayLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.options.get("num_ctx", OLLAMA_NUM_CTX),
+            num_output=self.num_output,
+            model_name=self.model,
+            is_chat_model=False,
+        )
+
+    @property
+    def gateway(self) -> LLMGateway:
+        return self._gateway
+
+    def _generate_payload(self, prompt: str, **kwargs) -> dict:
+        return {"model": self.model, "prompt": prompt, "keep_alive": self.keep_alive,
+                "options": {**self.options, **kwargs.get("options", {})}}
+
+    def _chat_payload(self, messages: Sequence[ChatMessage], **kwargs) -> dict:
+        return {"model": self.model, "messages": _messages(messages), "keep_alive": self.keep_alive,
+                "options": {**self.options, **kwargs.get("options", {})}}
+
+    # --- completion ---------------------------------------------------------------------
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponse:
+        raw = self._gateway.post("/api/generate", self._generate_payload(prompt, **kwargs))
+        return CompletionResponse(text=raw.get("response", ""), raw=raw)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponse:
+        raw = await self._gateway.apost("/api/generate", self._generate_payload(prompt, **kwargs))
+        return CompletionResponse(text=raw.get("response", ""), raw=raw)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponseGen:
+        def gen():
+            text = ""
+            for chunk in self._gateway.stream("/api/generate", self._generate_payload(prompt, **kwargs)):
+                delta = chunk.get("response", "")
+                text += delta
+                yield CompletionResponse(text=text, delta=delta, raw=chunk)
+        return gen()
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponseAsyncGen:
+        async def gen():
+            text = ""
+            async for chunk in self._gateway.astream("/api/generate", self._generate_payload(prompt, **kwargs)):
+                delta = chunk.get("response", "")
+                text += delta
+                yield CompletionResponse(text=text, delta=delta, raw=chunk)
+        return gen()
+
+    # --- chat (Ollama applies the model's own chat template) ------------------------------
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs) -> ChatResponse:
+        raw = self._gateway.post("/api/chat", self._chat_payload(messages, **kwargs))
+        content = raw.get("message", {}).get("content", "")
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=content), raw=raw)
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs) -> ChatResponse:
+        raw = await self._gateway.apost("/api/chat", self._chat_payload(messages, **kwargs))
+        content = raw.get("message", {}).get("content", "")
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=content), raw=raw)
+
+    @llm_chat_callback()
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs) -> ChatResponseGen:
+        def gen():
+            content = ""
+            for chunk in self._gateway.stream("/api/chat", self._chat_payload(messages, **kwargs)):
+                delta = chunk.get("message", {}).get("content", "")
+                content += delta
+                yield ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=content), delta=delta, raw=chunk)
+        return gen()
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs) -> ChatResponseAsyncGen:
+        async def gen():
+            content = ""
+            async for chunk in self._gateway.astream("/api/chat", self._chat_payload(messages, **kwargs)):
+                delta = chunk.get("message", {}).get("content", "")
+                content += delta
+                yield ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=content), delta=delta, raw=chunk)
+        return gen()
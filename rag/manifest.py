@@ -0,0 +1,234 @@
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from rag.db import connection
+from rag.settings import EMBED_MODEL_ID, VECTOR_BACKEND, VECTOR_TABLE, init_vector_store
+
+# One manifest per vector table: an ingest into another table never plans against this one
+MANIFEST_TABLE = f"{VECTOR_TABLE}_manifest"
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class ManifestEntry:
+    doc_name: str
+    doc_path: Optional[str]
+    file_hash: Optional[str]
+    mtime: Optional[float]
+    size: Optional[int]
+    chunk_ids: List[str]
+    embed_model: Optional[str]
+
+
+@dataclass
+class IngestPlan:
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)  # doc names no longer on disk
+    hashes: Dict[str, str] = field(default_factory=dict)  # path -> sha256, for new/changed files
+
+    @property
+    def to_ingest(self) -> List[str]:
+        return self.new + self.changed
+
+
+class Manifest:
+    """Per-document record of what is in the vector table: content hash, mtime, chunk ids, embed model.
+
+    Keyed by document name, which is also what every chunk carries in `metadata_.doc_name`.
+    """
+
+    def __init__(self, embed_model: str = EMBED_MODEL_ID):
+        self.embed_model = embed_model
+        self._ensure_table()
+
+    def _ensure_table(self):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (MANIFEST_TABLE,))
+            exists = cur.fetchone()[0] is not None
+            if exists:
+                return
+            cur.execute(f"""
+                CREATE TABLE {MANIFEST_TABLE} (
+                    doc_name TEXT PRIMARY KEY,
+                    doc_path TEXT,
+                    file_hash TEXT,
+                    mtime DOUBLE PRECISION,
+                    size BIGINT,
+                    chunk_ids TEXT[] NOT NULL DEFAULT '{{}}',
+                    embed_model TEXT,
+                    ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            # Adopt documents ingested before the manifest existed (one scan, once).
+            # Their hash is unknown, so the next run re-ingests them and drops the old chunks.
+            cur.execute("SELECT to_regclass(%s)", (f"data_{VECTOR_TABLE}",))
+            if cur.fetchone()[0] is not None:
+                cur.execute(f"""
+                    INSERT INTO {MANIFEST_TABLE} (doc_name, chunk_ids)
+                    SELECT metadata_->>'doc_name', array_agg(node_id)
+                    FROM data_{VECTOR_TABLE}
+                    WHERE metadata_->>'doc_name' IS NOT NULL
+                    GROUP BY 1
+                """)
+
+    def entries(self) -> Dict[str, ManifestEntry]:
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"SELECT doc_name, doc_path, file_hash, mtime, size, chunk_ids, embed_model FROM {MANIFEST_TABLE}"
+            )
+            return {row[0]: ManifestEntry(*row) for row in cur.fetchall()}
+
+    def has_document(self, doc_name: str) -> bool:
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(f"SELECT 1 FROM {MANIFEST_TABLE} WHERE doc_name = %s", (doc_name,))
+            return cur.fetchone() is not None
+
+    def plan(self, files: List[str]) -> IngestPlan:
+        """Classify files against the manifest. Only files whose size/mtime moved get hashed."""
+        known = self.entries()
+        plan = IngestPlan()
+        seen = set()
+        for path in files:
+            doc_name = os.path.basename(path)
+            seen.add(doc_name)
+            stat = os.stat(path)
+            entry = known.get(doc_name)
+            if entry is None:
+                plan.new.append(path)
+                plan.hashes[path] = file_hash(path)
+                continue
+            if (
+                entry.embed_model == self.embed_model
+                and entry.size == stat.st_size
+                and entry.mtime == stat.st_mtime
+            ):
+                plan.unchanged.append(path)
+                continue
+            digest = file_hash(path)
+            if entry.file_hash == digest and entry.embed_model == self.embed_model:
+                # Touched but identical: just remember the new mtime
+                self.touch(doc_name, path, stat.st_mtime)
+                plan.unchanged.append(path)
+            else:
+                plan.changed.append(path)
+                plan.hashes[path] = digest
+        plan.removed = [name for name in known if name not in seen]
+        return plan
+
+    def touch(self, doc_name: str, doc_path: str, mtime: float):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"UPDATE {MANIFEST_TABLE} SET mtime = %s, doc_path = %s WHERE doc_name = %s",
+                (mtime, doc_path, doc_name),
+            )
+
+    def replace_document(self, doc_path: str, digest: str, chunk_ids: List[str]):
+        """Drop the document's previous chunks and record the new ones (call after writing them)."""
+        doc_name = os.path.basename(doc_path)
+        stat = os.stat(doc_path)
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(f"SELECT chunk_ids FROM {MANIFEST_TABLE} WHERE doc_name = %s", (doc_name,))
+            row = cur.fetchone()
+            keep = set(chunk_ids)
+            stale = [cid for cid in (row[0] if row else []) if cid not in keep]
+            if stale:
+                cur.execute(f"DELETE FROM data_{VECTOR_TABLE} WHERE node_id = ANY(%s)", (stale,))
+            cur.execute(
+                f"""
+                INSERT INTO {MANIFEST_TABLE}
+                    (doc_name, doc_path, file_hash, mtime, size, chunk_ids, embed_model, ingested_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, now())
+                ON CONFLICT (doc_name) DO UPDATE SET
+                    doc_path = EXCLUDED.doc_path,
+                    file_hash = EXCLUDED.file_hash,
+                    mtime = EXCLUDED.mtime,
+                    size = EXCLUDED.size,
+                    chunk_ids = EXCLUDED.chunk_ids,
+                    embed_model = EXCLUDED.embed_model,
+                    ingested_at = now()
+                """,
+                (doc_name, doc_path, digest, stat.st_mtime, stat.st_size, chunk_ids, self.embed_model),
+            )
+
+    def remove_documents(self, doc_names: List[str]) -> int:
+        """Delete the chunks and manifest rows of documents that disappeared from the corpus."""
+        if not doc_names:
+            return 0
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"DELETE FROM {MANIFEST_TABLE} WHERE doc_name = ANY(%s) RETURNING chunk_ids",
+                (doc_names,),
+            )
+            chunk_ids = [cid for (ids,) in cur.fetchall() for cid in ids]
+            if chunk_ids:
+                cur.execute(f"DELETE FROM data_{VECTOR_TABLE} WHERE node_id = ANY(%s)", (chunk_ids,))
+            return len(chunk_ids)
+
+
+class LocalManifest(Manifest):
+    """The manifest of a NumpyVectorStore, kept inside its snapshot so both are saved together.
+
+    Changes are in memory until the store is persisted (IngestionEngine does that at the end
+    of a run), so a crash mid-run leaves the previous snapshot and manifest intact.
+    """
+
+    def __init__(self, store, embed_model: str = EMBED_MODEL_ID):
+        self.embed_model = embed_model
+        self.store = store
+
+    def entries(self) -> Dict[str, ManifestEntry]:
+        return {name: ManifestEntry(doc_name=name, **entry) for name, entry in self.store.manifest.items()}
+
+    def has_document(self, doc_name: str) -> bool:
+        return doc_name in self.store.manifest
+
+    def touch(self, doc_name: str, doc_path: str, mtime: float):
+        entry = self.store.manifest.get(doc_name)
+        if entry is not None:
+            self.store.set_manifest_entry(doc_name, {**entry, "mtime": mtime, "doc_path": doc_path})
+
+    def replace_document(self, doc_path: str, digest: str, chunk_ids: List[str]):
+        doc_name = os.path.basename(doc_path)
+        stat = os.stat(doc_path)
+        keep = set(chunk_ids)
+        old = self.store.manifest.get(doc_name, {}).get("chunk_ids", [])
+        stale = [cid for cid in old if cid not in keep]
+        if stale:
+            self.store.delete_nodes(stale)
+        self.store.set_manifest_entry(doc_name, {
+            "doc_path": doc_path,
+            "file_hash": digest,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "chunk_ids": list(chunk_ids),
+            "embed_model": self.embed_model,
+        })
+
+    def remove_documents(self, doc_names: List[str]) -> int:
+        chunk_ids = []
+        for doc_name in doc_names:
+            chunk_ids += self.store.manifest.get(doc_name, {}).get("chunk_ids", [])
+            self.store.set_manifest_entry(doc_name, None)
+        if chunk_ids:
+            self.store.delete_nodes(chunk_ids)
+        if doc_names:
+            self.store.persist()
+        return len(chunk_ids)
+
+
+def open_manifest() -> Manifest:
+    """The manifest for the configured VECTOR_BACKEND."""
+    if VECTOR_BACKEND == "numpy":
+        return LocalManifest(init_vector_store())
+    return Manifest()
@@ -0,0 +1,96 @@
+from typing import Callable, Dict
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from prometheus_client.core import REGISTRY, GaugeMetricFamily
+
+# Stage names as recorded by StageTimer: embed, search, rerank, synthesize, agent,
+# cache_lookup, ttft (time to first streamed token), generate and total
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Wall-clock time per pipeline stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+REQUESTS = Counter("rag_requests_total", "Chat completion requests", ["mode", "stream", "cache"])
+REJECTED = Counter("rag_requests_rejected_total", "Requests shed with 503 (queue full or wait timed out)")
+COMPLETION_TOKENS = Counter("rag_completion_tokens_total", "Generated tokens", ["mode"])
+TOKENS_PER_SECOND = Histogram(
+    "rag_generation_tokens_per_second",
+    "Generation throughput per request",
+    ["mode"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250),
+)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+def observe_timer(timings: Dict[str, float]):
+    """Feed a request's StageTimer.as_dict() (ms) into the stage histograms."""
+    for stage, ms in timings.items():
+        STAGE_SECONDS.labels(stage=stage).observe(ms / 1000)
+
+
+def observe_generation(mode: str, tokens: int, seconds: float):
+    COMPLETION_TOKENS.labels(mode=mode).inc(tokens)
+    if tokens and seconds > 0:
+        TOKENS_PER_SECOND.labels(mode=mode).observe(tokens / seconds)
+
+
+class StatsCollector:
+    """Exports the `stats()` dicts the app already keeps (limiter, caches) at scrape time."""
+
+    def __init__(self):
+        self.queues: Dict[str, Callable[[], dict]] = {}
+        self.caches: Dict[str, Callable[[], dict]] = {}
+        self.gauges: Dict[str, Callable[[], dict]] = {}
+
+    def collect(self):
+        in_flight = GaugeMetricFamily("rag_queue_in_flight", "Requests running the pipeline", labels=["queue"])
+        waiting = GaugeMetricFamily("rag_queue_waiting", "Requests waiting for a pipeline slot", labels=["queue"])
+        for name, stats in self.queues.items():
+            s = stats()
+            in_flight.add_metric([name], s.get("in_flight", 0))
+            waiting.add_metric([name], s.get("waiting", 0))
+        yield in_flight
+        yield waiting
+
+        hits = GaugeMetricFamily("rag_cache_hits", "Cache hits since start", labels=["cache"])
+        misses = GaugeMetricFamily("rag_cache_misses", "Cache misses since start", labels=["cache"])
+        ratio = GaugeMetricFamily("rag_cache_hit_ratio", "Cache hit ratio since start", labels=["cache"])
+        for name, stats in self.caches.items():
+            s = stats()
+            h = s.get("hits", s.get("exact_hits", 0) + s.get("semantic_hits", 0))
+            m = s.get("misses", 0)
+            hits.add_metric([name], h)
+            misses.add_metric([name], m)
+            ratio.add_metric([name], h / (h + m) if h + m else 0.0)
+        yield hits
+        yield misses
+        yield ratio
+
+        for name, stats in self.gauges.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    yield GaugeMetricFamily(f"rag_{name}_{key}", f"{name} {key.replace('_', ' ')}", value=value)
+
+
+collector = StatsCollector()
+REGISTRY.register(collector)
+
+
+def register_queue(name: str, stats: Callable[[], dict]):
+    collector.queues[name] = stats
+
+
+def register_cache(name: str, stats: Callable[[], dict]):
+    """`stats()` must return "hits" (or "exact_hits"/"semantic_hits") and "misses"."""
+    collector.caches[name] = stats
+
+
+def register_gauges(name: str, stats: Callable[[], dict]):
+    """Every numeric entry of `stats()` becomes a gauge named rag_<name>_<key>."""
+    collector.gauges[name] = stats
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
@@ -0,0 +1,258 @@
+import os
+import queue
+import signal
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+from rag.settings import (
+    ANSWER_CACHE_ENABLED,
+    EMBED_MODEL_NAME,
+    MODEL_SERVICE_AUTHKEY,
+    MODEL_SERVICE_CONNECTIONS,
+    MODEL_SERVICE_SOCKET,
+    MODEL_SERVICE_TIMEOUT,
+)
+
+# True inside the service process itself, so its own model builders stay local
+serving = False
+
+
+class ModelServiceError(Exception):
+    """The model service raised while handling a call (message is the remote repr)."""
+
+
+def remote_enabled() -> bool:
+    return bool(MODEL_SERVICE_SOCKET) and not serving
+
+
+def _authkey() -> Optional[bytes]:
+    return MODEL_SERVICE_AUTHKEY.encode() if MODEL_SERVICE_AUTHKEY else None
+
+
+# --- service process ------------------------------------------------------------------
+
+
+class ModelService:
+    """Owns the models and caches every worker shares: embedder (+ embedding cache), rerank
+    cross-encoders and the answer cache. One thread per worker connection; ONNX sessions are
+    safe to call from several threads."""
+
+    def __init__(self):
+        from rag.answer_cache import AnswerCache
+        from rag.settings import build_embed_model
+
+        self.embed_model = build_embed_model()
+        # Run the ONNX session once (past the cache) so the first worker request isn't the cold one
+        getattr(self.embed_model, "inner", self.embed_model).get_query_embedding("warmup")
+        self.answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
+        self.started = time.time()
+        self.calls = 0
+
+    def handle(self, op: str, args: tuple) -> Any:
+        self.calls += 1
+        if op == "embed_query":
+            return self.embed_model.get_query_embedding(*args)
+        if op == "embed_texts":
+            return self.embed_model.get_text_embedding_batch(*args)
+        if op == "embed_queries":
+            from rag.embed_batcher import embed_queries
+
+            return embed_queries(self.embed_model, *args)
+        if op == "embed_stats":
+            return self.embed_model.stats() if hasattr(self.embed_model, "stats") else {}
+        if op == "embed_batch_stats":
+            from rag.embed_batcher import batch_stats
+
+            return batch_stats(self.embed_model)
+        if op == "rerank":
+            from rag.rerank import get_cross_encoder
+
+            model, pairs = args
+            return [float(s) for s in get_cross_encoder(model).predict(pairs, batch_size=len(pairs), show_progress_bar=False)]
+        if op.startswith("answer_"):
+            if self.answer_cache is None:
+                raise ModelServiceError("answer cache is disabled in the model service")
+            return getattr(self.answer_cache, op.removeprefix("answer_"))(*args)
+        if op == "ping":
+            return {"pid": os.getpid(), "uptime_s": round(time.time() - self.started, 1), "calls": self.calls}
+        raise ModelServiceError(f"unknown op {op!r}")
+
+    def _serve_connection(self, conn: Connection):
+        with conn:
+            while True:
+                try:
+                    op, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("ok", self.handle(op, args)))
+                except Exception as e:
+                    conn.send(("error", repr(e)))
+
+    def serve_forever(self, socket_path: str = MODEL_SERVICE_SOCKET):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # stale socket from a previous run
+        listener = Listener(socket_path, family="AF_UNIX", authkey=_authkey())
+        os.chmod(socket_path, 0o600)
+        print(f"✅ Model service listening on {socket_path} (pid {os.getpid()}).")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:  # a client that failed the auth handshake
+                    print(f"⚠️ Model service rejected a connection: {e!r}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+
+def serve(socket_path: str = MODEL_SERVICE_SOCKET):
+    """Run the service in this process (import this module to call it; don't run it as __main__)."""
+    global serving
+    if not socket_path:
+        raise ValueError("MODEL_SERVICE_SOCKET is not set")
+    serving = True
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    ModelService().serve_forever(socket_path)
+
+
+# --- worker side ------------------------------------------------------------------------
+
+
+class ServiceClient:
+    """Small pool of persistent connections to the model service (one call per connection at a time)."""
+
+    def __init__(self, socket_path: str = MODEL_SERVICE_SOCKET, size: int = MODEL_SERVICE_CONNECTIONS,
+                 timeout: float = MODEL_SERVICE_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> Connection:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                return Client(self.socket_path, family="AF_UNIX", authkey=_authkey())
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The service may still be loading its models when workers come up
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+    def call(self, op: str, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"no model service connection free within {self.timeout}s")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                conn.send((op, args))
+                if not conn.poll(self.timeout):
+                    raise TimeoutError(f"model service did not answer {op!r} within {self.timeout}s")
+                status, result = conn.recv()
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+        if status == "error":
+            raise ModelServiceError(result)
+        return result
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> ServiceClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ServiceClient()
+        return _client
+
+
+class RemoteEmbedding(BaseEmbedding):
+    """Embed model backed by the model service; caching happens there, once for all workers."""
+
+    _client: Any = PrivateAttr()
+
+    def __init__(self, client: Optional[ServiceClient] = None, **kwargs):
+        super().__init__(model_name=EMBED_MODEL_NAME, **kwargs)
+        self._client = client or get_client()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RemoteEmbedding"
+
+    def stats(self) -> dict:
+        return self._client.call("embed_stats")
+
+    def batch_stats(self) -> dict:
+        return self._client.call("embed_batch_stats")
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._client.call("embed_query", query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        from rag.concurrency import run_sync
+
+        return await run_sync(self._get_query_embedding, query)
+
+    def _get_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        return self._client.call("embed_queries", queries)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._client.call("embed_texts", texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        from rag.concurrency import run_sync
+
+        return await run_sync(self._get_text_embeddings, texts)
+
+
+class RemoteCrossEncoder:
+    """Stands in for sentence_transformers.CrossEncoder; scoring runs in the model service."""
+
+    def __init__(self, model: str, client: Optional[ServiceClient] = None):
+        self.model = model
+        self._client = client or get_client()
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=False):
+        return self._client.call("rerank", self.model, [tuple(p) for p in pairs])
+
+
+class RemoteAnswerCache:
+    """AnswerCache interface over the model service: one cache shared by all workers."""
+
+    def __init__(self, client: Optional[ServiceClient] = None):
+        self._client = client or get_client()
+
+    def get_exact(self, question: str, namespace: str = ""):
+        return self._client.call("answer_get_exact", question, namespace)
+
+    def get_similar(self, embedding, namespace: str = ""):
+        return self._client.call("answer_get_similar", list(embedding), namespace)
+
+    def put(self, question: str, answer: str, source_nodes=None, embedding=None, namespace: str = ""):
+        embedding = list(embedding) if embedding is not None else None
+        self._client.call("answer_put", question, answer, list(source_nodes or []), embedding, namespace)
+
+    def clear(self):
+        self._client.call("answer_clear")
+
+    def stats(self) -> dict:
+        return self._client.call("answer_stats")
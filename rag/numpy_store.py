@@ -0,0 +1,504 @@
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+from pydantic import PrivateAttr
+
+from rag.concurrency import run_sync
+
+REF_DOC_KEY = "__ref_doc_id__"  # posting key for delete(ref_doc_id)
+BLOCK_ROWS = 16384  # rows scored per matmul; bounds the int8 → float32 temporary
+
+
+class _View(NamedTuple):
+    """Consistent read-only state for one query; a reload swaps in a new one underneath."""
+
+    count: int
+    vectors: Any
+    scales: Any
+    live: Any
+    ids: List[str]
+    offsets: Any
+    records: Any
+    fresh: Dict[int, dict]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _quantize(matrix: np.ndarray):
+    """Symmetric per-row int8: row ≈ q * scale."""
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def _indexable(value) -> list:
+    """Metadata values a filter can match: scalars, or the elements of a list."""
+    values = value if isinstance(value, list) else [value]
+    return [v for v in values if isinstance(v, (str, int, float, bool))]
+
+
+def _matches(op, value, target) -> bool:
+    try:
+        if op in (FilterOperator.EQ, FilterOperator.CONTAINS):
+            return value == target
+        if op == FilterOperator.NE:
+            return value != target
+        if op == FilterOperator.GT:
+            return value > target
+        if op == FilterOperator.GTE:
+            return value >= target
+        if op == FilterOperator.LT:
+            return value < target
+        if op == FilterOperator.LTE:
+            return value <= target
+        if op in (FilterOperator.IN, FilterOperator.ANY):
+            return value in target
+        if op == FilterOperator.NIN:
+            return value not in target
+        if op == FilterOperator.TEXT_MATCH:
+            return str(target) in str(value)
+        if op == FilterOperator.TEXT_MATCH_INSENSITIVE:
+            return str(target).lower() in str(value).lower()
+    except TypeError:
+        return False  # e.g. "10" > 5: incomparable values never match
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def _record(view: _View, row: int) -> dict:
+    record = view.fresh.get(row)
+    if record is None:
+        start, end = int(view.offsets[row]), int(view.offsets[row + 1])
+        record = json.loads(os.pread(view.records.fileno(), end - start, start))
+    return record
+
+
+def _node(view: _View, row: int) -> BaseNode:
+    record = _record(view, row)
+    node = metadata_dict_to_node(record["metadata"])
+    node.set_content(record["text"])
+    return node
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """In-process vector store: one float32 (or int8) matrix of L2-normalised rows, exact top-k by
+    blocked matrix multiply, metadata filters answered from an inverted index of metadata values.
+
+    Persisted as immutable snapshots under `path`/snapshots/<version>/ with a CURRENT pointer
+    swapped atomically: vectors.npy (memory-mapped on load), records.jsonl (text + node metadata,
+    read by offset only for returned hits) and index.json (ids, postings, ingest manifest).
+    Serving processes pick up a new snapshot written by `scripts/ingest.py` on their next query.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+
+    _path: str = PrivateAttr()
+    _dim: int = PrivateAttr()
+    _quantize: str = PrivateAttr()
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+    _vectors: Any = PrivateAttr(default=None)
+    _scales: Any = PrivateAttr(default=None)
+    _live: Any = PrivateAttr(default=None)
+    _count: int = PrivateAttr(default=0)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _rows: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _postings: Dict[str, Dict[Any, List[int]]] = PrivateAttr(default_factory=dict)
+    _fresh: Dict[int, dict] = PrivateAttr(default_factory=dict)  # records not in a snapshot yet
+    _records: Any = PrivateAttr(default=None)
+    _offsets: Any = PrivateAttr(default=None)
+    _manifest: Dict[str, dict] = PrivateAttr(default_factory=dict)
+    _dirty: bool = PrivateAttr(default=False)
+    _version: str = PrivateAttr(default="")
+    _checked_at: float = PrivateAttr(default=0.0)
+    _queries: int = PrivateAttr(default=0)
+
+    def __init__(self, path: str, dim: int, quantize: str = "none", **kwargs):
+        if quantize not in ("none", "int8"):
+            raise ValueError(f"Unsupported quantization: {quantize}")
+        super().__init__(**kwargs)
+        self._path = path
+        self._dim = dim
+        self._quantize = quantize
+        self._reset()
+        self._load()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @property
+    def manifest(self) -> Dict[str, dict]:
+        """rag.manifest.LocalManifest entries, saved with each snapshot."""
+        return self._manifest
+
+    def stats(self) -> dict:
+        return {
+            "backend": "numpy",
+            "rows": self._count,
+            "live_rows": int(self._live[: self._count].sum()),
+            "dim": self._dim,
+            "quantize": self._quantize,
+            "matrix_mb": round(self._count * self._dim * (1 if self._quantize == "int8" else 4) / 2**20, 1),
+            "snapshot": self._version,
+            "unsaved_rows": len(self._fresh),
+            "queries": self._queries,
+        }
+
+    # --- snapshots ------------------------------------------------------------------------
+
+    def _reset(self):
+        dtype = np.int8 if self._quantize == "int8" else np.float32
+        self._vectors = np.zeros((0, self._dim), dtype=dtype)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._live = np.zeros(0, dtype=bool)
+        self._count = 0
+        self._ids, self._rows, self._postings, self._fresh, self._manifest = [], {}, {}, {}, {}
+        # Not closed here: queries still holding a view may read from it; GC closes it
+        self._offsets = self._records = None
+        self._dirty = False
+
+    def _current_version(self) -> str:
+        try:
+            with open(os.path.join(self._path, "CURRENT"), encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    def _load(self):
+        version = self._current_version()
+        if not version:
+            return
+        snapshot = os.path.join(self._path, "snapshots", version)
+        with open(os.path.join(snapshot, "index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+        if index["dim"] != self._dim or index["quantize"] != self._quantize:
+            raise ValueError(
+                f"Snapshot {snapshot} is dim={index['dim']}, quantize={index['quantize']}; "
+                f"expected dim={self._dim}, quantize={self._quantize}. Re-ingest or change the settings."
+            )
+        vectors = np.load(os.path.join(snapshot, "vectors.npy"), mmap_mode="r")
+        scales = np.load(os.path.join(snapshot, "scales.npy")) if self._quantize == "int8" else np.ones(len(vectors), dtype=np.float32)
+        offsets = np.load(os.path.join(snapshot, "offsets.npy"))
+        records = open(os.path.join(snapshot, "records.jsonl"), "rb")
+        postings = {}
+        for key, value, rows in index["postings"]:
+            postings.setdefault(key, {})[value] = rows
+        with self._lock:
+            self._reset()
+            self._vectors, self._scales, self._offsets, self._records = vectors, scales, offsets, records
+            self._count = len(index["ids"])
+            self._live = np.ones(self._count, dtype=bool)
+            self._ids = index["ids"]
+            self._rows = {node_id: row for row, node_id in enumerate(self._ids)}
+            self._postings = postings
+            self._manifest = index.get("manifest", {})
+            self._version = version
+
+    def maybe_reload(self, interval: float = 1.0):
+        """Load a newer snapshot if one was written (checked at most every `interval` seconds)."""
+        now = time.monotonic()
+        if now - self._checked_at < interval:
+            return
+        self._checked_at = now
+        if self._dirty:
+            return  # unsaved local changes win; this process is the writer
+        if self._current_version() not in ("", self._version):
+            self._load()
+
+    def persist(self, persist_path: Optional[str] = None, fs=None) -> None:
+        """Write a compacted snapshot (deleted rows dropped) and switch to it."""
+        path = persist_path or self._path
+        with self._lock:
+            live = np.flatnonzero(self._live[: self._count])
+            remap = np.full(self._count, -1, dtype=np.int64)
+            remap[live] = np.arange(len(live))
+            version = f"{time.time_ns()}"
+            snapshot = os.path.join(path, "snapshots", version)
+            os.makedirs(snapshot)
+
+            np.save(os.path.join(snapshot, "vectors.npy"), np.asarray(self._vectors[live]))
+            if self._quantize == "int8":
+                np.save(os.path.join(snapshot, "scales.npy"), self._scales[live])
+            offsets = [0]
+            view = self._view()
+            with open(os.path.join(snapshot, "records.jsonl"), "wb") as f:
+                for row in live:
+                    line = json.dumps(_record(view, int(row))).encode("utf-8") + b"\n"
+                    f.write(line)
+                    offsets.append(offsets[-1] + len(line))
+            np.save(os.path.join(snapshot, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+            postings = []
+            for key, values in self._postings.items():
+                for value, rows in values.items():
+                    kept = [int(r) for r in remap[np.asarray(rows, dtype=np.int64)] if r >= 0]
+                    if kept:
+                        postings.append([key, value, kept])
+            index = {
+                "dim": self._dim,
+                "quantize": self._quantize,
+                "ids": [self._ids[row] for row in live],
+                "postings": postings,
+                "manifest": self.manifest,
+            }
+            with open(os.path.join(snapshot, "index.json"), "w", encoding="utf-8") as f:
+                json.dump(index, f)
+
+            pointer = os.path.join(path, "CURRENT")
+            with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+                f.write(version)
+            os.replace(pointer + ".tmp", pointer)
+            previous = self._version
+            if path == self._path:
+                self._load()
+        # Keep the previous snapshot: other processes may still have it mapped
+        for old in os.listdir(os.path.join(path, "snapshots")):
+            if old not in (version, previous):
+                shutil.rmtree(os.path.join(path, "snapshots", old), ignore_errors=True)
+        print(f"💾 Vector snapshot {version}: {len(live)} chunks saved to {path}")
+
+    # --- records --------------------------------------------------------------------------
+
+    def _view(self) -> _View:
+        with self._lock:
+            return _View(self._count, self._vectors, self._scales, self._live[: self._count].copy(),
+                         self._ids, self._offsets, self._records, self._fresh)
+
+    # --- writes ---------------------------------------------------------------------------
+
+    def _reserve(self, extra: int):
+        """Grow the in-memory matrix (a loaded snapshot is copied out of its memory map once)."""
+        needed = self._count + extra
+        if needed <= len(self._live) and not isinstance(self._vectors, np.memmap):
+            return
+        capacity = max(needed, 2 * len(self._live), 1024)
+        vectors = np.zeros((capacity, self._dim), dtype=self._vectors.dtype)
+        vectors[: self._count] = self._vectors[: self._count]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[: self._count] = self._scales[: self._count]
+        live = np.zeros(capacity, dtype=bool)
+        live[: self._count] = self._live[: self._count]
+        self._vectors, self._scales, self._live = vectors, scales, live
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        matrix = _normalize(np.asarray([node.get_embedding() for node in nodes], dtype=np.float32))
+        if matrix.shape[1] != self._dim:
+            raise ValueError(f"Embedding dim {matrix.shape[1]} != store dim {self._dim}")
+        with self._lock:
+            self._reserve(len(nodes))
+            start = self._count
+            if self._quantize == "int8":
+                self._vectors[start:start + len(nodes)], self._scales[start:start + len(nodes)] = _quantize(matrix)
+            else:
+                self._vectors[start:start + len(nodes)] = matrix
+            for row, node in enumerate(nodes, start):
+                old = self._rows.get(node.node_id)
+                if old is not None:
+                    self._live[old] = False  # upsert: the new row replaces it
+                self._rows[node.node_id] = row
+                self._ids.append(node.node_id)
+                self._live[row] = True
+                self._fresh[row] = {
+                    "text": node.get_content(),
+                    "metadata": node_to_metadata_dict(node, remove_text=True, flat_metadata=False),
+                }
+                for key, value in node.metadata.items():
+                    for v in _indexable(value):
+                        self._postings.setdefault(key, {}).setdefault(v, []).append(row)
+                if node.ref_doc_id:
+                    self._postings.setdefault(REF_DOC_KEY, {}).setdefault(node.ref_doc_id, []).append(row)
+            self._count += len(nodes)
+            self._dirty = True
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            rows = self._postings.get(REF_DOC_KEY, {}).get(ref_doc_id, [])
+            self._drop(rows)
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[MetadataFilters] = None,
+                     **delete_kwargs: Any) -> None:
+        with self._lock:
+            mask = self._mask(filters, node_ids=node_ids)
+            if mask is not None:
+                self._drop(np.flatnonzero(mask))
+
+    def _drop(self, rows):
+        for row in rows:
+            if self._live[row]:
+                self._live[row] = False
+                self._rows.pop(self._ids[row], None)
+                self._fresh.pop(int(row), None)
+                self._dirty = True
+
+    def set_manifest_entry(self, doc_name: str, entry: Optional[dict]):
+        with self._lock:
+            if entry is None:
+                self._manifest.pop(doc_name, None)
+            else:
+                self._manifest[doc_name] = entry
+            self._dirty = True
+
+    def metadata_values(self, key: str) -> list:
+        """Distinct values of a metadata key among live rows."""
+        with self._lock:
+            live = self._live[: self._count]
+            return [v for v, rows in self._postings.get(key, {}).items() if live[rows].any()]
+
+    def tag(self, key: str, value, filters: MetadataFilters) -> int:
+        """Make rows matching `filters` that have no `key` yet match `key == value` in filters
+        (backfill for snapshots written before the key existed; stored node metadata is unchanged)."""
+        with self._lock:
+            untagged = self._rows_where(MetadataFilter(key=key, value=None, operator=FilterOperator.IS_EMPTY))
+            rows = np.flatnonzero(self._mask(filters) & untagged)
+            if len(rows):
+                self._postings.setdefault(key, {}).setdefault(value, []).extend(int(r) for r in rows)
+                self._dirty = True
+        return len(rows)
+
+    def centroids(self, key: str) -> Dict[Any, np.ndarray]:
+        """Normalised mean vector of the live rows for each value of `key`."""
+        view = self._view()
+        result = {}
+        for value in self.metadata_values(key):
+            rows = np.asarray(self._postings[key][value])
+            rows = rows[view.live[rows]]
+            vectors = view.vectors[rows].astype(np.float32)
+            if self._quantize == "int8":
+                vectors *= view.scales[rows][:, None]
+            result[value] = _normalize(vectors.mean(axis=0, keepdims=True))[0]
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    # --- reads ----------------------------------------------------------------------------
+
+    def _rows_where(self, f: MetadataFilter) -> np.ndarray:
+        """Boolean row mask for one filter, evaluated over the distinct values of its key."""
+        mask = np.zeros(self._count, dtype=bool)
+        postings = self._postings.get(f.key, {})
+        if f.operator == FilterOperator.IS_EMPTY:
+            for rows in postings.values():
+                mask[rows] = True
+            return ~mask
+        if f.operator == FilterOperator.ALL:
+            mask[:] = True
+            for target in f.value:
+                mask &= self._rows_where(MetadataFilter(key=f.key, value=target, operator=FilterOperator.EQ))
+            return mask
+        for value, rows in postings.items():
+            if _matches(f.operator, value, f.value):
+                mask[rows] = True
+        return mask
+
+    def _filter_mask(self, filters: MetadataFilters) -> np.ndarray:
+        masks = [
+            self._filter_mask(f) if isinstance(f, MetadataFilters) else self._rows_where(f)
+            for f in filters.filters
+        ]
+        if not masks:
+            return np.ones(self._count, dtype=bool)
+        if filters.condition == FilterCondition.OR:
+            return np.logical_or.reduce(masks)
+        combined = np.logical_and.reduce(masks)
+        return ~combined if filters.condition == getattr(FilterCondition, "NOT", None) else combined
+
+    def _mask(self, filters=None, doc_ids=None, node_ids=None) -> Optional[np.ndarray]:
+        """Rows allowed by the query's filters (live rows only), or None when nothing restricts."""
+        if not (filters or doc_ids or node_ids):
+            return None
+        mask = self._live[: self._count].copy()
+        if filters:
+            mask &= self._filter_mask(filters)
+        if doc_ids:
+            allowed = np.zeros(self._count, dtype=bool)
+            for doc_id in doc_ids:
+                allowed[self._postings.get(REF_DOC_KEY, {}).get(doc_id, [])] = True
+            mask &= allowed
+        if node_ids:
+            allowed = np.zeros(self._count, dtype=bool)
+            allowed[[self._rows[i] for i in node_ids if i in self._rows]] = True
+            mask &= allowed
+        return mask
+
+    def search(self, queries: np.ndarray, k: int, mask: Optional[np.ndarray] = None):
+        """Exact cosine top-k for a batch of query vectors: one (rows, scores) pair per query."""
+        return self._search(self._view(), queries, k, mask)
+
+    def _search(self, view: _View, queries: np.ndarray, k: int, mask: Optional[np.ndarray]):
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        count = view.count
+        if count == 0 or k <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        if self._quantize == "int8":
+            scores = np.empty((len(queries), count), dtype=np.float32)
+            for start in range(0, count, BLOCK_ROWS):
+                block = view.vectors[start:min(start + BLOCK_ROWS, count)]
+                end = start + len(block)
+                scores[:, start:end] = (queries @ block.astype(np.float32).T) * view.scales[start:end]
+        else:
+            scores = queries @ view.vectors[:count].T  # one GEMM: the batch shares each pass over the matrix
+        allowed = view.live if mask is None else mask & view.live
+        if not allowed.all():
+            scores[:, ~allowed] = -np.inf
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for i, rows in enumerate(top):
+            rows = rows[np.argsort(-scores[i, rows])]
+            rows = rows[np.isfinite(scores[i, rows])]
+            results.append((rows, scores[i, rows]))
+        return results
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        # kwargs: PGVectorStore search knobs (hnsw_ef_search, ...) mean nothing for an exact scan
+        self.maybe_reload()
+        if query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        with self._lock:
+            view = self._view()
+            mask = self._mask(query.filters, query.doc_ids, query.node_ids)
+        rows, scores = self._search(view, np.asarray([query.query_embedding]), query.similarity_top_k, mask)[0]
+        self._queries += 1
+        return VectorStoreQueryResult(
+            nodes=[_node(view, int(row)) for row in rows],
+            similarities=[float(s) for s in scores],
+            ids=[view.ids[row] for row in rows],
+        )
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        return await run_sync(self.query, query, **kwargs)
+
+    def get_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[MetadataFilters] = None) -> List[BaseNode]:
+        with self._lock:
+            view = self._view()
+            mask = self._mask(filters, node_ids=node_ids)
+        rows = np.flatnonzero(view.live if mask is None else mask)
+        return [_node(view, int(row)) for row in rows]
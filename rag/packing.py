@@ -0,0 +1,177 @@
+import re
+import threading
+from typing import List, Optional
+
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeRelationship, NodeWithScore, QueryBundle, TextNode
+
+from rag.settings import CONTEXT_MIN_TOKENS, CONTEXT_TOKEN_BUDGET
+
+# Ingest prepends "[DOC_TITLE] ...\n[SECTION_PATH] ...\n[INTENT] ...\n[CHUNK]\n" (or a
+# [CONTEXT] line): it helps embedding and BM25, but is noise in the synthesis prompt
+_HEADER = re.compile(r"\A\[DOC_TITLE\].*?\[CHUNK\]\n", re.DOTALL)
+
+# Only these reach the prompt as "key: value" lines above each passage
+PROMPT_METADATA = ("file_name", "page_label")
+
+
+def strip_context_header(text: str) -> str:
+    return _HEADER.sub("", text, count=1)
+
+
+def chunk_body(node) -> str:
+    """The chunk's original text, without the ingest-time retrieval header."""
+    return node.metadata.get("orig_text") or strip_context_header(node.get_content(metadata_mode=MetadataMode.NONE))
+
+
+def _overlap(a: str, b: str, limit: int = 4000) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (the splitter's overlap)."""
+    for size in range(min(len(a), len(b), limit), 0, -1):
+        if a.endswith(b[:size]):
+            return size
+    return 0
+
+
+class _Passage:
+    def __init__(self, result: NodeWithScore):
+        node = result.node
+        self.doc = node.ref_doc_id or node.metadata.get("doc_name") or node.metadata.get("file_name")
+        self.start = node.start_char_idx
+        self.end = node.end_char_idx
+        self.text = chunk_body(node)
+        self.score = result.score or 0.0
+        self.ids = [node.node_id]
+        self.next_id = node.relationships.get(NodeRelationship.NEXT).node_id if NodeRelationship.NEXT in node.relationships else None
+        self.node = node
+
+    def follows(self, other: "_Passage") -> bool:
+        if self.doc != other.doc:
+            return False
+        if None not in (self.start, other.start, other.end):
+            return other.start <= self.start <= other.end + 1
+        return other.next_id == self.ids[0]
+
+    def absorb(self, other: "_Passage"):
+        """Append `other` (which follows this passage in its document), dropping the overlap."""
+        if None not in (other.start, self.end) and other.start <= self.end:
+            cut = min(self.end - other.start, len(other.text))
+            # Offsets refer to the source document; fall back to matching if the text disagrees
+            if not self.text.endswith(other.text[:cut]):
+                cut = _overlap(self.text, other.text)
+        else:
+            cut = _overlap(self.text, other.text)
+        self.text = self.text + ("" if cut else "\n") + other.text[cut:]
+        self.end = max(self.end or 0, other.end or 0) if None not in (self.end, other.end) else None
+        self.score = max(self.score, other.score)
+        self.ids += other.ids
+        self.next_id = other.next_id
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """Assembles the synthesis context: strips retrieval headers, drops duplicate and overlapping
+    chunks, merges neighbours from the same document and packs the best passages into
+    `token_budget` tokens. Runs after the reranker, so input order is relevance order."""
+
+    token_budget: int = Field(default=CONTEXT_TOKEN_BUDGET)
+    min_tokens: int = Field(default=CONTEXT_MIN_TOKENS)
+    _lock = PrivateAttr(default_factory=threading.Lock)
+    _runs: int = PrivateAttr(default=0)
+    _tokens_in: int = PrivateAttr(default=0)
+    _tokens_out: int = PrivateAttr(default=0)
+    _merged: int = PrivateAttr(default=0)
+    _dropped: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def stats(self) -> dict:
+        return {
+            "runs": self._runs,
+            "tokens_in": self._tokens_in,
+            "tokens_out": self._tokens_out,
+            "chunks_merged": self._merged,
+            "chunks_dropped": self._dropped,
+        }
+
+    def _count(self, text: str) -> int:
+        return len(Settings.tokenizer(text))
+
+    @staticmethod
+    def _merge(nodes: List[NodeWithScore]):
+        """(passages best-first, number of chunks folded into another passage)."""
+        passages: List[_Passage] = []
+        seen, folded = set(), 0
+        for result in nodes:
+            passage = _Passage(result)
+            if passage.ids[0] in seen or any(passage.text in p.text for p in passages):
+                folded += 1  # duplicate, or fully inside a passage we already have
+                continue
+            seen.add(passage.ids[0])
+            passages.append(passage)
+
+        # Stitch neighbours within each document
+        merged = True
+        while merged:
+            merged = False
+            for a in passages:
+                for b in passages:
+                    if a is not b and b.follows(a):
+                        a.absorb(b)
+                        passages.remove(b)
+                        folded += 1
+                        merged = True
+                        break
+                if merged:
+                    break
+        passages.sort(key=lambda p: p.score, reverse=True)
+        return passages, folded
+
+    def _to_node(self, passage: _Passage, text: str) -> NodeWithScore:
+        metadata = {k: passage.node.metadata[k] for k in ("file_name", "doc_name", "page_label") if k in passage.node.metadata}
+        node = TextNode(
+            id_=passage.ids[0] if len(passage.ids) == 1 else "+".join(passage.ids),
+            text=text,
+            metadata=metadata,
+            excluded_llm_metadata_keys=[k for k in metadata if k not in PROMPT_METADATA],
+            excluded_embed_metadata_keys=list(metadata),
+        )
+        return NodeWithScore(node=node, score=passage.score)
+
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None
+    ) -> List[NodeWithScore]:
+        if not nodes:
+            return nodes
+        tokens_in = sum(self._count(n.node.get_content(metadata_mode=MetadataMode.LLM)) for n in nodes)
+        passages, folded = self._merge(nodes)
+
+        packed, used, dropped = [], 0, 0
+        for passage in passages:
+            candidate = self._to_node(passage, passage.text)
+            tokens = self._count(candidate.node.get_content(metadata_mode=MetadataMode.LLM))
+            remaining = self.token_budget - used
+            if tokens > remaining:
+                if remaining < self.min_tokens:
+                    dropped += 1
+                    continue
+                # Trim the passage to what's left, on a sentence boundary where possible
+                cut = passage.text[: int(len(passage.text) * remaining / tokens)]
+                cut = cut[: cut.rfind(". ") + 1] or cut
+                candidate = self._to_node(passage, cut)
+                tokens = self._count(candidate.node.get_content(metadata_mode=MetadataMode.LLM))
+                if tokens > remaining:
+                    dropped += 1
+                    continue
+            packed.append(candidate)
+            used += tokens
+
+        with self._lock:
+            self._runs += 1
+            self._tokens_in += tokens_in
+            self._tokens_out += used
+            self._merged += folded
+            self._dropped += dropped
+        return packed
@@ -0,0 +1,99 @@
+import time
+from contextlib import contextmanager
+
+from llama_index.core import get_response_synthesizer
+from llama_index.core.schema import QueryBundle
+
+from rag.concurrency import run_sync
+
+# Model ids advertised on /v1/models and the pipeline each one selects
+PIPELINE_MODELS = {
+    "contextual-rag-direct": "direct",
+    "contextual-rag-agent": "agent",
+}
+
+
+def format_sources(source_nodes, k: int) -> str:
+    """Render the top-k source nodes as numbered citation lines ("" if there are none)."""
+    srcs = []
+    for i, sn in enumerate((source_nodes or [])[:k], 1):
+        meta = (sn.node.metadata or {})
+        name = meta.get("file_name") or meta.get("file_path") or "doc"
+        score = getattr(sn, "score", None)
+        snippet = (sn.node.get_content() or "")[:160].replace("\n", " ")
+        srcs.append(f"{i}. {name} | score={score} | “{snippet}…”")
+    return ("Sources:\n" + "\n".join(srcs)) if srcs else ""
+
+
+class StageTimer:
+    """Collects per-stage wall-clock timings (ms) for a single request."""
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    def mark(self, name: str):
+        """Record the time elapsed since the request started (e.g. time-to-first-token)."""
+        self.timings[name] = round((time.perf_counter() - self._t0) * 1000, 2)
+
+    def as_dict(self) -> dict:
+        timings = dict(self.timings)
+        timings.setdefault("total", round((time.perf_counter() - self._t0) * 1000, 2))
+        return timings
+
+
+class DirectPipeline:
+    """retrieve → rerank → one synthesis call, without the CrewAI agent loop."""
+
+    def __init__(self, retriever, node_postprocessors=None, llm=None, embed_model=None, sessions=None):
+        self.retriever = retriever
+        self.embed_model = embed_model
+        self.sessions = sessions
+        self.node_postprocessors = node_postprocessors or []
+        # Reused candidates are only safe to answer from if a reranker re-orders them for the new question
+        self.reranks = any(p.class_name() != "ContextPacker" for p in self.node_postprocessors)
+        self.synthesizer = get_response_synthesizer(llm=llm)
+        self.streaming_synthesizer = get_response_synthesizer(llm=llm, streaming=True)
+
+    async def aretrieve(self, question: str, timer: StageTimer, embedding=None, session=None, follow_up=False):
+        """`embedding` may be passed in when the caller already has it (answer cache lookup).
+        With a conversation `session`, an on-topic `follow_up` reranks the previous turn's
+        candidates instead of searching again (only when there is a reranker)."""
+        query_bundle = QueryBundle(question, embedding=embedding)
+        if embedding is None and self.embed_model is not None:
+            # Embed up front so the search stage below measures pgvector/FTS time only
+            with timer.stage("embed"):
+                query_bundle.embedding = await run_sync(self.embed_model.get_query_embedding, question)
+        use_session = session is not None and self.sessions is not None
+        nodes = None
+        if use_session and follow_up and self.reranks:
+            nodes = self.sessions.reusable(session, query_bundle.embedding)
+        searched = nodes is None
+        if searched:
+            with timer.stage("search"):
+                nodes = await self.retriever.aretrieve(query_bundle)
+        if use_session:
+            self.sessions.record(session, question, query_bundle.embedding, nodes, searched=searched)
+        with timer.stage("rerank"):
+            for postprocessor in self.node_postprocessors:
+                # Rerankers are sync (and Cohere is a network call): keep them off the loop
+                nodes = await run_sync(postprocessor.postprocess_nodes, nodes, query_bundle=query_bundle)
+        return nodes
+
+    async def arun(self, question: str, timer: StageTimer, embedding=None, session=None, follow_up=False):
+        nodes = await self.aretrieve(question, timer, embedding, session, follow_up)
+        with timer.stage("synthesize"):
+            return await self.synthesizer.asynthesize(question, nodes)
+
+    async def astream(self, question: str, timer: StageTimer, embedding=None, session=None, follow_up=False):
+        """Returns a streaming response; generation timings are recorded by the consumer."""
+        nodes = await self.aretrieve(question, timer, embedding, session, follow_up)
+        return await self.streaming_synthesizer.asynthesize(question, nodes)
@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from rag.settings import RERANK_CACHE_SIZE, RERANK_MODEL, RERANKER, SIMILARITY_TOP_K
+
+# Loaded once per process and shared by every reranker instance (API, agent tool, eval)
+_encoders = {}
+_encoders_lock = threading.Lock()
+_score_cache: "OrderedDict[tuple, float]" = OrderedDict()
+_score_cache_lock = threading.Lock()
+
+
+def get_cross_encoder(model: str = RERANK_MODEL):
+    with _encoders_lock:
+        if model not in _encoders:
+            from rag.model_service import RemoteCrossEncoder, remote_enabled
+
+            if remote_enabled():
+                _encoders[model] = RemoteCrossEncoder(model)
+            else:
+                from sentence_transformers import CrossEncoder
+
+                _encoders[model] = CrossEncoder(model, backend="onnx", device="cpu")
+        return _encoders[model]
+
+
+class LocalCrossEncoderRerank(BaseNodePostprocessor):
+    """Reranks candidates with a local ONNX cross-encoder: all uncached pairs in one batched pass.
+
+    Scores are cached by (model, query, node id), so repeated questions skip inference.
+    """
+
+    model: str = Field(default=RERANK_MODEL)
+    top_n: int = Field(default=SIMILARITY_TOP_K)
+    cache_size: int = Field(default=RERANK_CACHE_SIZE)
+    _encoder = PrivateAttr()
+    _lock = PrivateAttr(default_factory=threading.Lock)
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._encoder = get_cross_encoder(self.model)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalCrossEncoderRerank"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"score_cache_hits": self._hits, "score_cache_misses": self._misses, "cached": len(_score_cache)}
+
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None
+    ) -> List[NodeWithScore]:
+        if query_bundle is None or not nodes:
+            return nodes[: self.top_n]
+
+        query = query_bundle.query_str
+        keys = [(self.model, query, n.node.node_id) for n in nodes]
+        scores: List[Optional[float]] = [None] * len(nodes)
+        with _score_cache_lock:
+            for i, key in enumerate(keys):
+                if key in _score_cache:
+                    _score_cache.move_to_end(key)
+                    scores[i] = _score_cache[key]
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        with self._lock:  # called from several executor threads at once
+            self._hits += len(nodes) - len(missing)
+            self._misses += len(missing)
+        if missing:
+            pairs = [(query, nodes[i].node.get_content(metadata_mode=MetadataMode.NONE)) for i in missing]
+            predicted = self._encoder.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+            with _score_cache_lock:
+                for i, score in zip(missing, predicted):
+                    scores[i] = float(score)
+                    _score_cache[keys[i]] = scores[i]
+                while len(_score_cache) > self.cache_size:
+                    _score_cache.popitem(last=False)
+
+        ranked = sorted(zip(nodes, scores), key=lambda pair: pair[1], reverse=True)[: self.top_n]
+        return [NodeWithScore(node=n.node, score=score) for n, score in ranked]
+
+
+def build_reranker(cohere_api_key: Optional[str] = None, backend: str = RERANKER, top_n: int = SIMILARITY_TOP_K):
+    """The configured reranker stage, or None when reranking is off."""
+    if backend == "auto":
+        backend = "cohere" if cohere_api_key else "local"
+    if backend == "cohere":
+        if not cohere_api_key:
+            raise ValueError("RERANKER=cohere requires COHERE_API_KEY")
+        from llama_index.postprocessor.cohere_rerank import CohereRerank
+
+        return CohereRerank(api_key=cohere_api_key, top_n=top_n)
+    if backend == "local":
+        return LocalCrossEncoderRerank(top_n=top_n)
+    return None
@@ -0,0 +1,155 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+
+from rag.answer_cache import read_index_version
+from rag.settings import SESSION_CONTEXT_TERMS, SESSION_MAX, SESSION_REUSE_SIMILARITY, SESSION_TTL
+
+_FOLLOW_UP_START = re.compile(
+    r"^\W*(and|but|also|or|so|then|what about|how about|what if|in that case|same|ok|okay)\b", re.IGNORECASE
+)
+_REFERENCE = re.compile(
+    r"\b(it|its|that|this|those|these|they|them|their|there|such|same|above|below|former|latter)\b", re.IGNORECASE
+)
+_STOPWORDS = set(
+    "a an the and or but so then also of to in on for with by at from as is are was were be been do does did "
+    "what which who whom whose when where why how can could should would will shall may might must i we you "
+    "he she it its they them their our your my me us this that these those there here such same above below "
+    "about if not no any all some more most other than too very just only into over under again ok okay please "
+    "many much tell explain give show get gets have has had".split()
+)
+
+
+def _terms(text: str) -> List[str]:
+    """Content words in order of appearance, without repeats."""
+    seen = []
+    for word in re.findall(r"\w[\w./-]*", text.lower()):
+        word = word.rstrip(".-/")
+        if len(word) > 1 and word not in _STOPWORDS and word not in seen:
+            seen.append(word)
+    return seen
+
+
+def is_follow_up(question: str) -> bool:
+    """A question that leans on the earlier turns ("and for tenders above that amount?")."""
+    terms = len(_terms(question))
+    return bool(_FOLLOW_UP_START.match(question)) or terms < 3 or (terms < 6 and bool(_REFERENCE.search(question)))
+
+
+def rewrite_question(question: str, history: List[str], max_terms: int = SESSION_CONTEXT_TERMS) -> str:
+    """Standalone version of a follow-up, without an LLM.
+
+    Carries the content terms of the earlier user turns on the same topic (back to the last
+    question that stood on its own), most recent first, capped at `max_terms`. Questions that
+    are not follow-ups come back unchanged.
+    """
+    if not history or not is_follow_up(question):
+        return question
+    topic = []
+    for earlier in reversed(history):
+        topic.append(earlier)
+        if not is_follow_up(earlier):
+            break
+    asked = set(_terms(question))
+    carried = []
+    for earlier in topic:
+        carried += [t for t in _terms(earlier) if t not in asked and t not in carried]
+    carried = carried[:max_terms]
+    return f"{question} (context: {' '.join(carried)})" if carried else question
+
+
+@dataclass
+class Session:
+    id: str
+    turns: int = 0
+    question: Optional[str] = None  # previous turn, as searched (rewritten)
+    embedding: Optional[np.ndarray] = None
+    candidates: list = field(default_factory=list)  # previous turn's retrieved nodes, before rerank
+    touched: float = field(default_factory=time.time)
+
+
+class SessionStore:
+    """Size-bounded LRU of conversations, dropped after `ttl` idle seconds.
+
+    Only the last turn's retrieval is kept: the transcript itself comes with every request.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX, ttl: float = SESSION_TTL,
+                 reuse_similarity: float = SESSION_REUSE_SIMILARITY):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.reuse_similarity = reuse_similarity
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_version = read_index_version()
+        self.rewrites = 0
+        self.reused = 0
+        self.searched = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Session:
+        now = time.time()
+        with self._lock:
+            version = read_index_version()
+            if version != self._index_version:
+                # Re-ingested: candidates held by sessions may be gone or stale
+                for session in self._sessions.values():
+                    session.candidates = []
+                self._index_version = version
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if self.ttl <= 0 or now - oldest.touched <= self.ttl:
+                    break
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            session.touched = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def count_rewrite(self):
+        with self._lock:
+            self.rewrites += 1
+
+    def reusable(self, session: Session, embedding) -> Optional[list]:
+        """The previous turn's candidates if this question is on the same topic, else None."""
+        with self._lock:
+            if not session.candidates or session.embedding is None or embedding is None:
+                return None
+            query = np.asarray(embedding, dtype=np.float32)
+            similarity = float(session.embedding @ query) / (float(np.linalg.norm(query)) or 1.0)
+            if similarity < self.reuse_similarity:
+                return None
+            self.reused += 1
+            return list(session.candidates)
+
+    def record(self, session: Session, question: str, embedding, candidates: list, searched: bool = True):
+        with self._lock:
+            session.turns += 1
+            session.question = question
+            if embedding is not None:
+                vec = np.asarray(embedding, dtype=np.float32)
+                session.embedding = vec / (np.linalg.norm(vec) or 1.0)
+            session.candidates = list(candidates)
+            if searched:
+                self.searched += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "rewrites": self.rewrites,
+                "retrievals_reused": self.reused,
+                "retrievals_searched": self.searched,
+                "evictions": self.evictions,
+            }
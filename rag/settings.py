@@ -1,43 +1,297 @@
 
 from llama_index.core import Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.ollama import Ollama
-from llama_index.vector_stores.postgres import PGVectorStore
+from dotenv import load_dotenv
 import os
 
+load_dotenv()
+
+# Request handling: how many chats run the pipeline at once, how many may wait
+# for a slot, and how many threads are available for work that is still sync.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "8"))
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "64"))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "30"))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "8"))
+
+# Default chat pipeline: "direct" (retrieve → rerank → synthesize) or "agent" (CrewAI)
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "direct")
+
+# Tracing (Prometheus /metrics is always on): "none", "otlp" (standard OTEL_EXPORTER_OTLP_*
+# env vars) or "arize" (needs ARIZE_SPACE_ID + ARIZE_API_KEY). Never prompts at startup.
+TRACING_BACKEND = os.getenv("TRACING_BACKEND", "none")
+TRACING_PROJECT = os.getenv("TRACING_PROJECT", "llamaindex-contextual-rag-tracing")
+ARIZE_SPACE_ID = os.getenv("ARIZE_SPACE_ID")
+ARIZE_API_KEY = os.getenv("ARIZE_API_KEY")
+
+# Ollama. Every LLM call goes through rag.llm_gateway, which balances over OLLAMA_BASE_URLS
+# (comma-separated; defaults to OLLAMA_BASE_URL) with OLLAMA_NUM_PARALLEL requests per
+# endpoint. Set that to the server's own OLLAMA_NUM_PARALLEL.
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_BASE_URLS = [u.strip() for u in os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if u.strip()]
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:1b")
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+# Context window and prompt batch per request. Raising OLLAMA_NUM_CTX (e.g. 4096) grows the KV
+# cache of every slot (x OLLAMA_NUM_PARALLEL) and the default CONTEXT_TOKEN_BUDGET with it
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "1024"))
+OLLAMA_NUM_BATCH = int(os.getenv("OLLAMA_NUM_BATCH", "4"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))  # wait for a free endpoint slot
+LLM_MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", "64"))
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "10"))
+LLM_COALESCE = os.getenv("LLM_COALESCE", "true").lower() == "true"  # share identical in-flight prompts
+
+# Local state (caches, index version marker) lives here
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), ".cache"))
+
+# Answer cache: exact match on normalized question, then nearest query embedding
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# Embedding cache: in-process LRU for queries + on-disk store under CACHE_DIR/embeddings
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_QUERY_CACHE_SIZE = int(os.getenv("EMBED_QUERY_CACHE_SIZE", "4096"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+# "huggingface" (EMBED_MODEL_NAME on ONNX) or "hash": a deterministic, model-free stand-in
+# (rag.hash_embedding) for benchmarks and offline runs. Hash vectors don't mix with real ones:
+# use a separate VECTOR_TABLE.
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "huggingface")
+
+# Query micro-batching: concurrent query embeddings share one forward pass of up to
+# EMBED_MICROBATCH_MAX queries; a lone query waits at most EMBED_MICROBATCH_WAIT_MS for company
+EMBED_MICROBATCH_ENABLED = os.getenv("EMBED_MICROBATCH_ENABLED", "true").lower() == "true"
+EMBED_MICROBATCH_MAX = int(os.getenv("EMBED_MICROBATCH_MAX", "32"))
+EMBED_MICROBATCH_WAIT_MS = float(os.getenv("EMBED_MICROBATCH_WAIT_MS", "2"))
+
+# Multi-worker serving: with MODEL_SERVICE_SOCKET set, workers send embedding, rerank and
+# answer-cache calls to one model service process over this Unix socket (scripts/serve.py
+# starts both). Unset = everything in-process, as with a single uvicorn worker.
+MODEL_SERVICE_SOCKET = os.getenv("MODEL_SERVICE_SOCKET", "")
+MODEL_SERVICE_AUTHKEY = os.getenv("MODEL_SERVICE_AUTHKEY", "")
+MODEL_SERVICE_CONNECTIONS = int(os.getenv("MODEL_SERVICE_CONNECTIONS", "8"))  # per worker
+MODEL_SERVICE_TIMEOUT = float(os.getenv("MODEL_SERVICE_TIMEOUT", "30"))
+
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 50
+
+# Postgres / pgvector
+DB_CONFIG = {
+    "host": os.getenv("PGHOST", "localhost"),
+    "port": int(os.getenv("PGPORT", "5432")),
+    "dbname": os.getenv("PGDATABASE", "rag_db"),
+    "user": os.getenv("PGUSER", "mac"),
+    "password": os.getenv("PGPASSWORD", ""),
+}
+VECTOR_TABLE = os.getenv("VECTOR_TABLE", "contextual_rag_docs")
+EMBED_DIM = 384
+# The embedder the stored vectors come from (the ingest manifest re-embeds documents when it changes)
+EMBED_MODEL_ID = f"hash-{EMBED_DIM}" if EMBED_BACKEND == "hash" else EMBED_MODEL_NAME
+
+# Vector store backend: "postgres" (PGVectorStore, ANN index, full-text search) or "numpy": an
+# in-process matrix (rag.numpy_store) with exact top-k, saved as snapshots under
+# VECTOR_STORE_DIR/<VECTOR_TABLE>, for single-corpus and edge installs without a Postgres server.
+# VECTOR_QUANTIZE="int8" stores it in a quarter of the memory at a small accuracy cost.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "postgres")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "vector_store"))
+VECTOR_QUANTIZE = os.getenv("VECTOR_QUANTIZE", "none")
+
+# Connection pools: psycopg2/asyncpg pools in rag.db, SQLAlchemy pool inside PGVectorStore
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # wait for a free connection, then fail
+
+# ANN index on the embedding column: "hnsw", "ivfflat" or "none" (exact scan)
+ANN_INDEX = os.getenv("ANN_INDEX", "hnsw")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "0"))  # 0 = rows / 1000 (min 10) at build time
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+
+# Retrieval: "hybrid" fuses pgvector + Postgres full-text with reciprocal rank fusion,
+# "vector" is dense-only. SIMILARITY_TOP_K is what reaches the reranker/LLM.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "3"))
+VECTOR_CANDIDATES = int(os.getenv("VECTOR_CANDIDATES", "20"))
+TEXT_CANDIDATES = int(os.getenv("TEXT_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+TEXT_SEARCH_CONFIG = os.getenv("TEXT_SEARCH_CONFIG", "english")
+
+# Corpus routing: ingest tags every chunk with its document's corpus (rag.corpora, matched on the
+# file name; CORPORA_FILE is a JSON file replacing the built-in corpora). Queries are routed
+# without an LLM: "keyword" (corpus keywords in the question), "centroid" (nearest corpus mean
+# embedding), "auto" (keywords, else centroid) or "off". A query is searched only in the chosen
+# corpora, or everywhere when more than ROUTING_MAX_CORPORA tie
+CORPORA_FILE = os.getenv("CORPORA_FILE", "")
+ROUTING_MODE = os.getenv("ROUTING_MODE", "auto")
+ROUTING_MAX_CORPORA = int(os.getenv("ROUTING_MAX_CORPORA", "2"))
+ROUTING_SIMILARITY_MARGIN = float(os.getenv("ROUTING_SIMILARITY_MARGIN", "0.03"))  # centroid ties
+
+# Context packing between rerank and synthesis: retrieval headers stripped, overlapping and
+# adjacent chunks merged, passages packed into CONTEXT_TOKEN_BUDGET tokens (default: OLLAMA_NUM_CTX
+# minus 1024 for the prompt template, question and answer, but at least 512)
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0")) or max(OLLAMA_NUM_CTX - 1024, 512)
+CONTEXT_MIN_TOKENS = int(os.getenv("CONTEXT_MIN_TOKENS", "64"))  # don't add a trimmed passage below this
+
+# Conversations: state per conversation id (the request's `conversation_id` or an
+# X-Conversation-Id / X-OpenWebUI-Chat-Id header; none without one), kept
+# in an LRU of SESSION_MAX entries that expire after SESSION_TTL idle seconds. Follow-ups are
+# rewritten into a standalone question by carrying up to SESSION_CONTEXT_TERMS terms from the
+# earlier turns on the same topic (no LLM). A follow-up whose question embedding is within
+# SESSION_REUSE_SIMILARITY of the previous turn's reranks that turn's candidates instead of
+# searching again (only with a reranker). Only the rewritten question reaches the prompt, never the transcript.
+SESSIONS_ENABLED = os.getenv("SESSIONS_ENABLED", "true").lower() == "true"
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+SESSION_CONTEXT_TERMS = int(os.getenv("SESSION_CONTEXT_TERMS", "12"))
+SESSION_REUSE_SIMILARITY = float(os.getenv("SESSION_REUSE_SIMILARITY", "0.85"))
+
+# Reranking: "auto" = Cohere when COHERE_API_KEY is set, else the local cross-encoder;
+# "cohere", "local" or "none" to force one. With a reranker the retriever returns
+# RERANK_CANDIDATES nodes and the reranker keeps SIMILARITY_TOP_K of them.
+RERANKER = os.getenv("RERANKER", "auto")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+
+# Ingestion: parser processes, chunks per embedding call, rows per DB write
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "256"))
+INGEST_WRITE_BATCH = int(os.getenv("INGEST_WRITE_BATCH", "1000"))
+INGEST_WRITE_MODE = os.getenv("INGEST_WRITE_MODE", "copy")  # "copy" or "insert"
+# Streaming ingest: the file is read section by section (PDF pages, ~INGEST_SECTION_CHARS of
+# text) and each embed batch is written before the next is read, so memory stays flat.
+# "auto" streams files of INGEST_STREAM_MIN_BYTES or more; "always" / "never" force it.
+# Smaller files load through SimpleDirectoryReader; streamed PDFs use pypdfium2 text extraction.
+INGEST_STREAMING = os.getenv("INGEST_STREAMING", "auto")
+INGEST_STREAM_MIN_BYTES = int(os.getenv("INGEST_STREAM_MIN_BYTES", str(10 * 1024 * 1024)))
+INGEST_SECTION_CHARS = int(os.getenv("INGEST_SECTION_CHARS", "20000"))
+
+# Evaluation harness: retrieval concurrency and where checkpoints/reports go
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "8"))
+EVAL_OUTPUT_DIR = os.getenv("EVAL_OUTPUT_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "eval_reports"))
+
+# Bulk queries (/v1/batch, scripts/batch.py): questions are embedded BATCH_EMBED_SIZE per
+# forward pass, searched BATCH_SEARCH_CONCURRENCY at a time and synthesized
+# BATCH_LLM_CONCURRENCY at a time (default: half the Ollama slots, leaving the rest to chat).
+# A named run checkpoints finished rows under BATCH_OUTPUT_DIR; rerunning it resumes.
+BATCH_EMBED_SIZE = int(os.getenv("BATCH_EMBED_SIZE", "64"))
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "8"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "0")) or max(1, len(OLLAMA_BASE_URLS) * OLLAMA_NUM_PARALLEL // 2)
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "batch_results"))
+
+# Chunk context at ingest: "template" (static header) or "llm" (Ollama writes a short
+# situating context per chunk, cached under CACHE_DIR/chunk_contexts.sqlite)
+CHUNK_CONTEXT_MODE = os.getenv("CHUNK_CONTEXT_MODE", "template")
+CHUNK_CONTEXT_CONCURRENCY = int(os.getenv("CHUNK_CONTEXT_CONCURRENCY", "4"))  # ≤ endpoints × OLLAMA_NUM_PARALLEL
+CHUNK_CONTEXT_DOC_CHARS = int(os.getenv("CHUNK_CONTEXT_DOC_CHARS", "12000"))
+CHUNK_CONTEXT_NUM_CTX = int(os.getenv("CHUNK_CONTEXT_NUM_CTX", "8192"))
+
 def init_settings():
-    Settings.chunk_size = 512
-    Settings.chunk_overlap = 50
-
-    Settings.llm = Ollama(
-        # model="llama3.1:8b",
-        model="llama3.2:1b",
-        base_url="http://localhost:11434",
-        # base_url="http://13.212.147.243:11434",
-        request_timeout=120.0,
-        # LlamaIndex passes these to Ollama under "options"
-        additional_kwargs={"options": {
-            "num_ctx": 1024,       # try 2048–4096
-            "num_batch": 4,       # optional: reduce if still tight
-            # "num_gpu": 0,        # if CPU-only, make explicit
-        }}
-    )
+    Settings.chunk_size = CHUNK_SIZE
+    Settings.chunk_overlap = CHUNK_OVERLAP
 
-    Settings.embed_model = HuggingFaceEmbedding(
-        model_name="BAAI/bge-small-en-v1.5",
-        backend="onnx",
-        device="cpu",
-    )
+    from rag.llm_gateway import GatewayLLM  # imports this module's settings
+
+    Settings.llm = GatewayLLM()
+
+    Settings.embed_model = build_embed_model()
     print("✅ Settings initialized with Ollama and HuggingFace embeddings.")
 
+def build_embed_model():
+    from rag.model_service import RemoteEmbedding, remote_enabled
+
+    if remote_enabled():
+        return RemoteEmbedding()  # the model service holds the model and the cache
+
+    if EMBED_CACHE_ENABLED:
+        from rag.embed_cache import CachedEmbedding  # imports this module's settings
+
+        # The model (an ONNX session) is built on the first cache miss: cached queries never load it
+        return CachedEmbedding.with_disk_store(
+            _build_local_embed_model, model_name=EMBED_MODEL_ID, embed_batch_size=EMBED_BATCH_SIZE
+        )
+    return _build_local_embed_model()
+
+def _build_local_embed_model():
+    if EMBED_BACKEND == "hash":
+        from rag.hash_embedding import HashEmbedding
+
+        embed_model = HashEmbedding(dim=EMBED_DIM, embed_batch_size=EMBED_BATCH_SIZE)
+    else:
+        # sentence-transformers/torch take seconds to import: only pay for it when a model is built
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+        embed_model = HuggingFaceEmbedding(
+            model_name=EMBED_MODEL_NAME,
+            backend="onnx",
+            device="cpu",
+            embed_batch_size=EMBED_BATCH_SIZE,
+        )
+    if EMBED_MICROBATCH_ENABLED:
+        from rag.embed_batcher import MicroBatchedEmbedding
+
+        embed_model = MicroBatchedEmbedding(embed_model)
+    return embed_model
+
+_vector_store = None
+
 def init_vector_store():
+    """Shared vector store. PGVectorStore: one SQLAlchemy engine (sync + async) and pool per
+    process; NumpyVectorStore: one memory-mapped snapshot per process."""
+    global _vector_store
+    if _vector_store is None:
+        if VECTOR_BACKEND == "numpy":
+            from rag.numpy_store import NumpyVectorStore
+
+            _vector_store = NumpyVectorStore(
+                os.path.join(VECTOR_STORE_DIR, VECTOR_TABLE), dim=EMBED_DIM, quantize=VECTOR_QUANTIZE
+            )
+            print(f"✅ Vector store initialized with NumPy ({_vector_store.stats()['live_rows']} chunks).")
+        else:
+            _vector_store = _build_vector_store()
+            print("✅ Vector store initialized with PGVector.")
+    return _vector_store
+
+def vector_store_pool_status() -> dict:
+    engine = getattr(_vector_store, "_engine", None)
+    if engine is None:
+        return {}
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+def _build_vector_store():
+    from llama_index.vector_stores.postgres import PGVectorStore
+
     return PGVectorStore.from_params(
-        host="localhost",
-        port=5432,
-        database="rag_db",
-        user="mac",
-        password="",
-        table_name="contextual_rag_docs",
-        embed_dim=384
+        host=DB_CONFIG["host"],
+        port=DB_CONFIG["port"],
+        database=DB_CONFIG["dbname"],
+        user=DB_CONFIG["user"],
+        password=DB_CONFIG["password"],
+        table_name=VECTOR_TABLE,
+        embed_dim=EMBED_DIM,
+        # With hnsw_kwargs the store creates the index on a new table and applies
+        # hnsw.ef_search on every query (overridable per query, see rag.ann_index)
+        hnsw_kwargs={
+            "hnsw_m": HNSW_M,
+            "hnsw_ef_construction": HNSW_EF_CONSTRUCTION,
+            "hnsw_ef_search": HNSW_EF_SEARCH,
+            "hnsw_dist_method": "vector_cosine_ops",
+        } if ANN_INDEX == "hnsw" else None,
+        create_engine_kwargs={
+            "pool_size": DB_POOL_MAX,
+            "max_overflow": DB_POOL_MAX,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "pool_recycle": DB_POOL_RECYCLE,
+        },
     )
-    print("✅ Vector store initialized with PGVector.")
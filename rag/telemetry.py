@@ -0,0 +1,38 @@
+from rag.settings import ARIZE_API_KEY, ARIZE_SPACE_ID, TRACING_BACKEND, TRACING_PROJECT
+
+
+def init_tracing(backend: str = TRACING_BACKEND):
+    """Optional OpenTelemetry export of LlamaIndex spans. Never blocks; failures only disable tracing."""
+    if backend == "none":
+        return None
+    try:
+        if backend == "arize":
+            if not (ARIZE_SPACE_ID and ARIZE_API_KEY):
+                raise ValueError("TRACING_BACKEND=arize requires ARIZE_SPACE_ID and ARIZE_API_KEY")
+            from arize.otel import register
+
+            tracer_provider = register(
+                space_id=ARIZE_SPACE_ID,
+                api_key=ARIZE_API_KEY,
+                project_name=TRACING_PROJECT,
+            )
+        elif backend == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+            # Endpoint/headers come from the standard OTEL_EXPORTER_OTLP_* variables
+            tracer_provider = TracerProvider(resource=Resource.create({"service.name": TRACING_PROJECT}))
+            tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        else:
+            raise ValueError(f"Unknown TRACING_BACKEND: {backend}")
+
+        from openinference.instrumentation.llama_index import LlamaIndexInstrumentor
+
+        LlamaIndexInstrumentor().instrument(tracer_provider=tracer_provider, skip_dep_check=True)
+    except Exception as e:
+        print(f"⚠️ Tracing disabled: {e}")
+        return None
+    print(f"✅ Tracing enabled ({backend}).")
+    return tracer_provider
@@ -0,0 +1,59 @@
+import asyncio
+import traceback
+
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from rag.concurrency import run_sync
+from rag.llm_gateway import get_gateway
+from rag.pipeline import StageTimer
+
+
+class Readiness:
+    """Startup progress for /health/ready: per-step timings, ready flag, first error."""
+
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self.timer = StageTimer()
+
+    def fail(self):
+        self.error = traceback.format_exc()
+        print(f"❌ Startup failed:\n{self.error}")
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "steps_ms": self.timer.as_dict(), "error": self.error}
+
+
+async def warm_llm():
+    await get_gateway().awarm()
+
+
+def warm_embedder(embed_model):
+    # Bypass the embedding cache: the point is to run the ONNX session once
+    getattr(embed_model, "inner", embed_model).get_query_embedding("warmup")
+
+
+def warm_rerankers(node_postprocessors):
+    nodes = [NodeWithScore(node=TextNode(text="warmup"), score=0.0)]
+    for postprocessor in node_postprocessors or []:
+        if postprocessor.class_name() == "LocalCrossEncoderRerank":  # Cohere is remote: nothing to warm
+            postprocessor.postprocess_nodes(nodes, query_bundle=QueryBundle("warmup"))
+
+
+async def warm_up(readiness: Readiness, embed_model, node_postprocessors):
+    """First inference of each model, concurrently, so the first real request isn't the cold one."""
+
+    async def step(name, fn, *args):
+        with readiness.timer.stage(name):
+            await fn(*args)
+
+    results = await asyncio.gather(
+        step("warm_llm", warm_llm),
+        step("warm_embedder", run_sync, warm_embedder, embed_model),
+        step("warm_reranker", run_sync, warm_rerankers, node_postprocessors),
+        return_exceptions=True,
+    )
+    for result in results:
+        # A cold model is slow, not broken: report it and serve anyway
+        if isinstance(result, Exception):
+            print(f"⚠️ Warmup step failed: {result!r}")
@@ -3,7 +3,7 @@ import os
 
 import json
 from datasets import Dataset
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.core.schema import QueryBundle
 from ragas.embeddings import LangchainEmbeddingsWrapper
 # from langchain_ollama import OllamaLLM
 from langchain_openai import ChatOpenAI
@@ -13,48 +13,40 @@ from ragas import evaluate
 from ragas.metrics import context_precision, context_recall, faithfulness, answer_relevancy
 
 from scripts.ingest import get_query_engine
+from rag.settings import build_embed_model
 
-your_eval_questions = []
-with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "eval_dataset/eval_ds_Abu Dhabi Procurement Standards.json"), "r", encoding="utf-8") as f:
-    your_eval_questions = json.load(f)
+EVAL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "eval_dataset")
+DEFAULT_DATASET = os.path.join(EVAL_DIR, "eval_ds_Abu Dhabi Procurement Standards.json")
 
-# def get_length():
-#     print("Length of your_eval_questions:", len(your_eval_questions))
-#     print(your_eval_questions[0])
+def load_eval_questions(path=DEFAULT_DATASET):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-def create_dataset(query_engine):
+def build_dataset(items, contexts):
+    return Dataset.from_dict({
+        "question": [d["question"] for d in items],
+        "contexts": contexts,
+        "answer": [d["answer"] for d in items],
+        "reference": [d["reference"] for d in items],
+    })
+
+def create_dataset(query_engine, items=None):
     print("in dataset...")
-    # Suppose you have eval_data as above (with 'question' and 'answer')
-    questions = [d["question"] for d in your_eval_questions]
-    answers = []
-    ground_truths = [d["answer"] for d in your_eval_questions]
-    references = [d["reference"] for d in your_eval_questions]
-
-    # For each question, use your retriever to get context(s)
-    for i, q in enumerate(questions):
-        print(f"Querying ({i+1}/{len(questions)})")
-        # This assumes LlamaIndex returns context nodes; adjust as needed
-        resp = query_engine.query(q)
-        # resp.source_nodes returns list of nodes; get their text fields
-        ctxs = [node.node.text for node in getattr(resp, "source_nodes", [])]
-        answers.append(ctxs)
+    items = items if items is not None else load_eval_questions()
+    contexts = []
+
+    # Only the contexts are scored, so retrieve (+ rerank) without running LLM synthesis
+    for i, d in enumerate(items):
+        print(f"Querying ({i+1}/{len(items)})")
+        nodes = query_engine.retrieve(QueryBundle(d["question"]))
+        contexts.append([node.node.text for node in nodes])
 
     print("Creating dataset...")
-    ds = Dataset.from_dict({
-        "question": questions,
-        "contexts": answers,
-        "answer": ground_truths,
-        "reference": references
-    })
-    return ds
+    return build_dataset(items, contexts)
 
-def execute_eval(query_engine=None):
-    if query_engine is None:
-        query_engine = get_query_engine()
-    
-    ds = create_dataset(query_engine)
+def score_dataset(ds):
     print("starting_up_evaluation")
-    hf_embedder = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5", backend="onnx", device="cpu")
+    hf_embedder = build_embed_model()  # same bge-small model, behind the embedding cache
     wrapped_embeddings = LangchainEmbeddingsWrapper(hf_embedder)
 
 
@@ -86,5 +78,10 @@ def execute_eval(query_engine=None):
     print(results)
     return results
 
+def execute_eval(query_engine=None, items=None):
+    if query_engine is None:
+        query_engine = get_query_engine()
+    return score_dataset(create_dataset(query_engine, items))
+
 if __name__ == "__main__":
     execute_eval()
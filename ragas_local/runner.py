@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import csv
+import glob
+import json
+import math
+import os
+import re
+import shutil
+import time
+import traceback
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from llama_index.core.schema import QueryBundle
+
+from rag.settings import EVAL_CONCURRENCY, EVAL_OUTPUT_DIR
+
+EVAL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "eval_dataset")
+
+
+def load_eval_items(pattern: str = os.path.join(EVAL_DIR, "*.json")) -> list:
+    """Every question of every eval set, tagged with a stable id ("<dataset>:<index>")."""
+    items = []
+    for path in sorted(glob.glob(pattern)):
+        dataset = os.path.splitext(os.path.basename(path))[0].removeprefix("eval_ds_")
+        with open(path, encoding="utf-8") as f:
+            for i, item in enumerate(json.load(f)):
+                items.append({"id": f"{dataset}:{i}", "dataset": dataset, **item})
+    return items
+
+
+def _read_jsonl(path: str) -> dict:
+    rows = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    rows[row["id"]] = row
+    return rows
+
+
+def check_run_id(run_id: str) -> str:
+    """Run ids name a directory under EVAL_OUTPUT_DIR: plain names only."""
+    if not re.fullmatch(r"[\w.-]+", run_id) or run_id in (".", ".."):
+        raise ValueError(f"Invalid run id: {run_id!r}")
+    return run_id
+
+
+@dataclass
+class EvalJob:
+    run_id: str
+    state: str = "pending"  # pending → collecting → scoring → done | failed
+    total: int = 0
+    collected: int = 0
+    scored_datasets: list = field(default_factory=list)
+    started: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    report_json: Optional[str] = None
+    report_csv: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def run_dir(self) -> str:
+        return os.path.join(EVAL_OUTPUT_DIR, check_run_id(self.run_id))
+
+    def status(self) -> dict:
+        return asdict(self)
+
+
+def engine_retrieve(query_engine):
+    """Adapts a query engine (retriever + postprocessors) to the runner's `retrieve(question)`."""
+    async def retrieve(question: str):
+        return await query_engine.aretrieve(QueryBundle(question))
+    return retrieve
+
+
+async def collect_contexts(retrieve, items: list, job: EvalJob, concurrency: int = EVAL_CONCURRENCY) -> dict:
+    """Retrieval-only pass (retrieve + rerank, no synthesis), checkpointed to contexts.jsonl.
+
+    Questions already in the checkpoint are skipped, so an interrupted run resumes.
+    """
+    checkpoint = os.path.join(job.run_dir, "contexts.jsonl")
+    done = _read_jsonl(checkpoint)
+    job.collected = sum(item["id"] in done for item in items)
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+
+    async def collect(item):
+        async with semaphore:
+            start = time.perf_counter()
+            nodes = await retrieve(item["question"])
+            row = {
+                "id": item["id"],
+                "contexts": [n.node.text for n in nodes],
+                "retrieval_ms": round((time.perf_counter() - start) * 1000, 2),
+            }
+        async with write_lock:
+            with open(checkpoint, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row) + "\n")
+            done[item["id"]] = row
+            job.collected += 1
+
+    await asyncio.gather(*(collect(item) for item in items if item["id"] not in done))
+    return done
+
+
+def score_and_report(items: list, contexts: dict, job: EvalJob, score: bool = True):
+    """Score each eval set with RAGAS (checkpointed per set) and write report.json / report.csv."""
+    rows = {item["id"]: {
+        "id": item["id"],
+        "dataset": item["dataset"],
+        "question": item["question"],
+        "retrieval_ms": contexts[item["id"]]["retrieval_ms"],
+        "n_contexts": len(contexts[item["id"]]["contexts"]),
+    } for item in items}
+
+    if score:
+        from ragas_local.eval_local import build_dataset, score_dataset  # ragas is heavy: load on demand
+
+        scores_path = os.path.join(job.run_dir, "scores.jsonl")
+        scored = _read_jsonl(scores_path)
+        for dataset in sorted({item["dataset"] for item in items}):
+            subset = [item for item in items if item["dataset"] == dataset]
+            if not all(item["id"] in scored for item in subset):
+                result = score_dataset(build_dataset(subset, [contexts[item["id"]]["contexts"] for item in subset]))
+                metrics = result.to_pandas().to_dict(orient="records")
+                with open(scores_path, "a", encoding="utf-8") as f:
+                    for item, record in zip(subset, metrics):
+                        row = {"id": item["id"], **{
+                            k: v for k, v in record.items()
+                            if isinstance(v, (int, float)) and not isinstance(v, bool)
+                        }}
+                        f.write(json.dumps(row) + "\n")
+                        scored[item["id"]] = row
+            job.scored_datasets.append(dataset)
+        for item_id, metrics in scored.items():
+            if item_id in rows:
+                rows[item_id].update({k: v for k, v in metrics.items() if k != "id"})
+
+    ordered = [rows[item["id"]] for item in items]
+    latencies = sorted(row["retrieval_ms"] for row in ordered)
+    metric_names = sorted({k for row in ordered for k in row} - {
+        "id", "dataset", "question", "retrieval_ms", "n_contexts"
+    })
+
+    def mean(values):
+        values = [v for v in values if isinstance(v, (int, float)) and not math.isnan(v)]
+        return round(sum(values) / len(values), 4) if values else None
+
+    summary = {
+        "questions": len(ordered),
+        "retrieval_ms_p50": latencies[len(latencies) // 2] if latencies else None,
+        "retrieval_ms_p95": latencies[max(0, int(len(latencies) * 0.95) - 1)] if latencies else None,
+        **{name: mean(row.get(name) for row in ordered) for name in metric_names},
+    }
+    per_dataset = {
+        dataset: {name: mean(row.get(name) for row in ordered if row["dataset"] == dataset)
+                  for name in ["retrieval_ms", *metric_names]}
+        for dataset in sorted({row["dataset"] for row in ordered})
+    }
+
+    job.report_json = os.path.join(job.run_dir, "report.json")
+    with open(job.report_json, "w", encoding="utf-8") as f:
+        json.dump({"run_id": job.run_id, "summary": summary, "datasets": per_dataset, "questions": ordered},
+                  f, indent=2, allow_nan=True)
+    job.report_csv = os.path.join(job.run_dir, "report.csv")
+    with open(job.report_csv, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["id", "dataset", "question", "retrieval_ms", "n_contexts", *metric_names])
+        writer.writeheader()
+        writer.writerows(ordered)
+    return summary
+
+
+async def run_eval(retrieve, job: EvalJob, fresh: bool = False, score: bool = True,
+                   concurrency: int = EVAL_CONCURRENCY, items: list = None):
+    """Collect contexts concurrently, then score off the event loop. Updates `job` as it goes.
+
+    `retrieve` is an async `question -> nodes` callable (see `engine_retrieve`).
+    """
+    from rag.concurrency import run_sync
+
+    try:
+        if fresh and os.path.isdir(job.run_dir):
+            root = os.path.realpath(EVAL_OUTPUT_DIR)
+            if os.path.commonpath([root, os.path.realpath(job.run_dir)]) != root:
+                raise ValueError(f"Run directory escapes {EVAL_OUTPUT_DIR}: {job.run_dir}")
+            shutil.rmtree(job.run_dir)
+        os.makedirs(job.run_dir, exist_ok=True)
+        items = items if items is not None else load_eval_items()
+        job.total = len(items)
+        job.state = "collecting"
+        contexts = await collect_contexts(retrieve, items, job, concurrency)
+        job.state = "scoring"
+        await run_sync(score_and_report, items, contexts, job, score)
+        job.state = "done"
+    except Exception:
+        job.state = "failed"
+        job.error = traceback.format_exc()
+    finally:
+        job.finished = time.time()
+    return job
+
+
+_jobs = {}
+_tasks = set()  # the loop only keeps weak references to tasks
+
+
+def _job_done(task: asyncio.Task):
+    _tasks.discard(task)
+    if task.cancelled():
+        print("⚠️ Eval job task was cancelled.")
+    elif task.exception() is not None:
+        print(f"❌ Eval job task crashed: {task.exception()!r}")
+
+
+def start_job(retrieve, run_id: Optional[str] = None, **kwargs) -> EvalJob:
+    """Start (or resume, when `run_id` matches an earlier run) an eval in the background."""
+    run_id = check_run_id(run_id) if run_id else time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    running = _jobs.get(run_id)
+    if running is not None and running.state in ("pending", "collecting", "scoring"):
+        return running
+    job = _jobs[run_id] = EvalJob(run_id=run_id)
+    task = asyncio.get_running_loop().create_task(run_eval(retrieve, job, **kwargs))
+    _tasks.add(task)
+    task.add_done_callback(_job_done)
+    return job
+
+
+def get_job(run_id: str) -> Optional[EvalJob]:
+    return _jobs.get(run_id)
+
+
+def list_jobs() -> list:
+    return [job.status() for job in _jobs.values()]
+
+
+def latest_job() -> Optional[EvalJob]:
+    return max(_jobs.values(), key=lambda job: job.started, default=None)
+
+
+if __name__ == "__main__":
+    from scripts.ingest import get_query_engine
+
+    parser = argparse.ArgumentParser(description="Retrieval + RAGAS evaluation over eval_dataset/*.json")
+    parser.add_argument("--run-id", default="cli", help="reuse a run id to resume it")
+    parser.add_argument("--fresh", action="store_true", help="discard the run's checkpoints first")
+    parser.add_argument("--no-score", action="store_true", help="only collect contexts and latencies")
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY)
+    args = parser.parse_args()
+
+    job = asyncio.run(run_eval(
+        engine_retrieve(get_query_engine()), EvalJob(run_id=args.run_id),
+        fresh=args.fresh, score=not args.no_score, concurrency=args.concurrency,
+    ))
+    print(json.dumps(job.status(), indent=2))
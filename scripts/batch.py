@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from rag.batch import parse_items, run_batch
+from rag.hybrid import build_retriever
+from rag.pipeline import DirectPipeline
+from rag.settings import (
+    BATCH_EMBED_SIZE,
+    BATCH_LLM_CONCURRENCY,
+    BATCH_OUTPUT_DIR,
+    BATCH_SEARCH_CONCURRENCY,
+    Settings,
+)
+from scripts.ingest import candidate_depth, get_index, get_node_postprocessors
+
+load_dotenv()
+
+
+def load_items(args) -> list:
+    if args.eval:
+        from ragas_local.runner import load_eval_items
+
+        return [{"id": item["id"], "question": item["question"]} for item in load_eval_items()]
+    if args.input == "-":
+        return parse_items(sys.stdin)
+    with open(args.input, encoding="utf-8") as f:
+        return parse_items(f)
+
+
+def build_pipeline() -> DirectPipeline:
+    index = get_index()
+    node_postprocessors = get_node_postprocessors(os.getenv("COHERE_API_KEY"))
+    return DirectPipeline(
+        build_retriever(index, similarity_top_k=candidate_depth(node_postprocessors)),
+        node_postprocessors=node_postprocessors,
+        llm=Settings.llm,
+        embed_model=Settings.embed_model,
+    )
+
+
+async def main(args):
+    items = load_items(args)
+    pipeline = build_pipeline()
+    started = time.perf_counter()
+    done = errors = 0
+    totals = []
+    # The output file is the checkpoint: rows already in it are skipped, new rows appended
+    async for row in run_batch(
+        pipeline, items, Settings.embed_model, checkpoint=args.output, replay=False,
+        synthesize=not args.retrieval_only, embed_size=args.embed_size,
+        search_concurrency=args.search_concurrency, llm_concurrency=args.llm_concurrency,
+    ):
+        done += 1
+        if "error" in row:
+            errors += 1
+            print(f"❌ {row['id']}: {row['error']}")
+        totals.append(row["timings"]["total"])
+        if done % 50 == 0:
+            print(f"⏳ {done} answered ({done / (time.perf_counter() - started):.2f}/s)")
+
+    elapsed = time.perf_counter() - started
+    totals.sort()
+    print(f"✅ {done} answered, {errors} failed, {len(items) - done} already in {args.output} ({elapsed:.1f}s)")
+    if totals:
+        print(f"   p50 {totals[len(totals) // 2]:.0f} ms, p95 {totals[max(0, int(len(totals) * 0.95) - 1)]:.0f} ms per question")
+    if errors:
+        print("   Run the same command again to retry the failed questions.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions in bulk (resumable).")
+    parser.add_argument("input", nargs="?", default="-",
+                        help='JSONL with {"id", "question"} objects or bare strings ("-" = stdin)')
+    parser.add_argument("--eval", action="store_true", help="use the eval_dataset questions as input")
+    parser.add_argument("--output", help="results JSONL, also the resume checkpoint "
+                                         "(default: BATCH_OUTPUT_DIR/<input name>.jsonl)")
+    parser.add_argument("--retrieval-only", action="store_true", help="sources only, no LLM synthesis")
+    parser.add_argument("--embed-size", type=int, default=BATCH_EMBED_SIZE)
+    parser.add_argument("--search-concurrency", type=int, default=BATCH_SEARCH_CONCURRENCY)
+    parser.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY)
+    args = parser.parse_args()
+    if not args.output:
+        name = "eval" if args.eval else os.path.splitext(os.path.basename(args.input))[0]
+        if name == "-":
+            parser.error("--output is required when reading from stdin")
+        args.output = os.path.join(BATCH_OUTPUT_DIR, f"{name}.jsonl")
+    asyncio.run(main(args))
@@ -1,71 +1,37 @@
 import os
-import psycopg2
+import json
+import argparse
 from llama_index.core import StorageContext, VectorStoreIndex
-from llama_index.core.readers import SimpleDirectoryReader
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.postprocessor.cohere_rerank import CohereRerank
+from llama_index.core.query_engine import RetrieverQueryEngine
 from rag.settings import init_settings, init_vector_store, Settings
+from rag.answer_cache import bump_index_version
+from rag.corpora import tag_untagged
+from rag.ingestion import IngestionEngine, make_contextual_text
+from rag.manifest import open_manifest
+from rag import ann_index
+from rag.hybrid import build_retriever, ensure_text_search
+from rag.packing import ContextPacker
+from rag.rerank import build_reranker
+from rag.settings import CONTEXT_PACKING_ENABLED, RERANK_CANDIDATES, RETRIEVAL_MODE, SIMILARITY_TOP_K, VECTOR_BACKEND
 from dotenv import load_dotenv
 
 load_dotenv()
 
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "rag_db",
-    "user": "mac",
-    "password": ""
-}
-
-def make_contextual_text(node, doc_title="Abu Dhabi Procurement Standards"):
-    section_path = " > ".join([str(v) for k, v in node.metadata.items() if "header" in k.lower() or "section" in k.lower()])
-    section_path = section_path or node.metadata.get("file_name", "Unknown Section")
-    head = (
-        f"[DOC_TITLE] {doc_title}\n"
-        f"[SECTION_PATH] {section_path}\n"
-        f"[INTENT] Assist a procurement practitioner answering policy/process questions\n"
-        f"[CHUNK]\n"
-    )
-    return head + node.text
-
 def is_document_indexed(doc_name):
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT COUNT(*) FROM data_contextual_rag_docs WHERE metadata_::TEXT LIKE %s;",
-        (f'%{doc_name}%',)
-    )
-    count = cur.fetchone()[0]
-    cur.close()
-    conn.close()
-    return count > 0
+    # Exact lookup on the manifest's primary key instead of scanning chunk metadata
+    return open_manifest().has_document(doc_name)
 
-def ingest_document(file_path, cohere_api_key=None):
+def ingest_document(file_path, cohere_api_key=None, engine=None):
     doc_name = os.path.basename(file_path)
-    if is_document_indexed(doc_name):
-        print(f"❌ Skipping '{doc_name}': already indexed.")
+    manifest = open_manifest()
+    plan = manifest.plan([file_path])
+    if not plan.to_ingest:
+        print(f"❌ Skipping '{doc_name}': already indexed and unchanged.")
         return
 
     print(f"Processing: {file_path}")
-    init_settings()
-    vector_store = init_vector_store()
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
-    if not documents:
-        print(f"⚠️ No documents found in {file_path}")
-        return
-
-    splitter = SentenceSplitter(chunk_size=Settings.chunk_size, chunk_overlap=Settings.chunk_overlap)
-    nodes = splitter.get_nodes_from_documents(documents)
-
-    for node in nodes:
-        node.metadata["orig_text"] = node.text
-        node.metadata["doc_name"] = doc_name
-        node.text = make_contextual_text(node, doc_name)  # Pass doc_name as doc_title
-
-    index = VectorStoreIndex(nodes, storage_context=storage_context)
-    index.storage_context.persist()
-    print(f"✅ Ingested {len(nodes)} nodes from '{doc_name}' and stored in DB.")
+    engine = engine or IngestionEngine(workers=1)
+    engine.ingest_files([file_path], manifest=manifest, hashes=plan.hashes)
 
 def ingest_all_documents(rag_docs_dir, cohere_api_key=None):
     files = [
@@ -76,22 +42,85 @@ def ingest_all_documents(rag_docs_dir, cohere_api_key=None):
     if not files:
         print(f"No files found in {rag_docs_dir}")
         return
-    for file_path in files:
-        ingest_document(file_path, cohere_api_key=cohere_api_key)
 
-def get_query_engine(cohere_api_key=None):
+    manifest = open_manifest()
+    plan = manifest.plan(files)
+    print(
+        f"📋 {len(plan.new)} new, {len(plan.changed)} changed, "
+        f"{len(plan.unchanged)} unchanged, {len(plan.removed)} removed"
+    )
+    if plan.removed:
+        deleted = manifest.remove_documents(plan.removed)
+        bump_index_version()
+        print(f"🗑️ Deleted {deleted} chunks of removed documents: {', '.join(plan.removed)}")
+    report = None
+    if plan.to_ingest:
+        # One engine for the whole run: models load once, files parse in parallel
+        report = IngestionEngine().ingest_files(plan.to_ingest, manifest=manifest, hashes=plan.hashes)
+    # Chunks from before corpus routing get their corpus from the document name
+    tag_untagged()
+    if VECTOR_BACKEND == "postgres":
+        ann_index.ensure_index()
+        ann_index.ensure_corpus_indexes()
+        ensure_text_search()
+    return report
+
+def get_index():
     init_settings()
     vector_store = init_vector_store()
+    if RETRIEVAL_MODE == "hybrid" and VECTOR_BACKEND == "postgres":
+        ensure_text_search()
     storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    index = VectorStoreIndex([], storage_context=storage_context)
-    return index.as_query_engine(
-        similarity_top_k=3,
-        node_postprocessors=[CohereRerank(api_key=cohere_api_key)] if cohere_api_key else None,
+    return VectorStoreIndex([], storage_context=storage_context)
+
+def get_node_postprocessors(cohere_api_key=None):
+    # rerank → context packing; the packer works on whatever the reranker kept
+    reranker = build_reranker(cohere_api_key=cohere_api_key)
+    node_postprocessors = [reranker] if reranker is not None else []
+    if CONTEXT_PACKING_ENABLED:
+        node_postprocessors.append(ContextPacker())
+    return node_postprocessors or None
+
+def candidate_depth(node_postprocessors, top_k=None):
+    # Retrieve wide when a reranker narrows the list afterwards; a caller's `top_k` (the agent
+    # asks for 3) may widen the candidate pool but never shrink it below RERANK_CANDIDATES
+    has_reranker = any(not isinstance(p, ContextPacker) for p in node_postprocessors or [])
+    if top_k:
+        return max(top_k, RERANK_CANDIDATES) if has_reranker else top_k
+    return RERANK_CANDIDATES if has_reranker else SIMILARITY_TOP_K
+
+def get_query_engine(cohere_api_key=None, streaming=False, index=None, top_k=None):
+    # Pass a shared `index` to build several engines without reloading models.
+    # `top_k` is the retrieve-then-rerank candidate depth.
+    if index is None:
+        index = get_index()
+    node_postprocessors = get_node_postprocessors(cohere_api_key)
+    return RetrieverQueryEngine.from_args(
+        build_retriever(index, similarity_top_k=candidate_depth(node_postprocessors, top_k)),
         llm=Settings.llm,
+        node_postprocessors=node_postprocessors,
+        streaming=streaming,
     )
 
 if __name__ == "__main__":
-    cohere_key = os.getenv("COHERE_API_KEY")
-    rag_docs_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "rag_documents")
-    ingest_all_documents(rag_docs_dir, cohere_api_key=cohere_key)
+    parser = argparse.ArgumentParser(description="Ingest rag_documents/ and manage the vector index.")
+    parser.add_argument("--rebuild-index", choices=["hnsw", "ivfflat", "none"],
+                        help="drop and rebuild the ANN index instead of ingesting")
+    parser.add_argument("--m", type=int, default=ann_index.HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=ann_index.HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--lists", type=int, default=ann_index.IVFFLAT_LISTS)
+    parser.add_argument("--ann-report", action="store_true",
+                        help="recall-vs-latency sweep over the eval_dataset questions")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.rebuild_index:
+        ann_index.rebuild_index(args.rebuild_index, m=args.m, ef_construction=args.ef_construction, lists=args.lists)
+    elif args.ann_report:
+        init_settings()
+        print(json.dumps(ann_index.recall_report(Settings.embed_model, k=args.k), indent=2))
+    else:
+        cohere_key = os.getenv("COHERE_API_KEY")
+        rag_docs_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "rag_documents")
+        ingest_all_documents(rag_docs_dir, cohere_api_key=cohere_key)
 
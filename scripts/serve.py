@@ -0,0 +1,48 @@
+import argparse
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+import uvicorn
+
+from rag.settings import CACHE_DIR
+
+
+def start_model_service(env: dict, socket_path: str, timeout: float = 300.0) -> subprocess.Popen:
+    """Start the model service and wait until its socket accepts connections (models loaded)."""
+    # Imported, not run as __main__: serve() must flag the module the model builders check
+    service = subprocess.Popen([sys.executable, "-c", "from rag.model_service import serve; serve()"], env=env)
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(socket_path):
+        if service.poll() is not None:
+            raise RuntimeError(f"model service exited with code {service.returncode}")
+        if time.monotonic() > deadline:
+            service.terminate()
+            raise TimeoutError(f"model service did not come up within {timeout}s")
+        time.sleep(0.2)
+    return service
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve main:app with N workers sharing one model service")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--socket", default=os.path.join(CACHE_DIR, "model_service.sock"))
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.socket), exist_ok=True)
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    # Workers are spawned by uvicorn and inherit this environment
+    os.environ["MODEL_SERVICE_SOCKET"] = args.socket
+    os.environ.setdefault("MODEL_SERVICE_AUTHKEY", secrets.token_hex(16))
+
+    service = start_model_service(dict(os.environ), args.socket)
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        service.terminate()
+        service.wait(timeout=10)
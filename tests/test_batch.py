@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import pytest
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from rag.batch import claim, parse_items, read_results, run_batch
+from rag.hash_embedding import HashEmbedding
+
+
+class FakePipeline:
+    """Stands in for DirectPipeline.aretrieve: one source per question, no database."""
+
+    def __init__(self):
+        self.asked = []
+
+    async def aretrieve(self, question, timer, embedding=None):
+        self.asked.append(question)
+        assert embedding is not None  # embedded in batches by run_batch
+        node = TextNode(text=question, metadata={"doc_name": "policy.pdf", "page_label": "1"})
+        return [NodeWithScore(node=node, score=0.5)]
+
+
+def collect(rows):
+    async def drain():
+        return [row async for row in rows]
+    return asyncio.run(drain())
+
+
+def test_parse_items_numbers_lines_and_rejects_duplicates():
+    items = parse_items(['"first?"', "", '{"id": "q2", "question": "second?", "tag": "x"}'])
+    assert items == [{"question": "first?", "id": "1"}, {"question": "second?", "id": "q2", "tag": "x"}]
+    with pytest.raises(ValueError):
+        parse_items(['{"id": "a", "question": "x"}', '{"id": "a", "question": "y"}'])
+    with pytest.raises(ValueError):
+        parse_items(['{"id": "a"}'])
+
+
+def test_claim_is_exclusive_until_released(tmp_path):
+    checkpoint = str(tmp_path / "run.jsonl")
+    release = claim(checkpoint)
+    with pytest.raises(RuntimeError):
+        claim(checkpoint)
+    release()
+    release()  # idempotent
+    claim(checkpoint)()
+
+
+def test_run_batch_answers_and_resumes_from_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / "run.jsonl")
+    items = parse_items([json.dumps(f"question {n}?") for n in range(1, 6)])
+    embed_model = HashEmbedding(dim=32)
+
+    pipeline = FakePipeline()
+    rows = collect(run_batch(pipeline, items[:3], embed_model, checkpoint=checkpoint, synthesize=False, embed_size=2))
+    assert sorted(row["id"] for row in rows) == ["1", "2", "3"]
+    assert all(row["sources"][0]["doc_name"] == "policy.pdf" and "error" not in row for row in rows)
+    assert set(read_results(checkpoint)) == {"1", "2", "3"}
+
+    pipeline = FakePipeline()
+    rows = collect(run_batch(pipeline, items, embed_model, checkpoint=checkpoint, synthesize=False, embed_size=2))
+    assert sorted(pipeline.asked) == ["question 4?", "question 5?"]
+    assert sum(bool(row.get("resumed")) for row in rows) == 3
+    claim(checkpoint)()  # released once the run finished
+
+
+def test_run_batch_refuses_a_claimed_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / "run.jsonl")
+    release = claim(checkpoint)
+    try:
+        with pytest.raises(RuntimeError):
+            collect(run_batch(FakePipeline(), parse_items(['"q?"']), HashEmbedding(dim=32), checkpoint=checkpoint))
+    finally:
+        release()
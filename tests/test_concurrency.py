@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from rag.concurrency import QueueFullError, RequestLimiter, run_sync
+
+
+def test_limiter_sheds_load_when_the_queue_is_full():
+    async def scenario():
+        limiter = RequestLimiter(max_concurrent=1, max_queued=1, timeout=5)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await limiter.acquire()
+        limiter.release()
+        await waiter
+        assert limiter.stats()["in_flight"] == 1
+    asyncio.run(scenario())
+
+
+def test_limiter_times_out_waiting_for_a_slot():
+    async def scenario():
+        limiter = RequestLimiter(max_concurrent=1, max_queued=4, timeout=0.01)
+        async with limiter:
+            with pytest.raises(QueueFullError):
+                await limiter.acquire()
+        assert limiter.stats() == {"in_flight": 0, "waiting": 0, "max_concurrent": 1, "max_queued": 4}
+    asyncio.run(scenario())
+
+
+def test_releaser_releases_once():
+    async def scenario():
+        limiter = RequestLimiter(max_concurrent=1, max_queued=0, timeout=1)
+        await limiter.acquire()
+        release = limiter.releaser()
+        release()
+        release()  # e.g. on_close and the background task both fire
+        assert limiter.in_flight == 0
+        await limiter.acquire()
+        assert limiter.in_flight == 1
+    asyncio.run(scenario())
+
+
+def test_run_sync_runs_off_the_event_loop():
+    async def scenario():
+        return await run_sync(sum, [1, 2, 3])
+    assert asyncio.run(scenario()) == 6
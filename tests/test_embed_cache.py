@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from rag.embed_cache import CachedEmbedding, EmbeddingStore
+from rag.embed_batcher import batch_stats
+from rag.hash_embedding import HashEmbedding
+
+
+class CountingFactory:
+    """Builds a HashEmbedding and counts how often the cache had to build it."""
+
+    def __init__(self):
+        self.built = 0
+
+    def __call__(self):
+        self.built += 1
+        return HashEmbedding(dim=16)
+
+
+def test_cached_queries_never_build_the_model(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    first = CachedEmbedding(CountingFactory(), store=store, model_name="hash-16", embed_batch_size=8)
+    vector = first.get_query_embedding("tender thresholds")
+    assert first.built
+
+    # A new process (fresh LRU) over the same disk store
+    factory = CountingFactory()
+    second = CachedEmbedding(factory, store=EmbeddingStore(str(tmp_path)), model_name="hash-16", embed_batch_size=8)
+    assert np.allclose(second.get_query_embedding("tender thresholds"), vector)
+    assert factory.built == 0 and not second.built
+    assert batch_stats(second) == {}  # stats don't load the model either
+
+    second.get_query_embedding("something new")
+    assert factory.built == 1
+    assert second.stats()["hits"] == 1 and second.stats()["misses"] == 1
+
+
+def test_queries_and_texts_are_cached_separately():
+    cached = CachedEmbedding(HashEmbedding(dim=16))
+    assert cached.model_name == "hash-16"
+    cached.get_query_embedding("audit")
+    cached.get_text_embedding_batch(["audit"])
+    assert cached.stats()["misses"] == 2
+    cached.get_text_embedding_batch(["audit"])  # only the LRU for queries: texts need a store
+    assert cached.stats()["hits"] == 0
+
+
+def test_factory_needs_a_model_name():
+    with pytest.raises(ValueError):
+        CachedEmbedding(CountingFactory())
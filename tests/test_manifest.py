@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip("psycopg2")  # rag.manifest imports rag.db
+
+from rag.manifest import MANIFEST_TABLE, LocalManifest  # noqa: E402
+from rag.numpy_store import NumpyVectorStore  # noqa: E402
+from rag.settings import EMBED_DIM, EMBED_MODEL_ID, VECTOR_TABLE  # noqa: E402
+
+
+def test_manifest_table_follows_vector_table():
+    assert MANIFEST_TABLE == f"{VECTOR_TABLE}_manifest"
+
+
+def test_local_manifest_plans_new_unchanged_and_reembed(tmp_path):
+    doc = tmp_path / "policy.txt"
+    doc.write_text("Tenders above the threshold need two quotes.")
+    store = NumpyVectorStore(str(tmp_path / "store"), dim=EMBED_DIM)
+
+    manifest = LocalManifest(store)
+    assert manifest.embed_model == EMBED_MODEL_ID
+    plan = manifest.plan([str(doc)])
+    assert plan.new == [str(doc)]
+
+    manifest.replace_document(str(doc), plan.hashes[str(doc)], ["chunk-1"])
+    assert manifest.plan([str(doc)]).unchanged == [str(doc)]
+
+    # Another embedder: the stored vectors are stale even though the file is not
+    assert LocalManifest(store, embed_model="hash-384").plan([str(doc)]).changed == [str(doc)]
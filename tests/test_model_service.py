@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from rag.model_service import ServiceClient
+
+start_model_service = pytest.importorskip("scripts.serve", exc_type=ImportError).start_model_service
+
+
+def test_model_service_starts_and_embeds_locally(tmp_path):
+    socket_path = str(tmp_path / "model_service.sock")
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        MODEL_SERVICE_SOCKET=socket_path,
+        MODEL_SERVICE_AUTHKEY="",
+        EMBED_BACKEND="hash",
+        ANSWER_CACHE_ENABLED="false",
+        CACHE_DIR=str(tmp_path),
+    )
+    service = start_model_service(env, socket_path, timeout=60)
+    try:
+        client = ServiceClient(socket_path, size=1, timeout=10)
+        assert client.call("ping")["pid"] == service.pid
+        embedding = client.call("embed_query", "tender thresholds")
+        assert len(embedding) == len(client.call("embed_query", "another question"))
+    finally:
+        service.terminate()
+        service.wait(timeout=10)
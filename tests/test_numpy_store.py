@@ -0,0 +1,46 @@
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import MetadataFilter, MetadataFilters, VectorStoreQuery
+
+from rag.hash_embedding import HashEmbedding
+from rag.numpy_store import NumpyVectorStore
+
+EMBED = HashEmbedding(dim=64)
+TEXTS = {
+    "n1": ("Open tenders above the threshold need public advertisement.", "procurement"),
+    "n2": ("Annual leave accrues at two days per month of service.", "hr"),
+    "n3": ("Works contracts require a performance guarantee.", "procurement"),
+}
+
+
+def build(path, quantize="none"):
+    store = NumpyVectorStore(path, dim=64, quantize=quantize)
+    store.add([
+        TextNode(id_=node_id, text=text, metadata={"corpus": corpus}, embedding=EMBED.get_text_embedding(text))
+        for node_id, (text, corpus) in TEXTS.items()
+    ])
+    return store
+
+
+def search(store, question, k=1, filters=None):
+    query = VectorStoreQuery(query_embedding=EMBED.get_query_embedding(question), similarity_top_k=k, filters=filters)
+    return store.query(query).ids
+
+
+def test_query_filters_and_persistence(tmp_path):
+    store = build(str(tmp_path))
+    assert search(store, "how many days of annual leave") == ["n2"]
+    corpus = MetadataFilters(filters=[MetadataFilter(key="corpus", value="procurement")])
+    assert set(search(store, "annual leave", k=3, filters=corpus)) == {"n1", "n3"}
+
+    store.delete_nodes(["n2"])
+    store.persist()
+    reloaded = NumpyVectorStore(str(tmp_path), dim=64)
+    assert "n2" not in search(reloaded, "annual leave days", k=3)
+    assert reloaded.stats()["live_rows"] == 2
+
+
+def test_int8_quantized_store_ranks_like_float(tmp_path):
+    exact = build(str(tmp_path / "f32"))
+    quantized = build(str(tmp_path / "int8"), quantize="int8")
+    for question in ("performance guarantee for works", "public advertisement of tenders"):
+        assert search(quantized, question) == search(exact, question)
@@ -0,0 +1,30 @@
+from llama_index.core.llms import MockLLM
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+
+from rag.packing import ContextPacker
+from rag.pipeline import DirectPipeline
+
+
+class Reranker(BaseNodePostprocessor):
+    @classmethod
+    def class_name(cls) -> str:
+        return "Reranker"
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        return nodes
+
+
+def test_direct_pipeline_without_postprocessors():
+    pipeline = DirectPipeline(retriever=None, llm=MockLLM())
+    assert pipeline.node_postprocessors == []
+    assert not pipeline.reranks
+
+
+def test_direct_pipeline_packer_alone_does_not_rerank():
+    pipeline = DirectPipeline(retriever=None, node_postprocessors=[ContextPacker()], llm=MockLLM())
+    assert not pipeline.reranks
+
+
+def test_direct_pipeline_with_reranker():
+    pipeline = DirectPipeline(retriever=None, node_postprocessors=[Reranker(), ContextPacker()], llm=MockLLM())
+    assert pipeline.reranks
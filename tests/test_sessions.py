@@ -0,0 +1,40 @@
+import time
+
+from rag.sessions import SessionStore, is_follow_up, rewrite_question
+
+
+def test_follow_ups_are_detected():
+    assert is_follow_up("and for tenders above that amount?")
+    assert is_follow_up("what about Lahore?")
+    assert not is_follow_up("What is the procurement threshold for open tenders in Punjab?")
+
+
+def test_rewrite_carries_terms_from_the_topic():
+    history = ["What is the procurement threshold for open tenders in Punjab?"]
+    rewritten = rewrite_question("and for works contracts?", history)
+    assert rewritten.startswith("and for works contracts? (context: ")
+    assert "procurement" in rewritten and "threshold" in rewritten
+    # Standalone questions and first turns come back unchanged
+    assert rewrite_question(history[0], history) == history[0]
+    assert rewrite_question("and for works?", []) == "and for works?"
+
+
+def test_reuse_only_on_the_same_topic():
+    store = SessionStore(reuse_similarity=0.9)
+    session = store.get("chat-1")
+    assert store.reusable(session, [1.0, 0.0]) is None  # nothing recorded yet
+    store.record(session, "question", [1.0, 0.0], ["node-a", "node-b"])
+    assert store.reusable(session, [2.0, 0.1]) == ["node-a", "node-b"]
+    assert store.reusable(session, [0.0, 1.0]) is None
+    assert store.stats()["retrievals_reused"] == 1
+
+
+def test_sessions_are_bounded_and_expire():
+    store = SessionStore(max_sessions=2, ttl=60)
+    for name in ("a", "b", "c"):
+        store.get(name)
+    assert store.stats()["sessions"] == 2
+    store.get("b").touched = time.time() - 120
+    store.get("c")
+    assert store.stats()["evictions"] == 1
+    assert store.get("a").turns == 0  # "a" was evicted, so this is a fresh session
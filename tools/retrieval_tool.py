@@ -1,6 +1,7 @@
 from typing import Optional, List
 from pydantic import BaseModel, Field, ConfigDict, PrivateAttr
 from crewai.tools import BaseTool
+from rag.pipeline import format_sources
 
 # --- strict args passed from the agent
 class RetrievalInput(BaseModel):
@@ -22,30 +23,34 @@ class ContextualRetrievalTool(BaseTool):
     # mark runtime-only attributes as *private*
     _query_engine: any = PrivateAttr(default=None)
     _return_sources_cap: int = PrivateAttr(default=3)
+    _engine_factory: any = PrivateAttr(default=None)
+    _engines_by_depth: dict = PrivateAttr(default_factory=dict)
 
-    def set_query_engine(self, qe, return_sources_cap: int = 2):
+    def set_query_engine(self, qe, return_sources_cap: int = 2, engine_factory=None):
+        # engine_factory(top_k) builds an engine retrieving top_k candidates before re-ranking
         self._query_engine = qe
         self._return_sources_cap = return_sources_cap
+        self._engine_factory = engine_factory
+        self._engines_by_depth = {}
+
+    def _engine_for(self, top_k: int):
+        if self._engine_factory is None:
+            return self._query_engine
+        top_k = max(1, min(int(top_k), 50))
+        if top_k not in self._engines_by_depth:
+            self._engines_by_depth[top_k] = self._engine_factory(top_k)
+        return self._engines_by_depth[top_k]
 
     def _run(self, question: str, top_k: int = 3, return_sources: int = 2) -> str:
         if self._query_engine is None:
             return "Retrieval tool not initialized: no query engine set."
 
-        # You can pass top_k via as_query_engine when you create qe,
-        # or override here if your qe supports it. Simple path:
-        resp = self._query_engine.query(question)
+        resp = self._engine_for(top_k).query(question)
 
         lines = [f"Answer: {str(resp)}"]
         # add sources (bounded by both user request and safety cap)
         k = min(return_sources, self._return_sources_cap)
-        if getattr(resp, "source_nodes", None):
-            srcs = []
-            for i, sn in enumerate(resp.source_nodes[:k], 1):
-                meta = (sn.node.metadata or {})
-                name = meta.get("file_name") or meta.get("file_path") or "doc"
-                score = getattr(sn, "score", None)
-                snippet = (sn.node.get_content() or "")[:160].replace("\n", " ")
-                srcs.append(f"{i}. {name} | score={score} | “{snippet}…”")
-            if srcs:
-                lines.append("Sources:\n" + "\n".join(srcs))
-        return "\n".join(lines)
\ No newline at end of file
+        sources = format_sources(getattr(resp, "source_nodes", None), k)
+        if sources:
+            lines.append(sources)
+        return "\n".join(lines)